@@ -8,9 +8,19 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
+import time
 
-from django.core.asgi import get_asgi_application
+started = time.perf_counter()
+
+from django.core.asgi import get_asgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LastC.settings')
+# Route the read-heavy pages to their async views (see ASYNC_VIEWS in settings)
+os.environ.setdefault('LASTCHANCE_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+# Compile templates and load the URLconf before the first request (see WARM_UP_ON_STARTUP)
+from dashboard.warmup import on_startup  # noqa: E402
+
+on_startup(started)
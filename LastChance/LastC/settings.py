@@ -1,5 +1,6 @@
 """
-Django settings for LastC project.
+Django settings for LastC project, as used in development and tests. Deploy
+with LastC.settings_production, which builds on these.
 
 Generated by 'django-admin startproject' using Django 5.2.7.
 
@@ -13,6 +14,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # ----------------------------
 # Base Directory
 # ----------------------------
@@ -39,12 +42,17 @@ INSTALLED_APPS = [
     'accounts',
     'rides',
     'dashboard',
+    'payments',
 ]
 
 # ----------------------------
 # Middleware
 # ----------------------------
 MIDDLEWARE = [
+    # Answers static file requests before anything else runs, when SERVE_STATIC is on
+    'LastC.staticfiles.StaticFilesMiddleware',
+    # First of the rest, so its timings cover the other middleware too
+    'dashboard.profiling.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,7 +69,8 @@ ROOT_URLCONF = 'LastC.urls'
 # ----------------------------
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for the request profiler
+        'BACKEND': 'dashboard.profiling.ProfiledDjangoTemplates',
         'DIRS': [str(BASE_DIR / "templates")],  # MUST be string on Windows
         'APP_DIRS': True,
         'OPTIONS': {
@@ -87,9 +96,84 @@ DATABASES = {
     }
 }
 
+# ----------------------------
+# Cache
+# ----------------------------
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'lastchance-default',
+    }
+}
+
+# Sessions are written to the database and read from the cache
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Seconds a logged-in user stays cached; saves and balance updates invalidate it sooner.
+# Use a cache shared by all workers (USER_CACHE names it) when running more than one.
+USER_CACHE_TIMEOUT = 300
+# Whether a per-process LocMemCache may hold users: fine for runserver and tests, which are
+# one process; LastC.settings_production turns it off (accounts/backends.py)
+USER_CACHE_ALLOW_LOCAL = True
+
+# Seconds a rendered page of the staff dashboard's rider/customer tables may live;
+# balance changes and user saves invalidate them sooner (dashboard/fragments.py)
+STAFF_TABLE_CACHE_TIMEOUT = 300
+
+# Serve the read-heavy pages with their async views (rides/async_views.py,
+# dashboard/async_views.py). LastC/asgi.py turns this on; WSGI keeps the sync views.
+ASYNC_VIEWS = os.environ.get('LASTCHANCE_ASYNC_VIEWS') == '1'
+
+# Compile every template and load the URLconf and static manifest as the worker boots,
+# instead of in its first requests (dashboard/warmup.py). LastC.settings_production turns it on.
+WARM_UP_ON_STARTUP = os.environ.get('LASTCHANCE_WARM_UP') == '1'
+
+# Seconds a cached page of the rider "available rides" feed may live
+PENDING_FEED_CACHE_TIMEOUT = 60
+
+# Completed and cancelled rides untouched for this many days are moved to the
+# archive tables by `manage.py archive_rides` (rides/archive.py)
+RIDE_ARCHIVE_AFTER_DAYS = 90
+
+# Per-process request profiling (dashboard/profiling.py): the ring buffer of recent
+# requests, and how often one statement must repeat in a request to count as an N+1
+REQUEST_PROFILING = {
+    'BUFFER_SIZE': 500,
+    'REPEATED_QUERY_THRESHOLD': 5,
+    'MAX_REPEATED_PATTERNS': 200,
+}
+
+# Fare = BASE_FARE + PER_KM * distance, rounded to the peso, never below MINIMUM_FARE.
+# Distances come from rides/data/landmark_distances.csv (override with RIDE_DISTANCE_MATRIX).
+RIDE_TARIFF = {
+    'BASE_FARE': '40.00',
+    'PER_KM': '15.00',
+    'MINIMUM_FARE': '50.00',
+}
+
 # ----------------------------
 # Password Validation
 # ----------------------------
+# The first hasher makes new hashes and replaces older ones at their next login
+# (accounts/hashers.py); the rest only verify. argon2 needs `pip install argon2-cffi`.
+PASSWORD_HASHER_CHOICES = {
+    'pbkdf2': 'accounts.hashers.TunablePBKDF2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHER = os.environ.get('LASTCHANCE_PASSWORD_HASHER', 'pbkdf2')
+if PASSWORD_HASHER not in PASSWORD_HASHER_CHOICES:
+    raise ImproperlyConfigured(
+        f'LASTCHANCE_PASSWORD_HASHER is {PASSWORD_HASHER!r}; choose one of {", ".join(PASSWORD_HASHER_CHOICES)}.'
+    )
+PASSWORD_HASHERS = [
+    PASSWORD_HASHER_CHOICES[PASSWORD_HASHER],
+    *(path for name, path in PASSWORD_HASHER_CHOICES.items() if name != PASSWORD_HASHER),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+# PBKDF2 rounds; unset keeps Django's default. Fewer rounds log in faster but are cheaper to crack.
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('LASTCHANCE_PBKDF2_ITERATIONS', 0)) or None
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',},
@@ -112,7 +196,7 @@ STATICFILES_DIRS = [str(BASE_DIR / "static_my_project")]
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
-# AWS S3 Settings
+# Media uploads go to S3
 AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = os.environ.get('AWS_STORAGE_BUCKET_NAME')
@@ -122,16 +206,30 @@ AWS_DEFAULT_ACL = None
 AWS_S3_VERIFY = True
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
 
-STATIC_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/static/'
 MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/media/'
 
-STATICFILES_STORAGE = 'storages.backends.s3boto3.S3StaticStorage'
-DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+# Static files are built locally; LastC.settings_production hashes and compresses them
+# (LastC/staticfiles.py). Point LASTCHANCE_STATIC_URL elsewhere when STATIC_ROOT is
+# served by a web server, a CDN or a bucket it has been uploaded to.
+STATIC_URL = os.environ.get('LASTCHANCE_STATIC_URL', '/static/')
+STORAGES = {
+    'default': {'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Serve STATIC_ROOT from the app server (LastC.staticfiles.StaticFilesMiddleware)
+SERVE_STATIC = os.environ.get('LASTCHANCE_SERVE_STATIC') == '1'
 
 # ----------------------------
 # Auth
 # ----------------------------
 AUTH_USER_MODEL = 'accounts.CustomUser'
+# Logged-in users are read through the cache (accounts/backends.py); ModelBackend stays
+# listed so sessions from before it was added remain valid
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
 LOGIN_URL = 'signin'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'signin'
@@ -0,0 +1,79 @@
+"""
+Production settings: run with ``DJANGO_SETTINGS_MODULE=LastC.settings_production``.
+
+Everything not set here comes from LastC.settings. Debugging is off, the
+secret key and allowed hosts come from the environment, templates are
+compiled once per process and warmed as the worker boots
+(dashboard/warmup.py), and static files are served from content-hashed,
+pre-compressed copies recorded in a manifest (LastC/staticfiles.py), so
+``collectstatic`` must run before the server starts.
+
+Environment:
+    LASTCHANCE_SECRET_KEY      required
+    LASTCHANCE_ALLOWED_HOSTS   comma-separated host names
+    LASTCHANCE_REDIS_URL       cache shared by the workers, e.g. redis://127.0.0.1:6379/0
+    LASTCHANCE_STATIC_URL      where STATIC_ROOT is served from (default /static/)
+    LASTCHANCE_SERVE_STATIC    0 when something other than the app serves STATIC_ROOT
+    LASTCHANCE_WARM_UP         0 to skip the warm-up
+"""
+import copy
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import TEMPLATES
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('LASTCHANCE_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Set LASTCHANCE_SECRET_KEY to run with the production settings.')
+
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('LASTCHANCE_ALLOWED_HOSTS', '').split(',') if host.strip()]
+
+# ----------------------------
+# Cache
+# ----------------------------
+# Cached users and sessions, the ride feed and the dashboard tables are invalidated
+# in the cache of whichever worker made the change, so every worker has to share it.
+REDIS_URL = os.environ.get('LASTCHANCE_REDIS_URL')
+if REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}}
+else:
+    # Per-process caches only: read sessions and users from the database instead
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+USER_CACHE_ALLOW_LOCAL = False
+
+# ----------------------------
+# Templates
+# ----------------------------
+# The cached loader keeps each compiled template for the life of the process (Django
+# already wraps the default loaders in it; spelled out so it cannot be lost by adding a
+# loader). APP_DIRS has to go once loaders are listed.
+TEMPLATES = copy.deepcopy(TEMPLATES)
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+TEMPLATES[0]['OPTIONS']['context_processors'] = [
+    processor for processor in TEMPLATES[0]['OPTIONS']['context_processors']
+    if processor != 'django.template.context_processors.debug'
+]
+
+WARM_UP_ON_STARTUP = os.environ.get('LASTCHANCE_WARM_UP', '1') == '1'
+
+# ----------------------------
+# Static & Media
+# ----------------------------
+# collectstatic writes hashed, pre-compressed files and staticfiles.json; the warm-up
+# refuses to start without the manifest. Without the Brotli package only gzip copies are made.
+STORAGES = {
+    'default': {'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage'},
+    'staticfiles': {'BACKEND': 'LastC.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+
+SERVE_STATIC = os.environ.get('LASTCHANCE_SERVE_STATIC', '1') == '1'
@@ -0,0 +1,201 @@
+"""
+Static files: content-hashed, pre-compressed, and cacheable for a year.
+
+``CompressedManifestStaticFilesStorage`` is ManifestStaticFilesStorage with
+one extra step. Once ``collectstatic`` has written the hashed copy of each
+file, it also writes a gzip copy (``.gz``) next to every text asset, and a
+brotli copy (``.br``) when the ``brotli`` package is installed. The work
+happens once, at build time, at the highest compression level. A copy that
+saves less than ``MIN_SAVING`` of the size is not kept.
+
+A hashed name changes whenever the file's content changes, so it can be
+cached by browsers and CDNs for a year (``immutable``). Pages never
+revalidate bootstrap again; after a deploy they simply ask for new names.
+
+``StaticFilesMiddleware`` serves ``STATIC_ROOT`` from the app server when
+``SERVE_STATIC`` is on. It indexes the directory once when it loads, so a
+request does not touch the filesystem until the file is opened. It sends
+the smallest copy the client accepts and answers ``If-Modified-Since`` with
+a 304.
+
+STATIC_ROOT is a plain directory, so it can also be served by nginx
+(``gzip_static``) or uploaded to object storage; in those setups, point
+``LASTCHANCE_STATIC_URL`` at it and leave ``SERVE_STATIC`` off.
+"""
+import gzip
+import mimetypes
+import os
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml')
+
+# Smaller files gain less than the extra bytes of a response header
+MIN_SIZE = 512
+
+# Fraction of the size a compressed copy must save to be worth keeping
+MIN_SAVING = 0.05
+
+# Content-Encoding -> file suffix, preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+SUFFIXES = dict(ENCODINGS)
+
+# Hashed names never change content; anything else may change with the next deploy
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MUTABLE_CACHE_CONTROL = 'public, max-age=60'
+
+
+def _compressors():
+    compressors = {'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors['br'] = lambda data: brotli.compress(data, quality=11)
+    return compressors
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes .gz and .br copies of the hashed text assets"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if not dry_run:
+            for name in sorted(set(self.hashed_files.values())):
+                self.compress(name)
+
+    def compress(self, name):
+        """Write the compressed copies of ``name`` that are worth keeping; returns their names"""
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return []
+        written = []
+        data = None
+        for encoding, compress in _compressors().items():
+            target = name + SUFFIXES[encoding]
+            # Hashed names are content-addressed, so an existing copy is already current
+            if self.exists(target):
+                written.append(target)
+                continue
+            if data is None:
+                with self.open(name) as original:
+                    data = original.read()
+                if len(data) < MIN_SIZE:
+                    return []
+            compressed = compress(data)
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                self._save(target, ContentFile(compressed))
+                written.append(target)
+        return written
+
+
+StaticFile = namedtuple('StaticFile', ['path', 'size', 'mtime', 'content_type', 'immutable', 'encoded'])
+
+
+def index_static_root(root, hashed_names=()):
+    """StaticFile per URL path under ``root``; compressed copies are attached to their original"""
+    hashed_names = set(hashed_names)
+    files = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            files[name] = path
+    index = {}
+    for name, path in files.items():
+        base, suffix = os.path.splitext(name)
+        if suffix in SUFFIXES.values() and base in files:
+            continue
+        stat = os.stat(path)
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        encoded = {}
+        for encoding, encoded_suffix in ENCODINGS:
+            if name + encoded_suffix in files:
+                encoded_path = files[name + encoded_suffix]
+                encoded[encoding] = (encoded_path, os.path.getsize(encoded_path))
+        index[name] = StaticFile(path, stat.st_size, stat.st_mtime, content_type, name in hashed_names, encoded)
+    return index
+
+
+def accepted_encodings(header):
+    """Content codings an Accept-Encoding header allows, ignoring any with q=0"""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding.strip():
+            continue
+        quality = params.strip().removeprefix('q=')
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """Serves STATIC_ROOT under STATIC_URL when SERVE_STATIC is on; first in MIDDLEWARE"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVE_STATIC', False) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        url = urlsplit(settings.STATIC_URL)
+        if url.netloc:
+            # Served from somewhere else
+            raise MiddlewareNotUsed
+        self.prefix = '/' + url.path.strip('/') + '/'
+        storage = ManifestStaticFilesStorage(location=settings.STATIC_ROOT)
+        self.files = index_static_root(settings.STATIC_ROOT, storage.hashed_files.values())
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.serve(request)
+        return self.get_response(request) if response is None else response
+
+    async def __acall__(self, request):
+        response = self.serve(request)
+        return await self.get_response(request) if response is None else response
+
+    def serve(self, request):
+        """The response for a static file request, or None to pass the request on"""
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        static = self.files.get(request.path_info[len(self.prefix):])
+        if static is None:
+            return None
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), static.mtime):
+            response = HttpResponseNotModified()
+        else:
+            accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            encoding, path, size = next(
+                ((encoding, *static.encoded[encoding]) for encoding, _ in ENCODINGS
+                 if encoding in static.encoded and encoding in accepted),
+                (None, static.path, static.size),
+            )
+            response = FileResponse(open(path, 'rb'), content_type=static.content_type)
+            response.headers.pop('Content-Disposition', None)
+            response['Content-Length'] = size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(static.mtime)
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if static.immutable else MUTABLE_CACHE_CONTROL
+        if static.encoded:
+            response['Vary'] = 'Accept-Encoding'
+        return response
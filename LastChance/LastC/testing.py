@@ -0,0 +1,41 @@
+"""Test helpers shared by the apps' test suites"""
+import re
+
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory
+
+
+class QueryPlanMixin:
+    """Assertions over EXPLAIN output for querysets used by the views"""
+    # A bare "SCAN <table>" on SQLite or a "Seq Scan" on PostgreSQL reads the whole table
+    FULL_SCAN_PATTERNS = [re.compile(r'\bSCAN \w+\s*$', re.MULTILINE), re.compile(r'\bSeq Scan on\b')]
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == 'postgresql':
+            # Tiny test tables make sequential scans cheapest; check that an index is usable
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def make_view(self, view_class, user, data=None, **kwargs):
+        request = RequestFactory().get('/', data or {})
+        request.user = user
+        view = view_class()
+        view.setup(request, **kwargs)
+        return view
+
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        for pattern in self.FULL_SCAN_PATTERNS:
+            self.assertIsNone(pattern.search(plan), f'Full table scan in plan for:\n{queryset.query}\n{plan}')
+
+
+class AsyncViewMixin:
+    async def call(self, view, user, data=None, **kwargs):
+        request = AsyncRequestFactory().get('/', data or {})
+
+        async def auser():
+            return user
+
+        request.user, request.auser = user, auser
+        return await view(request, **kwargs)
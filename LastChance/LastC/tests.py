@@ -0,0 +1,91 @@
+import gzip
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from . import staticfiles
+
+
+class CompressedStaticFilesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = Path(tempfile.mkdtemp())
+        cls.addClassCleanup(shutil.rmtree, cls.static_root)
+        storages = dict(settings.STORAGES, staticfiles={
+            'BACKEND': 'LastC.staticfiles.CompressedManifestStaticFilesStorage',
+        })
+        cls.enterClassContext(override_settings(STATIC_ROOT=str(cls.static_root), STORAGES=storages))
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def get(self, url, **headers):
+        with override_settings(SERVE_STATIC=True):
+            return self.client.get(url, headers=headers)
+
+    def test_collectstatic_writes_compressed_copies(self):
+        url = static('css/bootstrap.min.css')
+        hashed = self.static_root / url.removeprefix(settings.STATIC_URL)
+        self.assertNotEqual(hashed.name, 'bootstrap.min.css')
+        compressed = hashed.with_name(hashed.name + '.gz')
+        self.assertEqual(gzip.decompress(compressed.read_bytes()), hashed.read_bytes())
+        self.assertLess(compressed.stat().st_size, hashed.stat().st_size / 4)
+        if staticfiles.brotli is not None:
+            brotli_copy = hashed.with_name(hashed.name + '.br')
+            self.assertEqual(staticfiles.brotli.decompress(brotli_copy.read_bytes()), hashed.read_bytes())
+        # Only the minified bootstrap variants are shipped
+        self.assertFalse((self.static_root / 'css' / 'bootstrap.css').exists())
+        self.assertFalse((self.static_root / 'js' / 'bootstrap.js').exists())
+
+    def test_pages_link_the_hashed_files(self):
+        response = self.client.get(reverse('signin'))
+        self.assertContains(response, static('css/bootstrap.min.css'))
+        self.assertContains(response, static('js/bootstrap.bundle.min.js'))
+
+    def test_serves_the_smallest_accepted_copy(self):
+        url = static('js/bootstrap.bundle.min.js')
+        hashed = self.static_root / url.removeprefix(settings.STATIC_URL)
+
+        response = self.get(url, accept_encoding='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), hashed.read_bytes())
+        self.assertEqual(response['Cache-Control'], staticfiles.IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Content-Type'], 'text/javascript')
+
+        if staticfiles.brotli is not None:
+            self.assertEqual(self.get(url, accept_encoding='gzip, br')['Content-Encoding'], 'br')
+
+        response = self.get(url, accept_encoding='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(int(response['Content-Length']), hashed.stat().st_size)
+
+    def test_conditional_and_unhashed_requests(self):
+        url = static('css/bootstrap.min.css')
+        hashed = self.static_root / url.removeprefix(settings.STATIC_URL)
+        response = self.get(url, if_modified_since=http_date(hashed.stat().st_mtime))
+        self.assertEqual(response.status_code, 304)
+
+        response = self.get(settings.STATIC_URL + 'css/bootstrap.min.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], staticfiles.MUTABLE_CACHE_CONTROL)
+
+    def test_only_serves_when_enabled(self):
+        # The middleware reads SERVE_STATIC once, when the client first loads it
+        with override_settings(SERVE_STATIC=False):
+            self.assertEqual(Client().get(static('css/bootstrap.min.css')).status_code, 404)
+        self.assertEqual(self.get(settings.STATIC_URL + 'css/missing.css').status_code, 404)
+
+
+class AcceptEncodingTests(unittest.TestCase):
+    def test_parsing(self):
+        self.assertEqual(staticfiles.accepted_encodings('gzip, deflate, br;q=1.0'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(staticfiles.accepted_encodings('br;q=0, GZIP;q=0.5'), {'gzip'})
+        self.assertEqual(staticfiles.accepted_encodings(''), set())
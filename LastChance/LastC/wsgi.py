@@ -8,9 +8,17 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
 import os
+import time
 
-from django.core.wsgi import get_wsgi_application
+started = time.perf_counter()
+
+from django.core.wsgi import get_wsgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LastC.settings')
 
 application = get_wsgi_application()
+
+# Compile templates and load the URLconf before the first request (see WARM_UP_ON_STARTUP)
+from dashboard.warmup import on_startup  # noqa: E402
+
+on_startup(started)
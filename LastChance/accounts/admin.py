@@ -1,6 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
 from .models import CustomUser
+from payments.services import record_opening_balance
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'middle_name', 'last_name', 'user_role', 'balance', 'is_active')
@@ -39,6 +40,22 @@ class CustomUserAdmin(UserAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            record_opening_balance(obj, note=f'Set by {request.user.username} in admin')
+
+    def get_deleted_objects(self, objs, request):
+        deleted, model_count, perms_needed, protected = super().get_deleted_objects(objs, request)
+        if protected:
+            self.message_user(
+                request,
+                'Users with balance ledger entries cannot be deleted, so their money history is kept. '
+                'Untick "Active" to close the account instead.',
+                messages.WARNING,
+            )
+        return deleted, model_count, perms_needed, protected
+
     def get_readonly_fields(self, request, obj=None):
         if obj:  # Editing an existing object
             return ('user_role', 'balance') + self.readonly_fields
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from .backends import invalidate_on_change
+        from .models import CustomUser
+        post_save.connect(invalidate_on_change, sender=CustomUser, dispatch_uid='accounts-user-cache-save')
+        post_delete.connect(invalidate_on_change, sender=CustomUser, dispatch_uid='accounts-user-cache-delete')
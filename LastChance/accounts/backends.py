@@ -0,0 +1,98 @@
+"""
+Authentication backend that serves the logged-in user from the cache.
+
+``AuthenticationMiddleware`` loads ``request.user`` on every request, and
+almost every view then branches on ``user_role``, ``is_staff`` or reads
+``balance``. ``CachedModelBackend`` keeps each user it loads in the cache
+for ``USER_CACHE_TIMEOUT`` seconds, so together with the ``cached_db``
+session engine a logged-in request reaches its view without a query.
+
+The cached copy is dropped explicitly rather than left to expire:
+``invalidate_cached_users()`` deletes it at once and again when the
+current transaction commits. It is called from the CustomUser save and
+delete signals (profile edits, role and ``is_active`` changes, password
+changes, last_login) and after every queryset ``update()`` of a balance in
+``payments``. Anything else that updates users in bulk must call it too.
+``ModelBackend`` stays listed after it only so sessions from before it was
+added remain valid. A failed password check here raises ``PermissionDenied``,
+which ends ``authenticate()``, so a wrong password costs one hash, not two.
+
+Like the pending-ride feed, the cache (``USER_CACHE``) has to be shared
+between worker processes for an invalidation in one to reach the others.
+A per-process ``LocMemCache`` would let other workers serve a deactivated
+user, or a stale password hash that keeps old sessions valid, for up to
+``USER_CACHE_TIMEOUT``. It is therefore only used when
+``USER_CACHE_ALLOW_LOCAL`` says there is a single process (runserver,
+tests); otherwise users are read from the database as ModelBackend does.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+
+
+def _cache():
+    """The user cache, or None when it is local to this process and that is not allowed"""
+    cache = caches[getattr(settings, 'USER_CACHE', 'default')]
+    if isinstance(cache, LocMemCache) and not getattr(settings, 'USER_CACHE_ALLOW_LOCAL', False):
+        return None
+    return cache
+
+
+def _timeout():
+    return getattr(settings, 'USER_CACHE_TIMEOUT', 300)
+
+
+def user_cache_key(user_id):
+    return f'accounts:user:{user_id}'
+
+
+def invalidate_cached_users(*user_ids):
+    """Drop the users' cached copies now and again once the current transaction commits"""
+    keys = [user_cache_key(user_id) for user_id in user_ids]
+    cache = _cache()
+    if keys and cache is not None:
+        # The second delete catches a copy another request cached from the old row meanwhile
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_on_change(sender, instance, **kwargs):
+    """post_save/post_delete receiver for the user model"""
+    invalidate_cached_users(instance.pk)
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose get_user() reads through the cache"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None and password is not None:
+            # ModelBackend, listed after this one for older sessions, would hash the same password again
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        cache, key = _cache(), user_cache_key(user_id)
+        if cache is None:
+            return super().get_user(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            # Unknown and inactive users are not cached, so they never outlive a change
+            if user is not None:
+                cache.set(key, user, _timeout())
+        return user
+
+    async def aget_user(self, user_id):
+        cache, key = _cache(), user_cache_key(user_id)
+        if cache is None:
+            return await super().aget_user(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await cache.aset(key, user, _timeout())
+        return user
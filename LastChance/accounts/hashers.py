@@ -0,0 +1,22 @@
+"""
+Password hashers whose cost comes from settings.
+
+Django upgrades a stored hash whenever a login verifies it and the hasher
+reports ``must_update()``: when it was made by a hasher other than the
+first in ``PASSWORD_HASHERS``, or by PBKDF2 with a different iteration
+count. Changing ``LASTCHANCE_PASSWORD_HASHER`` or
+``LASTCHANCE_PBKDF2_ITERATIONS`` therefore moves every account to the new
+setting the next time it signs in, with no migration. Every choice stays
+in ``PASSWORD_HASHERS``, so hashes made under an earlier setting keep
+verifying until then.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with ``PASSWORD_PBKDF2_ITERATIONS`` rounds, or Django's default"""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
@@ -0,0 +1,102 @@
+import statistics
+import time
+from collections import namedtuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from accounts.models import CustomUser
+
+Case = namedtuple('Case', 'name url_name role')
+Timing = namedtuple('Timing', 'p50 queries status')
+
+# Views that branch on request.user's role, staff flag or balance
+CASES = (
+    Case('ride list (customer)', 'ride-list', 'CUSTOMER'),
+    Case('ride list (rider)', 'ride-list', 'RIDER'),
+    Case('ride list (staff)', 'ride-list', 'STAFF'),
+    Case('book ride form', 'create-ride', 'CUSTOMER'),
+    Case('customer history', 'customer-history', 'CUSTOMER'),
+    Case('customer dashboard', 'customer-dashboard', 'CUSTOMER'),
+    Case('rider dashboard', 'rider-dashboard', 'RIDER'),
+    Case('rider history', 'rider-history', 'RIDER'),
+)
+
+# How each side loads the session and the user
+MODES = {
+    'database': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+    },
+    'cached': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTHENTICATION_BACKENDS': ['accounts.backends.CachedModelBackend'],
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare queries and latency per request on the role-dispatch views with the session and user read from '
+        'the database against the cached session engine and CachedModelBackend. Needs a rider, a customer and a '
+        'staff user in the database (generate_rides makes them).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50, help='Timed requests per view and mode.')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per view and mode.')
+        parser.add_argument('--host', default='localhost', help='Host header to send; must be in ALLOWED_HOSTS.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or options['warmup'] < 0:
+            raise CommandError('--repeat must be positive.')
+        users = {
+            'CUSTOMER': CustomUser.objects.filter(user_role='CUSTOMER', is_active=True).order_by('pk').first(),
+            'RIDER': CustomUser.objects.filter(user_role='RIDER', is_active=True).order_by('pk').first(),
+            'STAFF': CustomUser.objects.filter(is_staff=True, is_active=True).order_by('pk').first(),
+        }
+        missing = [role.lower() for role, user in users.items() if user is None]
+        if missing:
+            raise CommandError(f'No active {" or ".join(missing)} user to send requests as.')
+
+        results = {}
+        for mode, overrides in MODES.items():
+            with override_settings(**overrides):
+                # A client per user and mode: the middleware picks up the session engine when first used
+                clients = {}
+                for role, user in users.items():
+                    clients[role] = Client(SERVER_NAME=options['host'])
+                    clients[role].force_login(user)
+                for case in CASES:
+                    results[case, mode] = self._time(clients[case.role], reverse(case.url_name), options)
+
+        self.stdout.write(
+            f'{"view":<24}{"status":>7}{"db queries":>12}{"cached":>8}{"saved":>7}{"db p50 ms":>11}{"cached":>8}'
+        )
+        saved = []
+        for case in CASES:
+            database, cached = results[case, 'database'], results[case, 'cached']
+            saved.append(database.queries - cached.queries)
+            self.stdout.write(
+                f'{case.name:<24}{cached.status:>7}{database.queries:>12}{cached.queries:>8}{saved[-1]:>7}'
+                f'{database.p50 * 1000:>11.2f}{cached.p50 * 1000:>8.2f}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{statistics.fmean(saved):.1f} queries saved per request on average over {len(CASES)} views.'
+        ))
+
+    def _time(self, client, url, options):
+        timings, queries, status = [], 0, None
+        for i in range(options['warmup'] + options['repeat']):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(url)
+                took = time.perf_counter() - start
+            if i >= options['warmup']:
+                timings.append(took)
+                queries, status = len(captured), response.status_code
+        return Timing(statistics.median(timings), queries, status)
+
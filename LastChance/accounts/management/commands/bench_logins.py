@@ -0,0 +1,90 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from accounts.models import CustomUser
+
+PASSWORD = 'bench-login-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Time sign-ins through the signin view on one core, for each password hasher given, and compare each '
+        'with the cost of one hash to show how many hashes a login computes. The benchmark user is created in '
+        'a transaction that is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hasher', action='append', choices=sorted(settings.PASSWORD_HASHER_CHOICES),
+            help=f'Hasher to time; repeatable. Defaults to PASSWORD_HASHER ({settings.PASSWORD_HASHER}).',
+        )
+        parser.add_argument(
+            '--iterations', type=int, action='append',
+            help='PBKDF2 rounds to time pbkdf2 with; repeatable. Defaults to PASSWORD_PBKDF2_ITERATIONS.',
+        )
+        parser.add_argument('--logins', type=int, default=20, help='Timed sign-ins per configuration.')
+        parser.add_argument('--host', default='localhost', help='Host header to send; must be in ALLOWED_HOSTS.')
+
+    def handle(self, *args, **options):
+        if options['logins'] < 1 or any(n < 1 for n in options['iterations'] or ()):
+            raise CommandError('--logins and --iterations must be positive.')
+        configurations = []
+        for name in options['hasher'] or [settings.PASSWORD_HASHER]:
+            if name == 'pbkdf2':
+                for iterations in options['iterations'] or [settings.PASSWORD_PBKDF2_ITERATIONS]:
+                    configurations.append((name, iterations))
+            else:
+                configurations.append((name, None))
+
+        self.stdout.write(f'{"hasher":<18}{"hash ms":>10}{"login ms":>10}{"hashes/login":>14}{"logins/s/core":>15}')
+        for name, iterations in configurations:
+            first = settings.PASSWORD_HASHER_CHOICES[name]
+            hashers = [first, *(path for path in settings.PASSWORD_HASHERS if path != first)]
+            with override_settings(PASSWORD_HASHERS=hashers, PASSWORD_PBKDF2_ITERATIONS=iterations):
+                try:
+                    hash_time, login_time = self._time(options)
+                except (ImportError, ValueError) as e:
+                    # Argon2PasswordHasher raises ValueError when argon2-cffi is missing
+                    self.stdout.write(f'{name:<18}  skipped: {e}')
+                    continue
+            label = f'{name} ({iterations or "default"})' if name == 'pbkdf2' else name
+            self.stdout.write(
+                f'{label:<18}{hash_time * 1000:>10.1f}{login_time * 1000:>10.1f}'
+                f'{login_time / hash_time:>14.2f}{1 / login_time:>15.1f}'
+            )
+
+    def _time(self, options):
+        """Median seconds for one password check and for one sign-in"""
+        encoded = make_password(PASSWORD)
+        hash_times = []
+        for _ in range(5):
+            start = time.perf_counter()
+            check_password(PASSWORD, encoded)
+            hash_times.append(time.perf_counter() - start)
+
+        with transaction.atomic():
+            CustomUser.objects.create(
+                username='bench-login', user_role='RIDER', first_name='Bench', last_name='Login', password=encoded,
+            )
+            client = Client(SERVER_NAME=options['host'])
+            url = reverse('signin')
+            login_times = []
+            for i in range(options['logins'] + 1):
+                start = time.perf_counter()
+                response = client.post(url, {'username': 'bench-login', 'password': PASSWORD})
+                took = time.perf_counter() - start
+                if response.status_code != 302:
+                    raise CommandError(f'Sign-in answered {response.status_code} rather than redirecting.')
+                # The first sign-in may rehash the password, which is not what is being timed
+                if i:
+                    login_times.append(took)
+            transaction.set_rollback(True)
+        return statistics.median(hash_times), statistics.median(login_times)
@@ -18,6 +18,10 @@ class CustomUser(AbstractUser):
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
+        indexes = [
+            models.Index(fields=['user_role', '-date_joined'], name='user_role_joined_idx'),
+            models.Index(fields=['-date_joined'], name='user_joined_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -1,3 +1,162 @@
-from django.test import TestCase
+import runpy
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import ProtectedError
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from payments.services import top_up
+from .backends import CachedModelBackend, user_cache_key
+from .hashers import TunablePBKDF2PasswordHasher
+from .models import CustomUser
+
+
+class CachedUserTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user(
+            'customer', password='secret', user_role='CUSTOMER', first_name='Cara', last_name='Test',
+        )
+        cls.rider = CustomUser.objects.create_user(
+            'rider', password='secret', user_role='RIDER', first_name='Rico', last_name='Test',
+        )
+        cls.staff = CustomUser.objects.create_user(
+            'staff', password='secret', user_role='STAFF', is_staff=True, first_name='Sam', last_name='Test',
+        )
+
+    def test_logged_in_request_reads_neither_session_nor_user(self):
+        self.client.force_login(self.customer)
+        self.client.get(reverse('customer-dashboard'))
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('customer-dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'], self.customer)
+        tables = ' '.join(query['sql'] for query in captured)
+        self.assertNotIn('django_session', tables)
+        self.assertNotIn('accounts_customuser', tables)
+
+    def test_balance_and_role_changes_invalidate(self):
+        backend = CachedModelBackend()
+        self.assertEqual(backend.get_user(self.customer.pk).balance, Decimal('0.00'))
+
+        top_up(self.customer, Decimal('50.00'))
+        self.assertEqual(backend.get_user(self.customer.pk).balance, Decimal('50.00'))
+
+        self.customer.user_role = 'RIDER'
+        self.customer.save()
+        self.assertEqual(backend.get_user(self.customer.pk).user_role, 'RIDER')
+
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertIsNone(backend.get_user(self.customer.pk))
+
+    def test_deactivated_user_is_logged_out(self):
+        self.client.force_login(self.rider)
+        self.assertEqual(self.client.get(reverse('rider-dashboard')).status_code, 200)
+        self.rider.is_active = False
+        self.rider.save(update_fields=['is_active'])
+        self.assertEqual(self.client.get(reverse('rider-dashboard')).status_code, 302)
+
+    @override_settings(USER_CACHE_ALLOW_LOCAL=False)
+    def test_process_local_cache_is_not_trusted(self):
+        backend = CachedModelBackend()
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertEqual(backend.get_user(self.rider.pk), self.rider)
+        self.assertIsNone(cache.get(user_cache_key(self.rider.pk)))
+
+    def test_bench_auth_command(self):
+        out = StringIO()
+        call_command('bench_auth', '--repeat', '2', '--warmup', '1', '--host', 'testserver', stdout=out)
+        self.assertIn('queries saved per request', out.getvalue())
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+class SigninTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = CustomUser.objects.create_user(
+            'rider', password='secret', user_role='RIDER', first_name='Rico', last_name='Test',
+        )
+
+    def sign_in(self, password='secret'):
+        return self.client.post(reverse('signin'), {'username': 'rider', 'password': password})
+
+    def test_signin_hashes_the_password_once(self):
+        verify = TunablePBKDF2PasswordHasher.verify
+        with mock.patch.object(TunablePBKDF2PasswordHasher, 'verify', autospec=True, side_effect=verify) as spy:
+            response = self.sign_in()
+        self.assertRedirects(response, reverse('customer-dashboard'), fetch_redirect_response=False)
+        self.assertEqual(spy.call_count, 1)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.rider.pk)
+
+    def test_wrong_password(self):
+        response = self.sign_in('wrong')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_failed_logins_hash_once(self):
+        # verify() hashes through encode(), and an unknown username hashes a dummy password
+        encode = TunablePBKDF2PasswordHasher.encode
+        with mock.patch.object(TunablePBKDF2PasswordHasher, 'encode', autospec=True, side_effect=encode) as spy:
+            for username in ('rider', 'nobody'):
+                with self.subTest(username=username):
+                    spy.reset_mock()
+                    self.assertIsNone(authenticate(username=username, password='wrong'))
+                    self.assertEqual(spy.call_count, 1)
+
+    def test_login_rehashes_with_the_current_settings(self):
+        self.assertTrue(self.rider.password.startswith('pbkdf2_sha256$1000$'))
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.sign_in()
+        self.rider.refresh_from_db()
+        self.assertTrue(self.rider.password.startswith('pbkdf2_sha256$2000$'))
+
+        scrypt_first = [
+            'django.contrib.auth.hashers.ScryptPasswordHasher', 'accounts.hashers.TunablePBKDF2PasswordHasher',
+        ]
+        with override_settings(PASSWORD_HASHERS=scrypt_first):
+            self.sign_in()
+        self.rider.refresh_from_db()
+        self.assertTrue(self.rider.password.startswith('scrypt$'))
+        # The old hasher still verifies it after switching back
+        self.assertRedirects(self.sign_in(), reverse('customer-dashboard'), fetch_redirect_response=False)
+
+    def test_unknown_hasher_setting(self):
+        path = settings.BASE_DIR / 'LastC' / 'settings.py'
+        with mock.patch.dict('os.environ', LASTCHANCE_PASSWORD_HASHER='scrypt'):
+            hashers = runpy.run_path(str(path))['PASSWORD_HASHERS']
+        self.assertEqual(hashers[0], 'django.contrib.auth.hashers.ScryptPasswordHasher')
+        with mock.patch.dict('os.environ', LASTCHANCE_PASSWORD_HASHER='md5'):
+            with self.assertRaisesMessage(ImproperlyConfigured, "is 'md5'; choose one of pbkdf2, scrypt, argon2."):
+                runpy.run_path(str(path))
+
+    def test_bench_logins_command(self):
+        out = StringIO()
+        call_command('bench_logins', '--iterations', '1000', '--logins', '2', '--host', 'testserver', stdout=out)
+        self.assertIn('pbkdf2 (1000)', out.getvalue())
+        self.assertFalse(CustomUser.objects.filter(username='bench-login').exists())
+
+
+class UserDeletionTests(TestCase):
+    def test_users_with_ledger_entries_are_kept(self):
+        admin = CustomUser.objects.create_superuser('admin', password='pass', user_role='STAFF')
+        customer = CustomUser.objects.create_user('customer', password='pass', user_role='CUSTOMER')
+        top_up(customer, Decimal('10.00'))
+        with self.assertRaises(ProtectedError):
+            customer.delete()
+
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:accounts_customuser_delete', args=[customer.pk]))
+        self.assertContains(response, 'Untick &quot;Active&quot; to close the account instead.')
+        self.client.post(reverse('admin:accounts_customuser_delete', args=[customer.pk]), {'post': 'yes'})
+        self.assertTrue(CustomUser.objects.filter(pk=customer.pk).exists())
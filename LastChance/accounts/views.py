@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, logout, authenticate
+from django.contrib.auth import login, logout
 from django.contrib import messages
 from accounts.models import CustomUser
 from accounts.forms import CustomUserCreationForm, CustomAuthenticationForm  # your forms
@@ -35,22 +35,17 @@ def signup_view(request):
 def signin_view(request):
     if request.method == 'POST':
         form = CustomAuthenticationForm(request, data=request.POST)
+        # is_valid() has already authenticated the user; authenticating again would hash the password twice
         if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(username=username, password=password)
-
-            if user is not None:
-                login(request, user)
-                messages.success(request, f'Welcome back, {user.get_full_name()}!')
+            user = form.get_user()
+            login(request, user)
+            messages.success(request, f'Welcome back, {user.get_full_name()}!')
 
-                # Redirect based on role
-                if user.is_staff:
-                    return redirect('staff-dashboard')
-                else:
-                    return redirect('customer-dashboard')
+            # Redirect based on role
+            if user.is_staff:
+                return redirect('staff-dashboard')
             else:
-                messages.error(request, 'Invalid username or password.')
+                return redirect('customer-dashboard')
         else:
             messages.error(request, 'Invalid username or password.')
     else:
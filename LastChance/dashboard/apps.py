@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class DashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dashboard'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+        from accounts.models import CustomUser
+        from payments.signals import balances_changed
+        from . import fragments, profiling
+        connection_created.connect(profiling.install_query_hook, dispatch_uid='dashboard-request-profiling')
+        post_save.connect(fragments.invalidate_on_user_save, sender=CustomUser, dispatch_uid='dashboard-user-tables-save')
+        post_delete.connect(
+            fragments.invalidate_on_user_save, sender=CustomUser, dispatch_uid='dashboard-user-tables-delete',
+        )
+        balances_changed.connect(fragments.invalidate_on_balance_change, dispatch_uid='dashboard-user-tables-balances')
@@ -0,0 +1,46 @@
+"""
+Async version of the staff dashboard, routed instead of StaffDashboardView
+when ``settings.ASYNC_VIEWS`` is on (the default under ``LastC.asgi``).
+"""
+import asyncio
+
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.shortcuts import render
+
+from rides.async_views import alist, resolve_user
+from rides.feed import feed_cache_stats
+from rides.pagination import InvalidCursor
+from . import fragments
+from .stats import aget_dashboard_stats
+from .views import StaffDashboardView, recent_events
+
+
+@login_required
+async def staff_dashboard(request):
+    user = await resolve_user(request)
+    if not user.is_staff:
+        raise PermissionDenied
+
+    # The statistics and the three tables do not depend on each other
+    tables = fragments.TABLES
+    try:
+        stats, riders_table, customers_table, events = await asyncio.gather(
+            aget_dashboard_stats(),
+            fragments.arender_table(tables['riders'], request.GET.get('riders_cursor')),
+            fragments.arender_table(tables['customers'], request.GET.get('customers_cursor')),
+            alist(recent_events()),
+        )
+    except InvalidCursor as e:
+        raise Http404(str(e))
+
+    context = stats.as_context()
+    context.update({
+        'active_tab': fragments.active_table(request),
+        'riders_table': riders_table,
+        'customers_table': customers_table,
+        'pending_feed_stats': feed_cache_stats(),
+        'recent_events': events,
+    })
+    return render(request, StaffDashboardView.template_name, context)
@@ -0,0 +1,211 @@
+"""
+CSV downloads of the staff ride, event and user lists.
+
+Each export view reuses its list view's ``get_queryset()``, so it honours
+the same ``status``/``role`` filters, and streams the whole result rather
+than one page. Rows are read as ``values_list()`` tuples through
+``iterator()`` (server-side cursors on PostgreSQL) and written out a chunk
+at a time, so memory use does not depend on the number of rows and the
+header goes out before the query runs.
+
+Under ASGI (``settings.ASYNC_VIEWS``) the response iterates asynchronously,
+fetching each chunk on the ORM's thread: Django buffers a synchronous
+iterator in full before serving it asynchronously, which would defeat the
+point.
+
+Text cells that a spreadsheet would read as a formula (starting with ``=``,
+``+``, ``-``, ``@``, a tab or a carriage return) get a leading ``'``, so a
+user's name or an event description cannot run in the reader's spreadsheet.
+"""
+import csv
+import io
+from collections import namedtuple
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from rides.models import Ride, RideEvent
+from .views import StaffEventListView, StaffRideListView, StaffUserListView
+
+Column = namedtuple('Column', ['header', 'lookups', 'render'])
+
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def value(header, lookup, render=None):
+    return Column(header, (lookup,), render)
+
+
+def choice(header, lookup, choices):
+    labels = dict(choices)
+    return Column(header, (lookup,), lambda code: labels.get(code, code))
+
+
+def timestamp(header, lookup):
+    return Column(header, (lookup,), lambda moment: timezone.localtime(moment).strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def person(header, prefix):
+    """A user's full name, as get_full_name() would give it, from the joined columns"""
+    lookups = tuple(f'{prefix}{name}' for name in ('first_name', 'middle_name', 'last_name'))
+    return Column(header, lookups, lambda *parts: ' '.join(part for part in parts if part))
+
+
+def defuse(cell):
+    """``cell`` with a leading ' if it is text a spreadsheet would evaluate"""
+    if isinstance(cell, str) and cell.startswith(FORMULA_PREFIXES):
+        return "'" + cell
+    return cell
+
+
+class CsvChunks:
+    """Renders rows as CSV text, handed out ``chunk_size`` rows at a time"""
+
+    def __init__(self, columns, chunk_size):
+        self.chunk_size = chunk_size
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = 0
+        self.spans = []
+        start = 0
+        for column in columns:
+            self.spans.append((start, start + len(column.lookups), column.render))
+            start += len(column.lookups)
+        self.writer.writerow([column.header for column in columns])
+
+    def cells(self, row):
+        """Map a values_list() tuple onto the CSV cells"""
+        cells = []
+        for begin, end, render in self.spans:
+            if render is None:
+                cells.append(row[begin])
+            elif end - begin == 1:
+                cells.append(None if row[begin] is None else render(row[begin]))
+            else:
+                cells.append(render(*row[begin:end]))
+        return [defuse(cell) for cell in cells]
+
+    def take(self):
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.pending = 0
+        return text
+
+    def add(self, row):
+        """Buffer a row; returns a chunk of text once ``chunk_size`` rows are waiting"""
+        self.writer.writerow(self.cells(row))
+        self.pending += 1
+        if self.pending >= self.chunk_size:
+            return self.take()
+        return None
+
+
+async def aiterate(queryset, chunk_size):
+    """
+    ``queryset.iterator()`` consumed a chunk at a time off the event loop.
+    ``aiterator()`` would do, but it evaluates values_list() querysets in the
+    calling (async) context.
+    """
+    rows = await sync_to_async(lambda: iter(queryset.iterator(chunk_size=chunk_size)))()
+    take = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while chunk := await take():
+        for row in chunk:
+            yield row
+
+
+class CsvExportMixin:
+    """
+    Stream the view's ``get_queryset()`` as CSV. Subclasses list
+    ``export_columns`` and a ``filename``, which may contain ``{date}``.
+    """
+    export_columns = ()
+    filename = 'export.csv'
+    chunk_size = 2000
+
+    def get(self, request, *args, **kwargs):
+        lookups = [lookup for column in self.export_columns for lookup in column.lookups]
+        rows = self.get_queryset().values_list(*lookups)
+        if settings.ASYNC_VIEWS:
+            content = self.arender(aiterate(rows, self.chunk_size))
+        else:
+            content = self.render(rows.iterator(chunk_size=self.chunk_size))
+        response = StreamingHttpResponse(content, content_type='text/csv; charset=utf-8')
+        filename = self.filename.format(date=timezone.localtime().strftime('%Y%m%d-%H%M'))
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Cache-Control'] = 'no-store'
+        response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the download
+        return response
+
+    def render(self, rows):
+        chunks = CsvChunks(self.export_columns, self.chunk_size)
+        # The header goes out before the query runs, so the download starts at once
+        yield chunks.take()
+        for row in rows:
+            chunk = chunks.add(row)
+            if chunk:
+                yield chunk
+        if chunks.pending:
+            yield chunks.take()
+
+    async def arender(self, rows):
+        chunks = CsvChunks(self.export_columns, self.chunk_size)
+        yield chunks.take()
+        async for row in rows:
+            chunk = chunks.add(row)
+            if chunk:
+                yield chunk
+        if chunks.pending:
+            yield chunks.take()
+
+
+class StaffRideExportView(CsvExportMixin, StaffRideListView):
+    filename = 'rides-{date}.csv'
+    export_columns = (
+        value('Ride ID', 'id'),
+        timestamp('Created', 'created_at'),
+        choice('Status', 'status', Ride.STATUS_CHOICES),
+        person('Customer', 'customer__'),
+        person('Rider', 'rider__'),
+        choice('Pickup', 'pickup', Ride.LOCATION_CHOICES),
+        choice('Destination', 'destination', Ride.LOCATION_CHOICES),
+        value('Distance (km)', 'total_distance'),
+        value('Price (PHP)', 'price'),
+    )
+
+    def get_queryset(self):
+        # The list's own ordering plus a tiebreak, so rows come out in a stable order
+        return super().get_queryset().order_by('-created_at', '-id')
+
+
+class StaffEventExportView(CsvExportMixin, StaffEventListView):
+    filename = 'ride-events-{date}.csv'
+    export_columns = (
+        value('Event ID', 'id'),
+        timestamp('Created', 'created_at'),
+        value('Ride ID', 'ride_id'),
+        choice('Ride Status', 'ride__status', Ride.STATUS_CHOICES),
+        choice('Step', 'step', RideEvent.STEP_CHOICES),
+        value('Description', 'description'),
+    )
+
+    def get_queryset(self):
+        return super().get_queryset().order_by('-created_at', '-id')
+
+
+class StaffUserExportView(CsvExportMixin, StaffUserListView):
+    filename = 'users-{date}.csv'
+    export_columns = (
+        value('User ID', 'id'),
+        value('Username', 'username'),
+        person('Name', ''),
+        value('Email', 'email'),
+        choice('Role', 'user_role', CustomUser.ROLE_CHOICES),
+        value('Balance (PHP)', 'balance'),
+        value('Active', 'is_active'),
+        timestamp('Joined', 'date_joined'),
+    )
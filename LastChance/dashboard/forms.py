@@ -1,3 +1,5 @@
+import uuid
+
 from django import forms
 from accounts.models import CustomUser
 
@@ -45,3 +47,5 @@ class AddBalanceForm(forms.Form):
         required=False,
         widget=forms.TextInput(attrs={'class': 'form-control'})
     )
+    # New with each rendered form; a resubmitted or retried form tops up once
+    key = forms.CharField(max_length=64, required=False, initial=lambda: uuid.uuid4().hex, widget=forms.HiddenInput)
@@ -0,0 +1,160 @@
+"""
+The rider and customer tables on the staff dashboard, a page at a time and
+cached as rendered HTML.
+
+Each table is keyset-paginated by join date (``user_role_joined_idx``), so a
+dashboard load reads one page of users however many there are. A rendered
+page is cached under the tables' data version and its cursor, so repeated
+loads skip both the queries and the template. The version is bumped, once
+the transaction commits, whenever balances move (the
+``payments.signals.balances_changed`` signal, which also covers every
+completed ride) or a user is saved, so money
+columns are never stale. Ride counts and the "On Ride" badge also change
+when rides are requested, accepted or cancelled; those pages simply expire
+after ``STAFF_TABLE_CACHE_TIMEOUT`` seconds.
+
+A fragment is rendered without the request, so nothing in it may depend on
+who is looking or on the rest of the query string. As with the pending-ride
+feed, a cursor is decoded before the cache is read and keyed by its digest.
+"""
+import hashlib
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Q, Value
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from accounts.models import CustomUser
+from rides.pagination import CursorPaginator
+
+VERSION_KEY = 'dashboard:user-tables:version'
+
+# Newest accounts first; the role filter plus this ordering is user_role_joined_idx
+ORDERING = ('-date_joined', '-id')
+
+Table = namedtuple('Table', ['name', 'queryset', 'template', 'per_page'])
+
+
+def riders_with_stats():
+    """Riders annotated from the materialized per-user ride stats"""
+    return CustomUser.objects.filter(user_role='RIDER').annotate(
+        completed_rides_count=Coalesce('ride_stats__completed_as_rider', 0),
+        total_earnings=Coalesce('ride_stats__total_earnings', Value(Decimal('0.00'))),
+        has_active_ride=ExpressionWrapper(Q(ride_stats__active_as_rider__gt=0), output_field=BooleanField())
+    )
+
+
+def customers_with_stats():
+    return CustomUser.objects.filter(user_role='CUSTOMER').annotate(
+        total_rides_count=Coalesce('ride_stats__rides_as_customer', 0),
+        total_spent=Coalesce('ride_stats__total_spent', Value(Decimal('0.00'))),
+        last_activity=F('ride_stats__last_ride_at')
+    )
+
+
+TABLES = {
+    'riders': Table('riders', riders_with_stats, 'dashboard/_riders_table.html', 25),
+    'customers': Table('customers', customers_with_stats, 'dashboard/_customers_table.html', 25),
+}
+
+
+def _cache():
+    return caches[getattr(settings, 'STAFF_TABLE_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'STAFF_TABLE_CACHE_TIMEOUT', 300)
+
+
+def get_tables_version():
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+async def aget_tables_version():
+    cache = _cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, 1, None)
+        version = await cache.aget(VERSION_KEY, 1)
+    return version
+
+
+def _bump_version():
+    cache = _cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Key was evicted; any new value orphans the old pages
+        cache.set(VERSION_KEY, get_tables_version() + 1, None)
+
+
+def invalidate_user_tables():
+    """Drop every cached table page once the current transaction commits"""
+    transaction.on_commit(_bump_version)
+
+
+def invalidate_on_balance_change(sender, user_ids, **kwargs):
+    """balances_changed receiver; every table shows balances"""
+    invalidate_user_tables()
+
+
+def invalidate_on_user_save(sender, instance, update_fields=None, **kwargs):
+    """post_save/post_delete receiver for the user model; logging in alone changes nothing shown"""
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        invalidate_user_tables()
+
+
+def active_table(request):
+    """The table whose tab the dashboard opens on"""
+    return 'customers' if request.GET.get('tab') == 'customers' else 'riders'
+
+
+def paginator(table):
+    return CursorPaginator(table.queryset(), table.per_page, ordering=ORDERING)
+
+
+def _key(version, table, pages, cursor):
+    """Cache key of a table page; raises InvalidCursor, as ``pages`` would, for a cursor that does not decode"""
+    if not cursor:
+        return f'dashboard:{table.name}:v{version}:{table.per_page}:first'
+    pages.decode_cursor(cursor)
+    digest = hashlib.sha256(cursor.encode()).hexdigest()
+    return f'dashboard:{table.name}:v{version}:{table.per_page}:{digest}'
+
+
+def _render(table, page):
+    return render_to_string(table.template, {'table': table.name, 'rows': page.object_list, 'page_obj': page})
+
+
+def render_table(table, cursor=None):
+    """The rendered page of ``table`` at ``cursor``, from the cache when possible; raises InvalidCursor"""
+    pages = paginator(table)
+    key = _key(get_tables_version(), table, pages, cursor)
+    cache = _cache()
+    html = cache.get(key)
+    if html is None:
+        html = _render(table, pages.page(cursor))
+        cache.set(key, html, _timeout())
+    return mark_safe(html)
+
+
+async def arender_table(table, cursor=None):
+    """Async ``render_table``, sharing the same cache entries"""
+    pages = paginator(table)
+    key = _key(await aget_tables_version(), table, pages, cursor)
+    cache = _cache()
+    html = await cache.aget(key)
+    if html is None:
+        html = _render(table, await pages.apage(cursor))
+        await cache.aset(key, html, _timeout())
+    return mark_safe(html)
@@ -0,0 +1,117 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+Case = namedtuple('Case', 'name url_name role')
+
+# Pages rendered through base.html, first anonymous and then as each role
+CASES = (
+    Case('sign in', 'signin', None),
+    Case('staff dashboard', 'staff-dashboard', 'STAFF'),
+    Case('ride list (customer)', 'ride-list', 'CUSTOMER'),
+    Case('rider dashboard', 'rider-dashboard', 'RIDER'),
+)
+
+# Runs in a fresh interpreter: import the WSGI application as a server would, then time
+# the first two requests to each case. Writes are rolled back.
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import LastC.wsgi
+ready = time.perf_counter() - start
+
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from accounts.models import CustomUser
+from dashboard.warmup import startup_timings
+
+host, cases = sys.argv[1], json.loads(sys.argv[2])
+startup = startup_timings()
+result = {
+    'ready': ready, 'boot': startup.boot_seconds,
+    'steps': {step.name: step.seconds for step in startup.steps}, 'requests': {},
+}
+with transaction.atomic():
+    for name, url_name, role in cases:
+        client = Client(SERVER_NAME=host)
+        if role:
+            users = CustomUser.objects.filter(is_active=True).order_by('pk')
+            user = users.filter(is_staff=True).first() if role == 'STAFF' else users.filter(user_role=role).first()
+            if user is None:
+                continue
+            client.force_login(user)
+        timings = []
+        for _ in range(2):
+            began = time.perf_counter()
+            status = client.get(reverse(url_name)).status_code
+            timings.append(time.perf_counter() - began)
+        result['requests'][name] = {'first': timings[0], 'second': timings[1], 'status': status}
+    transaction.set_rollback(True)
+print(json.dumps(result))
+'''
+
+MODES = {'cold': '0', 'warmed': '1'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Start fresh interpreters the way a WSGI server does, with and without the worker warm-up '
+        '(dashboard/warmup.py), and compare how long each takes to become ready and to answer its first requests. '
+        'Uses the settings this command runs with; pages that need a user are skipped when there is none. '
+        'Writes made by the requests are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh processes per mode.')
+        parser.add_argument('--only', action='append', metavar='NAME', help='Time only this case; repeatable.')
+        parser.add_argument('--host', default='localhost', help='Host header to send; must be in ALLOWED_HOSTS.')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs must be positive.')
+        cases = [case for case in CASES if not options['only'] or case.name in options['only']]
+        if not cases:
+            raise CommandError(f'No such case; choose from: {", ".join(case.name for case in CASES)}.')
+
+        results = {mode: [self._run(flag, cases, options['host']) for _ in range(options['runs'])]
+                   for mode, flag in MODES.items()}
+
+        self.stdout.write(f'{"":<24}{"cold":>10}{"warmed":>10}')
+        self.stdout.write(f'{"ready ms":<24}' + ''.join(
+            f'{statistics.median(run["ready"] for run in runs) * 1000:>10.0f}' for runs in results.values()
+        ))
+        for step in results['warmed'][0]['steps']:
+            self.stdout.write(f'{"  " + step + " ms":<24}{"-":>10}'
+                              f'{statistics.median(run["steps"][step] for run in results["warmed"]) * 1000:>10.0f}')
+
+        self.stdout.write(f'\n{"first request ms":<24}{"status":>7}{"cold":>10}{"warmed":>10}{"steady":>10}')
+        for case in cases:
+            if case.name not in results['cold'][0]['requests']:
+                self.stdout.write(f'{case.name:<24}  skipped: no {case.role.lower()} user')
+                continue
+            cold, warmed = ([run['requests'][case.name] for run in results[mode]] for mode in MODES)
+            self.stdout.write(
+                f'{case.name:<24}{warmed[0]["status"]:>7}'
+                f'{statistics.median(r["first"] for r in cold) * 1000:>10.1f}'
+                f'{statistics.median(r["first"] for r in warmed) * 1000:>10.1f}'
+                f'{statistics.median(r["second"] for r in warmed) * 1000:>10.1f}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Median of {options["runs"]} fresh process(es) per mode.'))
+
+    def _run(self, warm_up, cases, host):
+        env = dict(os.environ, LASTCHANCE_WARM_UP=warm_up)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'LastC.settings')
+        completed = subprocess.run(
+            [sys.executable, '-c', CHILD, host, json.dumps(cases)],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode:
+            raise CommandError(f'The worker process failed:\n{completed.stderr}')
+        return json.loads(completed.stdout.splitlines()[-1])
@@ -0,0 +1,272 @@
+"""
+Per-request query and latency profiling, cheap enough to leave on.
+
+``RequestProfilingMiddleware`` times each request and, through a context
+variable, collects what happened during it: the number of SQL queries and
+their total time, how often each distinct SQL string ran, and the time spent
+rendering templates. Queries are seen by one execute wrapper installed on
+every database connection as it opens (``install_query_hook``), which does
+nothing but a context variable lookup outside a profiled request. Django
+builds SQL with ``%s`` placeholders, so the SQL string itself is the query's
+fingerprint and needs no normalising. Template time comes from
+``ProfiledDjangoTemplates``, a drop-in for the DjangoTemplates backend.
+
+Results stay in this process: the last ``BUFFER_SIZE`` requests in a ring
+buffer, and per URL name a latency histogram with query and template
+totals. Any statement repeated ``REPEATED_QUERY_THRESHOLD`` times or more in
+one request is reported as a likely N+1. Latency is measured to the point
+the response is returned, so streamed bodies (CSV exports, event streams)
+count only their time to first byte.
+"""
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+# Upper bounds, in milliseconds, of the latency histogram buckets; the last one is open-ended
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+BUCKET_LABELS = tuple(f'≤{bound} ms' for bound in BUCKETS[:-1]) + (f'>{BUCKETS[-2]} ms',)
+
+UNRESOLVED = '(unresolved)'
+
+RequestProfile = namedtuple('RequestProfile', [
+    'url_name', 'method', 'path', 'status', 'started_at', 'duration', 'queries', 'sql_time', 'template_time',
+    'repeated',
+])
+
+_current = ContextVar('request_profile', default=None)
+_lock = threading.Lock()
+_recent = None
+_endpoints = {}
+_repeats = {}
+
+
+def _option(name, default):
+    return getattr(settings, 'REQUEST_PROFILING', {}).get(name, default)
+
+
+class Recorder:
+    """What one request has done so far"""
+    __slots__ = ('queries', 'sql_time', 'template_time', 'template_depth', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.statements = Counter()
+
+
+# Hooks
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.sql_time += time.perf_counter() - start
+        recorder.queries += 1
+        recorder.statements[sql] += 1
+
+
+def install_query_hook(sender, connection, **kwargs):
+    """connection_created receiver: profile every query on ``connection``"""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        recorder = _current.get()
+        if recorder is None:
+            return super().render(context, request)
+        # Only the outermost render counts; render_to_string() inside a tag is already being timed
+        recorder.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            recorder.template_depth -= 1
+            if not recorder.template_depth:
+                recorder.template_time += time.perf_counter() - start
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """The DjangoTemplates backend, with render time added to the request's profile"""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return ProfiledTemplate(template.template, self)
+
+
+# Middleware
+
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = Recorder()
+        token = _current.set(recorder)
+        started_at, start = time.time(), time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        record(request, response, recorder, started_at, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        recorder = Recorder()
+        # Copied into the threads sync_to_async() runs the ORM on, so their queries count too
+        token = _current.set(recorder)
+        started_at, start = time.time(), time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        record(request, response, recorder, started_at, time.perf_counter() - start)
+        return response
+
+
+# Aggregation
+
+def _new_endpoint():
+    return {
+        'requests': 0, 'errors': 0, 'total': 0.0, 'max': 0.0, 'queries': 0, 'max_queries': 0,
+        'sql_time': 0.0, 'template_time': 0.0, 'buckets': [0] * len(BUCKETS),
+    }
+
+
+def _bucket(duration):
+    ms = duration * 1000
+    for i, bound in enumerate(BUCKETS):
+        if ms <= bound:
+            return i
+
+
+def record(request, response, recorder, started_at, duration):
+    """Add a finished request to the ring buffer and its endpoint's histogram"""
+    global _recent
+    # Requests that never resolved (404s) share one entry, so the table stays bounded
+    url_name = request.resolver_match.view_name if request.resolver_match else UNRESOLVED
+    threshold = _option('REPEATED_QUERY_THRESHOLD', 5)
+    repeated = tuple(sorted(
+        ((sql, count) for sql, count in recorder.statements.items() if count >= threshold),
+        key=lambda item: -item[1],
+    ))
+    profile = RequestProfile(
+        url_name, request.method, request.path, response.status_code, started_at, duration,
+        recorder.queries, recorder.sql_time, recorder.template_time, repeated,
+    )
+
+    with _lock:
+        if _recent is None:
+            _recent = deque(maxlen=_option('BUFFER_SIZE', 500))
+        _recent.append(profile)
+
+        endpoint = _endpoints.get(url_name)
+        if endpoint is None:
+            endpoint = _endpoints[url_name] = _new_endpoint()
+        endpoint['requests'] += 1
+        endpoint['errors'] += response.status_code >= 500
+        endpoint['total'] += duration
+        endpoint['max'] = max(endpoint['max'], duration)
+        endpoint['queries'] += recorder.queries
+        endpoint['max_queries'] = max(endpoint['max_queries'], recorder.queries)
+        endpoint['sql_time'] += recorder.sql_time
+        endpoint['template_time'] += recorder.template_time
+        endpoint['buckets'][_bucket(duration)] += 1
+
+        for sql, count in repeated:
+            key = (url_name, sql)
+            pattern = _repeats.get(key)
+            if pattern is None:
+                if len(_repeats) >= _option('MAX_REPEATED_PATTERNS', 200):
+                    del _repeats[min(_repeats, key=lambda k: _repeats[k]['last_seen'])]
+                pattern = _repeats[key] = {'requests': 0, 'worst': 0}
+            pattern['requests'] += 1
+            pattern['worst'] = max(pattern['worst'], count)
+            pattern['last_seen'] = started_at
+    return profile
+
+
+def percentile(buckets, fraction):
+    """Upper bound, in ms, of the bucket holding the ``fraction`` quantile (None when unbounded)"""
+    wanted = fraction * sum(buckets)
+    seen = 0
+    for bound, count in zip(BUCKETS, buckets):
+        seen += count
+        if count and seen >= wanted:
+            return None if bound == float('inf') else bound
+    return 0
+
+
+def endpoint_stats():
+    """One summary per URL name, slowest (by p95, then mean) first"""
+    with _lock:
+        endpoints = {name: dict(values, buckets=list(values['buckets'])) for name, values in _endpoints.items()}
+    rows = []
+    for name, values in endpoints.items():
+        requests = values['requests']
+        p95 = percentile(values['buckets'], 0.95)
+        rows.append({
+            'url_name': name,
+            'requests': requests,
+            'errors': values['errors'],
+            'mean_ms': values['total'] / requests * 1000,
+            'p50_ms': percentile(values['buckets'], 0.5),
+            'p95_ms': p95,
+            'max_ms': values['max'] * 1000,
+            'mean_queries': values['queries'] / requests,
+            'max_queries': values['max_queries'],
+            'mean_sql_ms': values['sql_time'] / requests * 1000,
+            'mean_template_ms': values['template_time'] / requests * 1000,
+            'histogram': list(zip(BUCKET_LABELS, values['buckets'])),
+        })
+    rows.sort(key=lambda row: (float('inf') if row['p95_ms'] is None else row['p95_ms'], row['mean_ms']), reverse=True)
+    return rows
+
+
+def repeated_queries():
+    """Likely N+1 patterns: statements run many times within one request, worst first"""
+    with _lock:
+        patterns = [dict(values, url_name=name, sql=sql) for (name, sql), values in _repeats.items()]
+    patterns.sort(key=lambda pattern: (pattern['worst'], pattern['requests']), reverse=True)
+    return patterns
+
+
+def recent_requests(limit=None, slowest=False):
+    with _lock:
+        profiles = list(_recent or ())
+    if slowest:
+        profiles.sort(key=lambda profile: profile.duration, reverse=True)
+    else:
+        profiles.reverse()
+    return profiles[:limit]
+
+
+def reset_request_profiles():
+    global _recent
+    with _lock:
+        _recent = None
+        _endpoints.clear()
+        _repeats.clear()
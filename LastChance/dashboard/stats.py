@@ -0,0 +1,87 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Sum, Q
+from django.utils import timezone
+
+from rides.models import RideHistory
+from accounts.models import CustomUser
+
+
+ACTIVE_STATUSES = ['ACCEPTED', 'ONGOING']
+
+
+@dataclass(frozen=True)
+class DashboardStats:
+    """Headline numbers shown on the staff dashboard."""
+    total_riders: int
+    total_customers: int
+    active_rides: int
+    today_rides: int
+    completed_rides: int
+    total_earnings: Decimal
+    total_system_balance: Decimal
+
+    @property
+    def total_users(self):
+        return self.total_riders + self.total_customers
+
+    def as_context(self):
+        return {
+            'total_users': self.total_users,
+            'total_riders': self.total_riders,
+            'total_customers': self.total_customers,
+            'active_rides': self.active_rides,
+            'today_rides': self.today_rides,
+            'completed_rides': self.completed_rides,
+            'total_earnings': self.total_earnings,
+            'total_system_balance': self.total_system_balance,
+        }
+
+
+def _aggregates():
+    """The two conditional aggregates behind the dashboard, as (queryset, aggregate kwargs) pairs"""
+    users = (CustomUser.objects, dict(
+        total_riders=Count('pk', filter=Q(user_role='RIDER')),
+        total_customers=Count('pk', filter=Q(user_role='CUSTOMER')),
+        total_system_balance=Sum('balance'),
+    ))
+
+    # A created_at range avoids casting every row to a date
+    today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    today_end = today_start + timedelta(days=1)
+    rides = (RideHistory.objects, dict(
+        active_rides=Count('pk', filter=Q(status__in=ACTIVE_STATUSES)),
+        today_rides=Count('pk', filter=Q(created_at__gte=today_start, created_at__lt=today_end)),
+        completed_rides=Count('pk', filter=Q(status='COMPLETED')),
+        total_earnings=Sum('price', filter=Q(status='COMPLETED')),
+    ))
+    return users, rides
+
+
+def _build(users, rides):
+    return DashboardStats(
+        total_riders=users['total_riders'],
+        total_customers=users['total_customers'],
+        active_rides=rides['active_rides'],
+        today_rides=rides['today_rides'],
+        completed_rides=rides['completed_rides'],
+        total_earnings=rides['total_earnings'] or Decimal('0'),
+        total_system_balance=users['total_system_balance'] or Decimal('0'),
+    )
+
+
+def get_dashboard_stats():
+    """
+    Collect the staff dashboard statistics with two conditional-aggregate
+    queries: one over users and one over rides.
+    """
+    return _build(*(queryset.aggregate(**aggregates) for queryset, aggregates in _aggregates()))
+
+
+async def aget_dashboard_stats():
+    """Async ``get_dashboard_stats``; the two queries are issued concurrently"""
+    results = await asyncio.gather(*(queryset.aaggregate(**aggregates) for queryset, aggregates in _aggregates()))
+    return _build(*results)
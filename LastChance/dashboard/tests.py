@@ -1,3 +1,402 @@
-from django.test import TestCase
+import csv
+import io
+import tempfile
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.template import engines
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from LastC.testing import AsyncViewMixin, QueryPlanMixin
+from rides.models import Ride, RideEvent
+from rides.pagination import InvalidCursor
+from payments.services import top_up
+from . import async_views, exports, fragments, profiling, views, warmup
+from .stats import aget_dashboard_stats, get_dashboard_stats
+
+
+class DashboardStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            username='staff', password='pass', user_role='STAFF', is_staff=True, balance=Decimal('5.00')
+        )
+        cls.rider = CustomUser.objects.create_user(
+            username='rider', password='pass', user_role='RIDER', balance=Decimal('10.00')
+        )
+        cls.customer = CustomUser.objects.create_user(
+            username='customer', password='pass', user_role='CUSTOMER', balance=Decimal('100.00')
+        )
+        for status, price in [('COMPLETED', '80.00'), ('COMPLETED', '120.00'), ('ONGOING', '60.00'),
+                              ('ACCEPTED', '50.00'), ('CANCELLED', '70.00')]:
+            Ride.objects.create(
+                rider=cls.rider, customer=cls.customer, pickup='CLARK_MAIN', destination='SM_CLARK',
+                total_distance=Decimal('3.00'), price=Decimal(price), status=status,
+            )
+
+    def test_headline_numbers(self):
+        stats = get_dashboard_stats()
+        self.assertEqual(stats.total_riders, 1)
+        self.assertEqual(stats.total_customers, 1)
+        self.assertEqual(stats.total_users, 2)
+        self.assertEqual(stats.active_rides, 2)
+        self.assertEqual(stats.today_rides, 5)
+        self.assertEqual(stats.completed_rides, 2)
+        self.assertEqual(stats.total_earnings, Decimal('200.00'))
+        self.assertEqual(stats.total_system_balance, Decimal('115.00'))
+
+    def test_query_budget(self):
+        with self.assertNumQueries(2):
+            get_dashboard_stats()
+
+    def test_empty_database(self):
+        Ride.objects.all().delete()
+        CustomUser.objects.all().delete()
+        stats = get_dashboard_stats()
+        self.assertEqual(stats.total_users, 0)
+        self.assertEqual(stats.total_earnings, Decimal('0'))
+        self.assertEqual(stats.total_system_balance, Decimal('0'))
+
+    async def test_async_stats_match(self):
+        self.assertEqual(await aget_dashboard_stats(), await sync_to_async(get_dashboard_stats)())
+
+    def test_dashboard_view_context(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('staff-dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_users'], 2)
+        self.assertEqual(response.context['completed_rides'], 2)
+        self.assertEqual(response.context['total_earnings'], Decimal('200.00'))
+
+
+class AsyncStaffDashboardTests(AsyncViewMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(username='staff', password='pass', user_role='STAFF', is_staff=True)
+        cls.rider = CustomUser.objects.create_user(
+            username='rider', password='pass', user_role='RIDER', first_name='Rosa', last_name='Rider'
+        )
+
+    async def test_renders_tables(self):
+        response = await self.call(async_views.staff_dashboard, self.staff)
+        self.assertContains(response, 'Rosa Rider')
+
+    async def test_staff_only(self):
+        with self.assertRaises(PermissionDenied):
+            await self.call(async_views.staff_dashboard, self.rider)
+
+
+class StaffUserTableTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(username='staff', password='pass', user_role='STAFF', is_staff=True)
+        cls.riders = [
+            CustomUser.objects.create_user(
+                username=f'rider{i}', password='pass', user_role='RIDER', first_name='Rider', last_name=f'No{i}',
+            )
+            for i in range(30)
+        ]
+        cls.customer = CustomUser.objects.create_user(
+            username='customer', password='pass', user_role='CUSTOMER', first_name='Cora', last_name='Customer',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def user_table_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in captured if 'rides_userridestats' in query['sql']]
+
+    def test_tables_are_paginated(self):
+        response = self.client.get(reverse('staff-dashboard'))
+        self.assertContains(response, 'Rider No29')
+        self.assertNotContains(response, 'Rider No4<')
+        self.assertContains(response, 'Cora Customer')
+
+        next_cursor = fragments.paginator(fragments.TABLES['riders']).page().next_cursor
+        response = self.client.get(reverse('staff-dashboard'), {'riders_cursor': next_cursor, 'tab': 'riders'})
+        self.assertContains(response, 'Rider No4<')
+        self.assertNotContains(response, 'Rider No29')
+        self.assertContains(response, 'Cora Customer')
+
+    def test_second_load_is_served_from_the_cache(self):
+        response, queries = self.user_table_queries(reverse('staff-dashboard'))
+        self.assertEqual(len(queries), 2)
+        response, queries = self.user_table_queries(reverse('staff-dashboard'))
+        self.assertEqual(queries, [])
+        self.assertContains(response, 'Rider No29')
+
+    def test_balance_changes_invalidate(self):
+        self.client.get(reverse('staff-dashboard'), {'tab': 'customers'})
+        with self.captureOnCommitCallbacks(execute=True):
+            top_up(self.customer, Decimal('42.50'))
+        response, queries = self.user_table_queries(reverse('staff-dashboard') + '?tab=customers')
+        self.assertEqual(len(queries), 2)
+        self.assertContains(response, '42.50')
+
+    def test_login_alone_does_not_invalidate(self):
+        version = fragments.get_tables_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(username='rider0', password='pass')
+        self.assertEqual(fragments.get_tables_version(), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.save()
+        self.assertEqual(fragments.get_tables_version(), version + 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('staff-dashboard'), {'customers_cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursors_are_checked_before_they_reach_the_cache(self):
+        table = fragments.TABLES['riders']
+        with mock.patch.object(fragments, '_cache') as cache_of:
+            with self.assertRaises(InvalidCursor):
+                fragments.render_table(table, 'x' * 5000)
+        # Only the version was read
+        self.assertEqual(
+            [call.args[0] for call in cache_of.return_value.get.call_args_list], [fragments.VERSION_KEY]
+        )
+
+        cursor = fragments.paginator(table).page().next_cursor
+        key = fragments._key(1, table, fragments.paginator(table), cursor)
+        self.assertNotIn(cursor, key)
+        self.assertLess(len(key), 120)
+
+
+class DashboardQueryPlanTests(QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create(username='staff', user_role='STAFF', is_staff=True)
+
+    def test_staff_dashboard_view(self):
+        context = self.make_view(views.StaffDashboardView, self.staff).get_context_data()
+        self.assertNoFullScan(context['recent_events'])
+        for table in fragments.TABLES.values():
+            with self.subTest(table=table.name):
+                paginator = fragments.paginator(table)
+                self.assertNoFullScan(paginator._page_query(None)[0])
+                cursor = paginator.encode_cursor(self.staff, 'next')
+                self.assertNoFullScan(paginator._page_query(cursor)[0])
+
+    def test_staff_ride_list_view(self):
+        for data in ({}, {'status': 'PENDING'}):
+            with self.subTest(filters=data):
+                view = self.make_view(views.StaffRideListView, self.staff, data)
+                self.assertNoFullScan(view.get_queryset()[:view.paginate_by])
+
+    def test_staff_event_list_view(self):
+        view = self.make_view(views.StaffEventListView, self.staff)
+        self.assertNoFullScan(view.get_queryset()[:view.paginate_by])
+
+    def test_staff_user_list_view(self):
+        for data in ({}, {'role': 'RIDER'}):
+            with self.subTest(filters=data):
+                view = self.make_view(views.StaffUserListView, self.staff, data)
+                self.assertNoFullScan(view.get_queryset()[:view.paginate_by])
+
+
+class StaffCsvExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create(username='staff', user_role='STAFF', is_staff=True)
+        cls.rider = CustomUser.objects.create(username='rider', user_role='RIDER', first_name='Rosa', last_name='Rider')
+        cls.customer = CustomUser.objects.create(
+            username='customer', user_role='CUSTOMER', first_name='Carl', middle_name='M', last_name='Customer'
+        )
+        cls.completed = Ride.objects.create(
+            rider=cls.rider, customer=cls.customer, pickup='CLARK_MAIN', destination='SM_CLARK',
+            total_distance=Decimal('3.00'), price=Decimal('80.00'), status='COMPLETED',
+        )
+        cls.pending = Ride.objects.create(
+            customer=cls.customer, pickup='FONTANA', destination='CDC',
+            total_distance=Decimal('5.00'), price=Decimal('95.00'),
+        )
+        RideEvent.objects.create(ride=cls.completed, step=5, description='Paid, "in full"')
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def download(self, name, data=None):
+        response = self.client.get(reverse(name), data or {})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_ride_export_honours_status_filter(self):
+        rows = self.download('staff-rides-export')
+        self.assertEqual(rows[0][:4], ['Ride ID', 'Created', 'Status', 'Customer'])
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.pending.pk), str(self.completed.pk)])
+        self.assertEqual(rows[1][3:6], ['Carl M Customer', '', 'Fontana Leisure Park'])
+
+        rows = self.download('staff-rides-export', {'status': 'COMPLETED'})
+        self.assertEqual(rows[1:], [[
+            str(self.completed.pk), rows[1][1], 'Completed', 'Carl M Customer', 'Rosa Rider',
+            'Clark Main Gate', 'SM City Clark', '3.00', '80.00',
+        ]])
+
+    def test_event_and_user_exports(self):
+        rows = self.download('staff-events-export')
+        self.assertEqual(rows[-1][2:], [str(self.completed.pk), 'Completed', 'Journey Completed', 'Paid, "in full"'])
+        rows = self.download('staff-users-export', {'role': 'RIDER'})
+        self.assertEqual([row[1] for row in rows[1:]], ['rider'])
+
+    def test_formula_cells_are_defused(self):
+        CustomUser.objects.filter(pk=self.rider.pk).update(first_name='=HYPERLINK("http://x")', last_name='')
+        RideEvent.objects.create(ride=self.completed, step=5, description='@SUM(A1)')
+        rows = self.download('staff-rides-export', {'status': 'COMPLETED'})
+        self.assertEqual(rows[1][4], '\'=HYPERLINK("http://x")')
+        rows = self.download('staff-events-export')
+        self.assertIn(["'@SUM(A1)"], [row[-1:] for row in rows])
+        self.assertEqual(
+            [exports.defuse(cell) for cell in ('-1', '+1', '\tx', '\rx', 'a-b', Decimal('-5.00'), None)],
+            ["'-1", "'+1", "'\tx", "'\rx", 'a-b', Decimal('-5.00'), None],
+        )
+
+    def test_rows_are_streamed_in_chunks(self):
+        with mock.patch.object(exports.CsvExportMixin, 'chunk_size', 1):
+            response = self.client.get(reverse('staff-rides-export'))
+            # The header chunk is produced before the query runs
+            with self.assertNumQueries(0):
+                header = next(response.streaming_content)
+            chunks = list(response.streaming_content)
+        self.assertTrue(header.startswith(b'Ride ID,'))
+        self.assertEqual(len(chunks), 2)
+
+    async def test_async_rows(self):
+        view = exports.StaffRideExportView()
+        rows = Ride.objects.order_by('-created_at', '-id').values_list(
+            *[lookup for column in view.export_columns for lookup in column.lookups]
+        )
+        text = ''.join([chunk async for chunk in view.arender(exports.aiterate(rows, 1))])
+        self.assertEqual(len(text.splitlines()), 3)
+
+    def test_staff_only(self):
+        self.client.force_login(self.rider)
+        self.assertEqual(self.client.get(reverse('staff-rides-export')).status_code, 403)
+
+
+class RequestProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create(username='staff', user_role='STAFF', is_staff=True)
+        cls.rider = CustomUser.objects.create(username='rider', user_role='RIDER')
+
+    def setUp(self):
+        profiling.reset_request_profiles()
+        self.addCleanup(profiling.reset_request_profiles)
+        self.client.force_login(self.staff)
+
+    def endpoint(self, url_name):
+        return next(row for row in profiling.endpoint_stats() if row['url_name'] == url_name)
+
+    def test_requests_are_recorded_per_url_name(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('staff-dashboard')).status_code, 200)
+        self.client.get('/no-such-page/')
+
+        endpoint = self.endpoint('staff-dashboard')
+        self.assertEqual(endpoint['requests'], 3)
+        self.assertEqual(sum(count for label, count in endpoint['histogram']), 3)
+        self.assertGreater(endpoint['mean_queries'], 0)
+        self.assertGreater(endpoint['mean_template_ms'], 0)
+        self.assertEqual(self.endpoint(profiling.UNRESOLVED)['requests'], 1)
+        self.assertEqual(profiling.recent_requests(limit=1)[0].path, '/no-such-page/')
+
+    def test_repeated_statements_are_flagged(self):
+        def n_plus_one(request):
+            for ride_id in range(6):
+                list(Ride.objects.filter(pk=ride_id))
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        with self.assertNumQueries(6):
+            profiling.RequestProfilingMiddleware(n_plus_one)(request)
+        [pattern] = profiling.repeated_queries()
+        self.assertEqual((pattern['url_name'], pattern['worst'], pattern['requests']), (profiling.UNRESOLVED, 6, 1))
+        self.assertIn('FROM "rides_ride"', pattern['sql'])
+
+    async def test_async_requests(self):
+        async def view(request):
+            await Ride.objects.acount()
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        await profiling.RequestProfilingMiddleware(view)(request)
+        self.assertEqual(profiling.recent_requests()[0].queries, 1)
+
+    def test_ring_buffer_is_bounded(self):
+        with override_settings(REQUEST_PROFILING={'BUFFER_SIZE': 2}):
+            profiling.reset_request_profiles()
+            for _ in range(3):
+                self.client.get(reverse('staff-dashboard'))
+        self.assertEqual(len(profiling.recent_requests()), 2)
+        self.assertEqual(self.endpoint('staff-dashboard')['requests'], 3)
+
+    def test_performance_page(self):
+        self.client.get(reverse('staff-dashboard'))
+        response = self.client.get(reverse('staff-performance'))
+        self.assertContains(response, 'staff-dashboard')
+        self.client.force_login(self.rider)
+        self.assertEqual(self.client.get(reverse('staff-performance')).status_code, 403)
+
+
+class WorkerWarmUpTests(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, warmup, '_startup', warmup._startup)
+
+    def test_every_project_template_is_compiled(self):
+        cached_loader = engines.all()[0].engine.template_loaders[0]
+        # Earlier tests may have rendered admin pages in this process
+        cached_loader.reset()
+        steps = {step.name: step for step in warmup.warm_up()}
+        templates_dir = settings.BASE_DIR / 'templates'
+        self.assertEqual(steps['templates'].count, len(list(templates_dir.rglob('*.html'))))
+        self.assertGreater(steps['urls'].count, 0)
+        self.assertIn('dashboard/staff_dashboard.html', cached_loader.get_template_cache)
+        self.assertNotIn('admin/base.html', cached_loader.get_template_cache)
+
+    def test_manifest_storage_needs_collectstatic(self):
+        storages = dict(settings.STORAGES, staticfiles={
+            'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage',
+        })
+        with tempfile.TemporaryDirectory() as static_root, \
+                override_settings(STATIC_ROOT=static_root, STORAGES=storages):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'run collectstatic'):
+                warmup.warm_static_manifest()
+            call_command('collectstatic', interactive=False, verbosity=0)
+            self.assertGreater(warmup.warm_static_manifest(), 0)
+
+    def test_startup_is_recorded_and_shown(self):
+        with override_settings(WARM_UP_ON_STARTUP=False):
+            startup = warmup.on_startup(time.perf_counter())
+        self.assertEqual((startup.warmed, startup.steps), (False, []))
+        with override_settings(WARM_UP_ON_STARTUP=True):
+            startup = warmup.on_startup(time.perf_counter())
+        self.assertEqual([step.name for step in startup.steps], [name for name, function in warmup.STEPS])
+        self.assertGreaterEqual(startup.total_seconds, startup.boot_seconds)
+
+        staff = CustomUser.objects.create(username='staff', user_role='STAFF', is_staff=True)
+        self.client.force_login(staff)
+        self.assertContains(self.client.get(reverse('staff-performance')), 'Warm-up Step')
+
+    def test_bench_startup_command(self):
+        out = io.StringIO()
+        call_command('bench_startup', '--runs', '1', '--only', 'sign in', stdout=out)
+        self.assertIn('sign in', out.getvalue())
+        self.assertIn('templates ms', out.getvalue())
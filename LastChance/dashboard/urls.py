@@ -1,10 +1,18 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, exports, views
+
+# Under ASGI the dashboard home is served by its async version
+staff_dashboard = async_views.staff_dashboard if settings.ASYNC_VIEWS else views.StaffDashboardView.as_view()
 
 urlpatterns = [
-    path('', views.StaffDashboardView.as_view(), name='staff-dashboard'),
+    path('', staff_dashboard, name='staff-dashboard'),
+    path('performance/', views.StaffPerformanceView.as_view(), name='staff-performance'),
     path('rides/', views.StaffRideListView.as_view(), name='staff-rides'),
+    path('rides/export/', exports.StaffRideExportView.as_view(), name='staff-rides-export'),
+    path('events/export/', exports.StaffEventExportView.as_view(), name='staff-events-export'),
     path('users/', views.StaffUserListView.as_view(), name='staff-users'),
+    path('users/export/', exports.StaffUserExportView.as_view(), name='staff-users-export'),
     path('users/<int:pk>/', views.StaffRideDetailView.as_view(), name='staff-user-detail'),
     path('users/<int:user_id>/add-balance/', views.add_balance, name='staff-add-balance'),
     path('users/create/', views.StaffCreateUserView.as_view(), name='staff-create-user'),
@@ -1,19 +1,22 @@
-import decimal
-from decimal import Decimal
-from datetime import timedelta
+from decimal import Decimal, InvalidOperation
 
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, TemplateView
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Count, Sum, Q, Exists, OuterRef, Max
-from django.utils import timezone
 from django.urls import reverse_lazy
+from django.http import Http404
 
-from rides.models import Ride, RideEvent
+from rides.models import RideHistory, RideHistoryEvent
+from rides.pagination import CursorPaginationMixin, InvalidCursor
+from rides.feed import feed_cache_stats
 from accounts.models import CustomUser
+from payments.services import top_up, record_opening_balance
 from .forms import StaffCreateUserForm, AddBalanceForm
+from .stats import get_dashboard_stats
+from . import fragments, profiling, warmup
 
 
 # ----------------------------
@@ -27,62 +30,64 @@ class StaffRequiredMixin(UserPassesTestMixin):
 # ----------------------------
 # Dashboard Home / Staff Dashboard
 # ----------------------------
+def recent_events(limit=20):
+    # prefetch rather than select_related: joining the two history views pairs every half
+    # with every other, and the ORDER BY ... LIMIT can no longer be read off an index
+    return RideHistoryEvent.objects.prefetch_related('ride').order_by('-created_at')[:limit]
+
+
 class StaffDashboardView(LoginRequiredMixin, StaffRequiredMixin, TemplateView):
     template_name = 'dashboard/staff_dashboard.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # Users
-        riders = CustomUser.objects.filter(user_role='RIDER')
-        customers = CustomUser.objects.filter(user_role='CUSTOMER')
-        context['total_users'] = riders.count() + customers.count()
-        context['total_riders'] = riders.count()
-        context['total_customers'] = customers.count()
-
-        # Ride statistics
-        today = timezone.now().date()
-        context['active_rides'] = Ride.objects.filter(status__in=['ACCEPTED', 'ONGOING']).count()
-        context['today_rides'] = Ride.objects.filter(created_at__date=today).count()
-        context['completed_rides'] = Ride.objects.filter(status='COMPLETED').count()
-        context['total_earnings'] = Ride.objects.filter(status='COMPLETED').aggregate(total=Sum('price'))['total'] or 0
-
-        # System balance
-        context['total_system_balance'] = CustomUser.objects.aggregate(total=Sum('balance'))['total'] or 0
-
-        # Riders stats
-        riders_data = riders.annotate(
-            completed_rides_count=Count('rides_as_rider', filter=Q(rides_as_rider__status='COMPLETED')),
-            total_earnings=Sum('rides_as_rider__price', filter=Q(rides_as_rider__status='COMPLETED')),
-            has_active_ride=Exists(Ride.objects.filter(rider=OuterRef('pk'), status__in=['ACCEPTED', 'ONGOING']))
-        )
-        context['riders'] = riders_data
+        # Headline statistics
+        context.update(get_dashboard_stats().as_context())
 
-        # Customers stats
-        customers_data = customers.annotate(
-            total_rides_count=Count('rides_as_customer'),
-            total_spent=Sum('rides_as_customer__price', filter=Q(rides_as_customer__status='COMPLETED')),
-            last_activity=Max('rides_as_customer__created_at')
-        )
-        context['customers'] = customers_data
+        # One cached, rendered page of each user table (see fragments.py)
+        context['active_tab'] = fragments.active_table(self.request)
+        try:
+            for name, table in fragments.TABLES.items():
+                context[f'{name}_table'] = fragments.render_table(table, self.request.GET.get(f'{name}_cursor'))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+
+        # Rider feed cache counters for this worker
+        context['pending_feed_stats'] = feed_cache_stats()
 
-        # Recent events
-        context['recent_events'] = RideEvent.objects.select_related('ride').order_by('-created_at')[:20]
+        context['recent_events'] = recent_events()
 
         return context
 
 
+class StaffPerformanceView(LoginRequiredMixin, StaffRequiredMixin, TemplateView):
+    """Request timings and repeated queries recorded by this worker's profiling middleware"""
+    template_name = 'dashboard/performance.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['endpoints'] = profiling.endpoint_stats()
+        context['repeated_queries'] = profiling.repeated_queries()[:20]
+        context['slowest_requests'] = profiling.recent_requests(limit=20, slowest=True)
+        context['profiling_options'] = settings.REQUEST_PROFILING
+        context['startup'] = warmup.startup_timings()
+        return context
+
+
 # ----------------------------
 # Ride Views
 # ----------------------------
-class StaffRideListView(LoginRequiredMixin, StaffRequiredMixin, ListView):
-    model = Ride
+class StaffRideListView(LoginRequiredMixin, StaffRequiredMixin, CursorPaginationMixin, ListView):
+    # Live and archived rides alike (see rides/archive.py)
+    model = RideHistory
     template_name = 'dashboard/ride_list.html'
     context_object_name = 'rides'
     paginate_by = 20
+    estimate_total = True
 
     def get_queryset(self):
-        queryset = Ride.objects.all()
+        queryset = RideHistory.objects.for_list()
         status = self.request.GET.get('status')
         if status:
             queryset = queryset.filter(status=status)
@@ -90,12 +95,12 @@ class StaffRideListView(LoginRequiredMixin, StaffRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['status_filters'] = Ride.STATUS_CHOICES
+        context['status_filters'] = RideHistory.STATUS_CHOICES
         return context
 
 
 class StaffRideDetailView(LoginRequiredMixin, StaffRequiredMixin, DetailView):
-    model = Ride
+    model = RideHistory
     template_name = 'dashboard/ride_detail.html'
     context_object_name = 'ride'
 
@@ -109,14 +114,15 @@ class StaffRideDetailView(LoginRequiredMixin, StaffRequiredMixin, DetailView):
 # ----------------------------
 # Ride Event List
 # ----------------------------
-class StaffEventListView(LoginRequiredMixin, StaffRequiredMixin, ListView):
-    model = RideEvent
+class StaffEventListView(LoginRequiredMixin, StaffRequiredMixin, CursorPaginationMixin, ListView):
+    model = RideHistoryEvent
     template_name = 'dashboard/event_list.html'
     context_object_name = 'events'
     paginate_by = 50
+    estimate_total = True
 
     def get_queryset(self):
-        return RideEvent.objects.all().select_related('ride').order_by('-created_at')
+        return RideHistoryEvent.objects.all().prefetch_related('ride').order_by('-created_at')
 
 
 # ----------------------------
@@ -149,6 +155,7 @@ class StaffCreateUserView(LoginRequiredMixin, StaffRequiredMixin, CreateView):
 
     def form_valid(self, form):
         response = super().form_valid(form)
+        record_opening_balance(self.object, note=f'Set by {self.request.user.username} on account creation')
         messages.success(
             self.request,
             f'User {self.object.username} created successfully with role {self.object.get_user_role_display()}!'
@@ -169,8 +176,7 @@ def add_balance(request, user_id):
         if form.is_valid():
             amount = form.cleaned_data['amount']
             note = form.cleaned_data['note']
-            user.balance += Decimal(amount)
-            user.save()
+            top_up(user, amount, note=note, key=form.cleaned_data['key'] or None)
             messages.success(
                 request,
                 f'Successfully added {amount} to {user.get_full_name()}\'s balance. New balance: {user.balance}'
@@ -192,14 +198,13 @@ def add_staff_balance(request):
                 messages.error(request, 'Please enter a positive amount.')
                 return redirect('staff-dashboard')
 
-            request.user.balance += amount
-            request.user.save()
+            top_up(request.user, amount)
 
             messages.success(
                 request,
                 f'Successfully added ₱{amount:.2f} to your balance. New balance: ₱{request.user.balance:.2f}'
             )
-        except (ValueError, decimal.InvalidOperation):
+        except (ValueError, InvalidOperation):
             messages.error(request, 'Invalid amount entered.')
 
     return redirect('staff-dashboard')
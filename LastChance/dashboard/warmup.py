@@ -0,0 +1,125 @@
+"""
+Getting a worker ready before its first request, and timing how long it takes.
+
+A fresh worker defers work until it is first needed. Each template is
+compiled the first time it is rendered, and from then on the cached loader
+keeps it for the life of the process. Every view module is imported the
+first time a URL is resolved. The static files manifest is read the first
+time a ``{% static %}`` URL is built. After a gunicorn restart, every worker
+pays all of this on its first few requests at the same moment, and that
+shows up as a latency spike.
+
+``warm_up()`` does all of that work up front. ``LastC/wsgi.py`` and
+``LastC/asgi.py`` call ``on_startup()`` once the application is built. It
+warms the worker up when ``WARM_UP_ON_STARTUP`` is set, which the
+production settings do. Either way it records how long the boot and each
+warm-up step took, for the log and the staff performance page. With
+gunicorn's ``--preload``, the warm-up runs once in the master and the
+workers inherit it when they fork.
+
+Templates are found by walking the ``DIRS`` of each template engine and the
+``templates`` folder of every app under ``BASE_DIR``. Django's own admin
+templates are left to load on first use. A template that fails to compile
+fails the boot instead of the first request that renders it, and so does a
+manifest storage with no manifest.
+"""
+import logging
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestFilesMixin, staticfiles_storage
+from django.core.exceptions import ImproperlyConfigured
+from django.template import engines
+from django.urls import get_resolver
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+Step = namedtuple('Step', ['name', 'seconds', 'count'])
+Startup = namedtuple('Startup', ['started_at', 'boot_seconds', 'total_seconds', 'steps', 'warmed'])
+
+_startup = None
+
+
+def template_names(engine):
+    """Names of the project's own templates that ``engine`` can load"""
+    base = Path(settings.BASE_DIR).resolve()
+    roots = [Path(directory) for directory in engine.dirs]
+    for app_config in apps.get_app_configs():
+        path = Path(app_config.path).resolve()
+        if path.is_relative_to(base):
+            roots.append(path / 'templates')
+    names = set()
+    for root in roots:
+        names.update(path.relative_to(root).as_posix() for path in root.rglob('*.html') if path.is_file())
+    return sorted(names)
+
+
+def warm_templates():
+    """Compile every project template into the engines' cached loaders; returns how many"""
+    count = 0
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        if engine is None:
+            continue
+        for name in template_names(engine):
+            engine.get_template(name)
+            count += 1
+    return count
+
+
+def warm_urls():
+    """Import every view module and build the reverse lookup tables; returns the number of URL names"""
+    resolver = get_resolver()
+    return len([key for key in resolver.reverse_dict if isinstance(key, str)])
+
+
+def warm_static_manifest():
+    """Read the static files manifest, if the storage keeps one; returns its number of entries"""
+    if not isinstance(staticfiles_storage, ManifestFilesMixin):
+        return 0
+    if not staticfiles_storage.hashed_files and staticfiles_storage.manifest_strict:
+        raise ImproperlyConfigured(
+            f'{staticfiles_storage.manifest_name} is missing or empty in {staticfiles_storage.location}; '
+            'run collectstatic before starting the server.'
+        )
+    return len(staticfiles_storage.hashed_files)
+
+
+STEPS = (
+    ('templates', warm_templates),
+    ('urls', warm_urls),
+    ('static manifest', warm_static_manifest),
+)
+
+
+def warm_up():
+    """Run every warm-up step, returning a Step per step"""
+    steps = []
+    for name, function in STEPS:
+        start = time.perf_counter()
+        count = function()
+        steps.append(Step(name, time.perf_counter() - start, count))
+    return steps
+
+
+def on_startup(started):
+    """Warm up if configured and record the startup timings; ``started`` is a perf_counter() reading"""
+    global _startup
+    boot = time.perf_counter() - started
+    warmed = getattr(settings, 'WARM_UP_ON_STARTUP', False)
+    steps = warm_up() if warmed else []
+    _startup = Startup(timezone.now(), boot, boot + sum(step.seconds for step in steps), steps, warmed)
+    logger.info(
+        'Worker ready in %.0f ms (boot %.0f ms%s)', _startup.total_seconds * 1000, boot * 1000,
+        ''.join(f', {step.name} {step.seconds * 1000:.0f} ms' for step in steps),
+    )
+    return _startup
+
+
+def startup_timings():
+    """This worker's Startup, or None when it was not started through LastC.wsgi or LastC.asgi"""
+    return _startup
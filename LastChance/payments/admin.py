@@ -0,0 +1,29 @@
+from django.contrib import admin
+from .models import BalanceLedgerEntry, BalanceSnapshot
+
+
+@admin.register(BalanceLedgerEntry)
+class BalanceLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'kind', 'amount', 'ride', 'note', 'created_at')
+    list_filter = ('kind', 'created_at')
+    search_fields = ('user__username', 'user__first_name', 'user__last_name', 'ride__id')
+    list_select_related = ('user', 'ride')
+    readonly_fields = ('user', 'amount', 'kind', 'ride', 'note', 'created_at')
+
+    # The ledger is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BalanceSnapshot)
+class BalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('user', 'balance', 'last_entry_id', 'taken_at', 'created_at')
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    readonly_fields = ('user', 'balance', 'last_entry_id', 'taken_at', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,47 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.backends import invalidate_cached_users
+from accounts.models import CustomUser
+from payments.models import BalanceLedgerEntry
+from payments.services import ledger_balances
+from payments.signals import balances_changed
+
+
+class Command(BaseCommand):
+    help = (
+        'Check every cached CustomUser.balance against the ledger (latest snapshot plus later entries). '
+        'Run it while no payments are in flight, or expect transient differences.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Overwrite mismatched cached balances with the ledger value.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        expected, _ = ledger_balances(chunk_size=chunk_size)
+
+        mismatched = []
+        users = CustomUser.objects.order_by().values_list('pk', 'username', 'balance').iterator(chunk_size=chunk_size)
+        for user_id, username, balance in users:
+            ledger = expected.get(user_id, Decimal('0.00'))
+            if balance != ledger:
+                mismatched.append(CustomUser(pk=user_id, balance=ledger))
+                self.stdout.write(f'{username} (id {user_id}): cached {balance}, ledger {ledger}')
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('All cached balances match the ledger.'))
+            return
+        if options['fix']:
+            CustomUser.objects.bulk_update(mismatched, ['balance'], batch_size=chunk_size)
+            invalidate_cached_users(*(user.pk for user in mismatched))
+            balances_changed.send(sender=BalanceLedgerEntry, user_ids=[user.pk for user in mismatched])
+            self.stdout.write(self.style.SUCCESS(f'Corrected {len(mismatched)} cached balance(s).'))
+            return
+        raise CommandError(f'{len(mismatched)} cached balance(s) differ from the ledger.')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from payments.services import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Record a balance snapshot for every user with ledger activity since their last snapshot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        created = take_snapshots(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Recorded {created} balance snapshot(s).'))
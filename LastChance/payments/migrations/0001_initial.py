@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-16 20:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('rides', '0003_ride_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, help_text="Signed change to the user's balance in PHP", max_digits=10)),
+                ('kind', models.CharField(choices=[('RIDE_PAYMENT', 'Ride Payment'), ('RIDE_EARNING', 'Ride Earning'), ('TOP_UP', 'Top-up')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('ride', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='rides.ride')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'balance ledger entries',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['user', 'id'], name='ledger_user_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-16 20:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='balanceledgerentry',
+            name='note',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='balanceledgerentry',
+            name='kind',
+            field=models.CharField(choices=[('RIDE_PAYMENT', 'Ride Payment'), ('RIDE_EARNING', 'Ride Earning'), ('TOP_UP', 'Top-up'), ('OPENING', 'Opening Balance'), ('ADJUSTMENT', 'Adjustment')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('last_entry_id', models.BigIntegerField(help_text='Last ledger entry included in this balance')),
+                ('taken_at', models.DateTimeField(help_text='Creation time of the last included ledger entry')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'last_entry_id'],
+                'indexes': [models.Index(fields=['user', '-last_entry_id'], name='snapshot_user_entry_idx'), models.Index(fields=['user', '-taken_at'], name='snapshot_user_taken_idx')],
+            },
+        ),
+    ]
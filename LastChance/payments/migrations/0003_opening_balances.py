@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Sum
+
+
+def record_opening_balances(apps, schema_editor):
+    """Ledger whatever part of each existing balance predates the ledger"""
+    CustomUser = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    BalanceLedgerEntry = apps.get_model('payments', 'BalanceLedgerEntry')
+
+    ledgered = dict(
+        BalanceLedgerEntry.objects.values('user').annotate(total=Sum('amount')).values_list('user', 'total')
+    )
+    openings = []
+    for user_id, balance in CustomUser.objects.values_list('pk', 'balance').iterator(chunk_size=2000):
+        difference = balance - ledgered.get(user_id, 0)
+        if difference:
+            openings.append(BalanceLedgerEntry(
+                user_id=user_id, amount=difference, kind='OPENING', note='Balance before the ledger existed'
+            ))
+    BalanceLedgerEntry.objects.bulk_create(openings, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_balance_snapshots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
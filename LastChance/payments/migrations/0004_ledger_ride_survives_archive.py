@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_opening_balances'),
+        ('rides', '0004_ride_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='balanceledgerentry',
+            name='ride',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='ledger_entries', to='rides.ride'),
+        ),
+    ]
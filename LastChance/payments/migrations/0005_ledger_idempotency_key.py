@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_ledger_ride_survives_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='balanceledgerentry',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
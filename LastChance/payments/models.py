@@ -0,0 +1,77 @@
+from django.db import models
+from django.conf import settings
+
+
+class BalanceLedgerEntry(models.Model):
+    KIND_CHOICES = [
+        ('RIDE_PAYMENT', 'Ride Payment'),
+        ('RIDE_EARNING', 'Ride Earning'),
+        ('TOP_UP', 'Top-up'),
+        ('OPENING', 'Opening Balance'),
+        ('ADJUSTMENT', 'Adjustment'),
+    ]
+
+    # The ledger is the money history, so a user with entries (anyone created with a
+    # balance, or who has paid or been paid) cannot be deleted, only deactivated
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.PROTECT,
+        related_name='ledger_entries'
+    )
+    amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        help_text="Signed change to the user's balance in PHP"
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Archiving moves finished rides out of rides_ride under the same id, so
+    # the entry keeps pointing at it rather than being cleared
+    ride = models.ForeignKey(
+        'rides.Ride',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='ledger_entries',
+        null=True,
+        blank=True
+    )
+    note = models.CharField(max_length=255, blank=True)
+    # Set by top-ups, so a request that is retried after it committed is not applied twice
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = 'balance ledger entries'
+        indexes = [
+            models.Index(fields=['user', 'id'], name='ledger_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.amount:+} for {self.user}"
+
+
+class BalanceSnapshot(models.Model):
+    """
+    A user's balance after applying every ledger entry up to and including
+    ``last_entry_id``. Historical balances are rebuilt from the nearest
+    snapshot rather than from the start of the ledger.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='balance_snapshots'
+    )
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_entry_id = models.BigIntegerField(help_text="Last ledger entry included in this balance")
+    taken_at = models.DateTimeField(help_text="Creation time of the last included ledger entry")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['user', 'last_entry_id']
+        indexes = [
+            models.Index(fields=['user', '-last_entry_id'], name='snapshot_user_entry_idx'),
+            models.Index(fields=['user', '-taken_at'], name='snapshot_user_taken_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} balance {self.balance} at entry {self.last_entry_id}"
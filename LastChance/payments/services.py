@@ -0,0 +1,164 @@
+from collections import namedtuple, defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from accounts.backends import invalidate_cached_users
+from accounts.models import CustomUser
+from .models import BalanceLedgerEntry, BalanceSnapshot
+from .signals import balances_changed
+
+Transfer = namedtuple('Transfer', ['payer_id', 'payee_id', 'amount', 'ride_id'])
+
+
+class InsufficientBalance(Exception):
+    def __init__(self, user_id):
+        self.user_id = user_id
+        super().__init__(f"User {user_id} has insufficient balance for this transfer.")
+
+
+def transfer_many(transfers, payer_kind='RIDE_PAYMENT', payee_kind='RIDE_EARNING'):
+    """
+    Apply a batch of transfers in one transaction and return the resulting
+    balances keyed by user id.
+
+    Each user's net change is applied with a single F() UPDATE; users whose
+    net change is negative are debited only if their balance covers it, so
+    concurrent completions and top-ups can never lose an update or overdraw
+    an account. Rows are touched in primary-key order to avoid deadlocks.
+    If any payer is short the whole batch is rolled back.
+    """
+    transfers = [Transfer(t.payer_id, t.payee_id, Decimal(t.amount), t.ride_id) for t in transfers]
+    net = defaultdict(Decimal)
+    entries = []
+    for t in transfers:
+        if t.amount <= 0:
+            raise ValueError('Transfer amounts must be positive.')
+        net[t.payer_id] -= t.amount
+        net[t.payee_id] += t.amount
+        entries.append(BalanceLedgerEntry(user_id=t.payer_id, amount=-t.amount, kind=payer_kind, ride_id=t.ride_id))
+        entries.append(BalanceLedgerEntry(user_id=t.payee_id, amount=t.amount, kind=payee_kind, ride_id=t.ride_id))
+
+    with transaction.atomic():
+        for user_id in sorted(net):
+            delta = net[user_id]
+            if not delta:
+                continue
+            users = CustomUser.objects.filter(pk=user_id)
+            if delta < 0:
+                users = users.filter(balance__gte=-delta)
+            if not users.update(balance=F('balance') + delta):
+                raise InsufficientBalance(user_id)
+        BalanceLedgerEntry.objects.bulk_create(entries)
+        invalidate_cached_users(*net)
+        balances_changed.send(sender=BalanceLedgerEntry, user_ids=list(net))
+        return dict(CustomUser.objects.filter(pk__in=net).values_list('pk', 'balance'))
+
+
+def transfer(payer, payee, amount, ride=None):
+    """Move ``amount`` from ``payer`` to ``payee``; returns the two new balances"""
+    balances = transfer_many([Transfer(payer.pk, payee.pk, amount, ride.pk if ride else None)])
+    payer.balance = balances[payer.pk]
+    payee.balance = balances[payee.pk]
+    return payer.balance, payee.balance
+
+
+def pay_for_rides(rides):
+    """Charge each ride's customer and pay its rider, all in one transaction"""
+    return transfer_many(Transfer(ride.customer_id, ride.rider_id, ride.price, ride.pk) for ride in rides)
+
+
+def top_up(user, amount, kind='TOP_UP', note='', key=None):
+    """
+    Credit ``amount`` to ``user`` without a read-modify-write; returns the new
+    balance. A top-up whose ``key`` is already in the ledger is not applied
+    again, so a retried request credits the user once.
+    """
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise ValueError('Top-up amounts must be positive.')
+    with transaction.atomic():
+        try:
+            # The entry goes first: its unique key makes a concurrent retry wait for this one, then fail
+            with transaction.atomic():
+                BalanceLedgerEntry.objects.create(
+                    user_id=user.pk, amount=amount, kind=kind, note=note, idempotency_key=key
+                )
+        except IntegrityError:
+            if key is None:
+                raise
+        else:
+            CustomUser.objects.filter(pk=user.pk).update(balance=F('balance') + amount)
+            invalidate_cached_users(user.pk)
+            balances_changed.send(sender=BalanceLedgerEntry, user_ids=[user.pk])
+        user.balance = CustomUser.objects.values_list('balance', flat=True).get(pk=user.pk)
+    return user.balance
+
+
+def record_opening_balance(user, note=''):
+    """Ledger the balance a new account was created with, so the ledger sums to it"""
+    if user.balance:
+        BalanceLedgerEntry.objects.create(user_id=user.pk, amount=user.balance, kind='OPENING', note=note)
+
+
+# ----------------------------
+# Snapshots and historical balances
+# ----------------------------
+def _latest_snapshot_entry_id():
+    """Subquery: last ledger entry id covered by the user's newest snapshot"""
+    return Subquery(
+        BalanceSnapshot.objects.filter(user=OuterRef('user')).order_by('-last_entry_id').values('last_entry_id')[:1]
+    )
+
+
+def ledger_balances(chunk_size=2000, upto_entry_id=None):
+    """
+    Rebuild every user's balance from their newest snapshot plus the ledger
+    entries after it, streaming those entries in chunks.
+
+    Returns ``(balances, last_entries)``: balances for every user with a
+    snapshot or a ledger entry, and for users with entries newer than their
+    snapshot, the ``(id, created_at)`` of the last entry read.
+    """
+    balances = defaultdict(Decimal)
+    newest = BalanceSnapshot.objects.filter(last_entry_id=_latest_snapshot_entry_id())
+    for user_id, balance in newest.values_list('user_id', 'balance').iterator(chunk_size=chunk_size):
+        balances[user_id] = balance
+
+    entries = BalanceLedgerEntry.objects.alias(
+        floor=Coalesce(_latest_snapshot_entry_id(), Value(0))
+    ).filter(id__gt=F('floor')).order_by()
+    if upto_entry_id is not None:
+        entries = entries.filter(id__lte=upto_entry_id)
+
+    last_entries = {}
+    rows = entries.values_list('user_id', 'amount', 'id', 'created_at').iterator(chunk_size=chunk_size)
+    for user_id, amount, entry_id, created_at in rows:
+        balances[user_id] += amount
+        if entry_id > last_entries.get(user_id, (0, None))[0]:
+            last_entries[user_id] = (entry_id, created_at)
+    return dict(balances), last_entries
+
+
+def take_snapshots(chunk_size=2000):
+    """Snapshot the balance of every user with ledger activity since their last snapshot"""
+    upto = BalanceLedgerEntry.objects.order_by('-id').values_list('id', flat=True).first()
+    if upto is None:
+        return 0
+    balances, last_entries = ledger_balances(chunk_size=chunk_size, upto_entry_id=upto)
+    snapshots = [
+        BalanceSnapshot(user_id=user_id, balance=balances[user_id], last_entry_id=entry_id, taken_at=created_at)
+        for user_id, (entry_id, created_at) in last_entries.items()
+    ]
+    BalanceSnapshot.objects.bulk_create(snapshots, batch_size=chunk_size)
+    return len(snapshots)
+
+
+def balance_at(user, when):
+    """The user's balance as of ``when``, read from the nearest earlier snapshot"""
+    snapshot = BalanceSnapshot.objects.filter(user=user, taken_at__lte=when).order_by('-last_entry_id').first()
+    base, floor = (snapshot.balance, snapshot.last_entry_id) if snapshot else (Decimal('0.00'), 0)
+    later = BalanceLedgerEntry.objects.filter(user=user, id__gt=floor, created_at__lte=when)
+    return base + (later.aggregate(total=Sum('amount'))['total'] or 0)
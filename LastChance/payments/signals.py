@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent inside the transaction that moved the balances, with ``user_ids``; receivers
+# that cache anything showing a balance should drop it once that transaction commits
+balances_changed = Signal()
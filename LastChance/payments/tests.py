@@ -0,0 +1,199 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.db import connections, OperationalError
+from django.db.models import Sum
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase, Client
+from django.utils import timezone
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from rides.models import Ride
+from .models import BalanceLedgerEntry, BalanceSnapshot
+from .services import (
+    transfer, pay_for_rides, top_up, record_opening_balance, take_snapshots, balance_at, InsufficientBalance
+)
+
+
+def make_user(username, role, balance='0.00', **extra):
+    user = CustomUser(username=username, user_role=role, balance=Decimal(balance), **extra)
+    user.set_unusable_password()
+    user.save()
+    return user
+
+
+def make_ride(customer, rider, price='100.00', status='ONGOING'):
+    return Ride.objects.create(
+        customer=customer, rider=rider, pickup='CLARK_MAIN', destination='SM_CLARK',
+        total_distance=Decimal('4.00'), price=Decimal(price), status=status,
+    )
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        self.customer = make_user('customer', 'CUSTOMER', '150.00')
+        self.rider = make_user('rider', 'RIDER', '10.00')
+
+    def test_transfer_moves_funds_and_records_ledger(self):
+        ride = make_ride(self.customer, self.rider)
+        self.assertEqual(transfer(self.customer, self.rider, Decimal('100.00'), ride), (Decimal('50.00'), Decimal('110.00')))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.balance, Decimal('50.00'))
+        self.assertEqual(
+            list(BalanceLedgerEntry.objects.values_list('user_id', 'amount', 'kind', 'ride_id')),
+            [(self.customer.pk, Decimal('-100.00'), 'RIDE_PAYMENT', ride.pk),
+             (self.rider.pk, Decimal('100.00'), 'RIDE_EARNING', ride.pk)]
+        )
+
+    def test_insufficient_balance_changes_nothing(self):
+        with self.assertRaises(InsufficientBalance):
+            transfer(self.customer, self.rider, Decimal('150.01'))
+        self.customer.refresh_from_db()
+        self.rider.refresh_from_db()
+        self.assertEqual((self.customer.balance, self.rider.balance), (Decimal('150.00'), Decimal('10.00')))
+        self.assertFalse(BalanceLedgerEntry.objects.exists())
+
+    def test_batch_is_all_or_nothing(self):
+        rides = [make_ride(self.customer, self.rider, '60.00') for _ in range(3)]
+        with self.assertRaises(InsufficientBalance):
+            pay_for_rides(rides)
+        self.assertFalse(BalanceLedgerEntry.objects.exists())
+
+        with self.assertNumQueries(6):
+            # savepoint, customer UPDATE, rider UPDATE, ledger INSERT, balances SELECT, release
+            balances = pay_for_rides(rides[:2])
+        self.assertEqual(balances, {self.customer.pk: Decimal('30.00'), self.rider.pk: Decimal('130.00')})
+
+
+class LedgerSnapshotTests(TestCase):
+    def setUp(self):
+        self.customer = make_user('customer', 'CUSTOMER', '100.00')
+        record_opening_balance(self.customer)
+        self.rider = make_user('rider', 'RIDER')
+
+    def test_historical_balance_from_snapshot(self):
+        transfer(self.customer, self.rider, Decimal('30.00'))
+        self.assertEqual(take_snapshots(), 2)
+        self.assertEqual(take_snapshots(), 0)
+        top_up(self.customer, Decimal('5.00'), note='Promo credit')
+        midpoint = timezone.now()
+        BalanceLedgerEntry.objects.filter(kind='TOP_UP').update(created_at=midpoint - timedelta(seconds=1))
+        transfer(self.customer, self.rider, Decimal('20.00'))
+
+        self.assertEqual(balance_at(self.customer, midpoint), Decimal('75.00'))
+        self.assertEqual(balance_at(self.customer, timezone.now()), Decimal('55.00'))
+        self.assertEqual(balance_at(self.rider, midpoint), Decimal('30.00'))
+        self.assertEqual(BalanceLedgerEntry.objects.get(kind='TOP_UP').note, 'Promo credit')
+
+        # The newest snapshot spares reading the entries it covers
+        self.assertEqual(take_snapshots(), 2)
+        self.assertEqual(BalanceSnapshot.objects.filter(user=self.customer).latest('last_entry_id').balance, Decimal('55.00'))
+
+    def test_reconcile_detects_and_fixes_drift(self):
+        transfer(self.customer, self.rider, Decimal('30.00'))
+        take_snapshots()
+        call_command('reconcile_balances', stdout=StringIO())
+
+        CustomUser.objects.filter(pk=self.rider.pk).update(balance=Decimal('999.00'))
+        with self.assertRaises(CommandError):
+            call_command('reconcile_balances', '--chunk-size', '1', stdout=StringIO())
+        call_command('reconcile_balances', '--fix', stdout=StringIO())
+        self.rider.refresh_from_db()
+        self.assertEqual(self.rider.balance, Decimal('30.00'))
+
+    def test_add_balance_view_keeps_note(self):
+        staff = make_user('staff', 'STAFF', is_staff=True)
+        self.client.force_login(staff)
+        self.client.post(reverse('staff-add-balance', args=[self.rider.pk]), {'amount': '12.50', 'note': 'Cash deposit'})
+        entry = BalanceLedgerEntry.objects.get(kind='TOP_UP')
+        self.assertEqual((entry.user_id, entry.amount, entry.note), (self.rider.pk, Decimal('12.50'), 'Cash deposit'))
+
+    def test_top_up_with_a_used_key_is_not_applied_again(self):
+        self.assertEqual(top_up(self.rider, Decimal('10.00'), key='deposit-1'), Decimal('10.00'))
+        self.assertEqual(top_up(self.rider, Decimal('10.00'), key='deposit-1'), Decimal('10.00'))
+        self.assertEqual(top_up(self.rider, Decimal('10.00')), Decimal('20.00'))
+        self.assertEqual(top_up(self.rider, Decimal('10.00')), Decimal('30.00'))
+        self.assertEqual(BalanceLedgerEntry.objects.filter(kind='TOP_UP').count(), 3)
+
+        staff = make_user('staff', 'STAFF', is_staff=True)
+        self.client.force_login(staff)
+        url = reverse('staff-add-balance', args=[self.rider.pk])
+        key = self.client.get(url).context['form']['key'].value()
+        for _ in range(2):
+            self.client.post(url, {'amount': '5.00', 'key': key})
+        self.rider.refresh_from_db()
+        self.assertEqual(self.rider.balance, Decimal('35.00'))
+
+
+class ConcurrentCompletionTests(TransactionTestCase):
+    """Complete rides and top up a rider's balance from many threads at once"""
+    THREADS = 8
+
+    def test_total_balance_is_conserved(self):
+        price = Decimal('50.00')
+        staff = make_user('staff', 'STAFF', is_staff=True)
+        customer = make_user('customer', 'CUSTOMER', '200.00')
+        riders = [make_user(f'rider{i}', 'RIDER') for i in range(self.THREADS)]
+        rides = [make_ride(customer, rider, price) for rider in riders]
+        initial_total = CustomUser.objects.aggregate(total=Sum('balance'))['total']
+        initial_balances = dict(CustomUser.objects.values_list('pk', 'balance'))
+
+        barrier = threading.Barrier(self.THREADS * 2, timeout=30)
+        results = []
+        top_ups = []
+
+        def post(client, url, data, responses):
+            barrier.wait()
+            try:
+                for _ in range(100):
+                    try:
+                        responses.append(client.post(url, data).status_code)
+                        return
+                    except OperationalError:
+                        # SQLite's shared-cache test database reports lock conflicts instead of waiting
+                        time.sleep(random.uniform(0, 0.02))
+            finally:
+                connections.close_all()
+
+        threads = []
+        for ride in rides:
+            client = Client()
+            client.force_login(staff)
+            url = reverse('update-ride-status', args=[ride.pk])
+            threads.append(threading.Thread(target=post, args=(client, url, {'status': 'COMPLETED'}, results)))
+        for i in range(self.THREADS):
+            client = Client()
+            client.force_login(staff)
+            url = reverse('staff-add-balance', args=[riders[0].pk])
+            data = {'amount': '10.00', 'key': f'top-up-{i}'}
+            threads.append(threading.Thread(target=post, args=(client, url, data, top_ups)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        completed = Ride.objects.filter(status='COMPLETED').count()
+        customer.refresh_from_db()
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(len(top_ups), self.THREADS)
+        # The customer can afford exactly four of the eight rides
+        self.assertEqual(completed, 4)
+        self.assertEqual(customer.balance, Decimal('0.00'))
+        # A request retried after its top-up committed carries the same key, so it is not applied twice
+        topped_up = BalanceLedgerEntry.objects.filter(kind='TOP_UP').aggregate(total=Sum('amount'))['total']
+        self.assertEqual(topped_up, Decimal('10.00') * self.THREADS)
+        self.assertEqual(CustomUser.objects.aggregate(total=Sum('balance'))['total'], initial_total + topped_up)
+        self.assertEqual(
+            CustomUser.objects.filter(user_role='RIDER').aggregate(total=Sum('balance'))['total'],
+            price * completed + topped_up
+        )
+        for user in CustomUser.objects.all():
+            ledger_total = user.ledger_entries.aggregate(total=Sum('amount'))['total'] or 0
+            self.assertEqual(user.balance, initial_balances[user.pk] + ledger_total)
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Ride, RideEvent
+from .models import Ride, RideEvent, UserRideStats
 
 class RideEventInline(admin.TabularInline):
     model = RideEvent
@@ -17,6 +17,7 @@ class RideAdmin(admin.ModelAdmin):
                     'customer__username', 'customer__first_name', 'customer__last_name',
                     'pickup', 'destination')
     readonly_fields = ('created_at', 'updated_at')
+    list_select_related = ('customer', 'rider')
     inlines = [RideEventInline]
 
     fieldsets = (
@@ -40,15 +41,17 @@ class RideAdmin(admin.ModelAdmin):
     get_customer.short_description = 'Customer'
 
     def get_rider(self, obj):
+        if obj.rider is None:
+            return '-'
         return f"{obj.rider.get_full_name()} ({obj.rider.username})"
     get_rider.short_description = 'Rider'
 
     def get_locations(self, obj):
-        return format_html(f"From: <b>{obj.get_pickup_display()}</b><br>To: <b>{obj.get_destination_display()}</b>")
+        return format_html("From: <b>{}</b><br>To: <b>{}</b>", obj.get_pickup_display(), obj.get_destination_display())
     get_locations.short_description = 'Route'
 
     def get_price(self, obj):
-        return format_html('₱{:.2f}', obj.price)
+        return format_html('₱{}', f'{obj.price:.2f}')
     get_price.short_description = 'Price'
 
     def get_status_badge(self, obj):
@@ -71,6 +74,7 @@ class RideEventAdmin(admin.ModelAdmin):
     list_display = ('ride', 'step', 'get_step_badge', 'description', 'created_at')
     list_filter = ('step', 'created_at', 'ride__status')
     search_fields = ('ride__id', 'description', 'ride__customer__username', 'ride__rider__username')
+    list_select_related = ('ride',)
     readonly_fields = ('created_at',)
 
     def get_step_badge(self, obj):
@@ -88,3 +92,17 @@ class RideEventAdmin(admin.ModelAdmin):
             obj.get_step_display()
         )
     get_step_badge.short_description = 'Event Type'
+
+@admin.register(UserRideStats)
+class UserRideStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'completed_as_rider', 'active_as_rider', 'total_earnings',
+                    'rides_as_customer', 'completed_as_customer', 'total_spent', 'last_ride_at')
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'user__first_name', 'user__last_name')
+
+    # Maintained by Ride.save(); use the rebuild_ride_stats command to correct drift
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
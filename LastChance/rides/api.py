@@ -0,0 +1,219 @@
+"""
+Read-only JSON API over rides and their events for the mobile clients.
+
+Responses are built from ``values()`` projections rather than model
+instances: each API field names the columns it needs, so a request for
+``?fields=id,status`` selects two columns and joins nothing. Values are
+converted to JSON primitives while the rows are read, which keeps the
+encoder on its C fast path.
+
+Every response carries an ``ETag`` derived from the rides' ``updated_at``,
+and single rides and timelines also a ``Last-Modified``. A client that sends
+them back gets ``304 Not Modified`` with no body, and the payload is never
+serialized. The list has no ``Last-Modified``: a ride deleted or archived
+off it leaves the newest timestamp where it was, so only the tag notices.
+
+Rides and events are read through RideHistory and RideHistoryEvent, so
+archived rides stay available under the same ids.
+"""
+import hashlib
+from collections import namedtuple
+
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .models import Ride, RideEvent, RideHistory, RideHistoryEvent
+from .pagination import CursorPaginator, InvalidCursor
+
+ApiField = namedtuple('ApiField', ['columns', 'render'])
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def column(name, convert=None):
+    """An API field read straight from one column"""
+    if convert is None:
+        return ApiField((name,), lambda row: row[name])
+    return ApiField((name,), lambda row: None if row[name] is None else convert(row[name]))
+
+
+def display(name, choices):
+    labels = dict(choices)
+    return ApiField((name,), lambda row: labels.get(row[name], row[name]))
+
+
+def full_name(party):
+    """The party's get_full_name(), or None for a ride with no rider yet"""
+    columns = tuple(f'{party}__{name}' for name in ('first_name', 'middle_name', 'last_name'))
+
+    def render(row):
+        first, middle, last = (row[name] for name in columns)
+        if first is None and last is None:
+            return None
+        return ' '.join(part for part in (first, middle, last) if part)
+    return ApiField(columns, render)
+
+
+def isoformat(value):
+    return timezone.localtime(value).isoformat()
+
+
+class Serializer:
+    """Projects a queryset onto the requested API fields"""
+
+    def __init__(self, fields, always=()):
+        self.fields = fields
+        # Columns the view needs for itself (cursors, validators) whatever the client asks for
+        self.always = tuple(always)
+
+    def parse_fields(self, param):
+        """The field names in a ``fields`` query parameter, defaulting to all of them"""
+        if not param:
+            return list(self.fields)
+        names = [name.strip() for name in param.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown or not names:
+            raise InvalidFields(f'Unknown fields: {", ".join(unknown)}. Choose from {", ".join(self.fields)}.')
+        return list(dict.fromkeys(names))
+
+    def project(self, queryset, names):
+        columns = dict.fromkeys(self.always)
+        for name in names:
+            columns.update(dict.fromkeys(self.fields[name].columns))
+        return queryset.values(*columns)
+
+    def render(self, row, names):
+        return {name: self.fields[name].render(row) for name in names}
+
+
+rides = Serializer({
+    'id': column('id'),
+    'status': column('status'),
+    'status_display': display('status', Ride.STATUS_CHOICES),
+    'pickup': column('pickup'),
+    'pickup_display': display('pickup', Ride.LOCATION_CHOICES),
+    'destination': column('destination'),
+    'destination_display': display('destination', Ride.LOCATION_CHOICES),
+    'total_distance': column('total_distance', str),
+    'price': column('price', str),
+    'customer': column('customer_id'),
+    'customer_name': full_name('customer'),
+    'rider': column('rider_id'),
+    'rider_name': full_name('rider'),
+    'created_at': column('created_at', isoformat),
+    'updated_at': column('updated_at', isoformat),
+}, always=('id', 'created_at', 'updated_at'))
+
+events = Serializer({
+    'id': column('id'),
+    'step': column('step'),
+    'step_display': display('step', RideEvent.STEP_CHOICES),
+    'description': column('description'),
+    'created_at': column('created_at', isoformat),
+}, always=('id', 'created_at'))
+
+
+# Validators and responses
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def conditional_json(request, etag, last_modified, build):
+    """
+    Answer 304 if the client's ``If-None-Match``/``If-Modified-Since`` still
+    match, otherwise the JSON of ``build()``. Either way the response carries
+    the validators and must be revalidated before reuse.
+    """
+    etag = quote_etag(etag)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = JsonResponse(build(), json_dumps_params={'separators': (',', ':')})
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+# Views
+
+@login_required
+@require_safe
+def ride_list(request):
+    """The rides on the user's ride list, newest first, one cursor page at a time"""
+    try:
+        names = rides.parse_fields(request.GET.get('fields'))
+    except InvalidFields as e:
+        return error(str(e))
+
+    queryset = RideHistory.objects.visible_to(request.user)
+    status = request.GET.get('status')
+    if status:
+        queryset = queryset.filter(status=status)
+    limit = request.GET.get('limit', '20')
+    if not limit.isdigit() or not 1 <= int(limit) <= 100:
+        return error('limit must be between 1 and 100.')
+    paginator = CursorPaginator(rides.project(queryset, names), int(limit))
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor as e:
+        return error(str(e))
+
+    rows = page.object_list
+    etag = make_etag(request.user.pk, request.get_full_path(), [(row['id'], row['updated_at']) for row in rows])
+    # No Last-Modified: If-Modified-Since alone would keep answering 304 after a ride leaves the list
+    return conditional_json(request, etag, None, lambda: {
+        'results': [rides.render(row, names) for row in rows],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@login_required
+@require_safe
+def ride_detail(request, pk):
+    try:
+        names = rides.parse_fields(request.GET.get('fields'))
+    except InvalidFields as e:
+        return error(str(e))
+
+    row = rides.project(RideHistory.objects.involving(request.user).filter(pk=pk), names).first()
+    if row is None:
+        raise Http404('No ride found.')
+    etag = make_etag(pk, row['updated_at'], names)
+    return conditional_json(request, etag, row['updated_at'], lambda: rides.render(row, names))
+
+
+@login_required
+@require_safe
+def ride_events(request, pk):
+    """A ride's timeline; changes whenever the ride or any of its events does"""
+    try:
+        names = events.parse_fields(request.GET.get('fields'))
+    except InvalidFields as e:
+        return error(str(e))
+
+    updated_at = RideHistory.objects.involving(request.user).filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        raise Http404('No ride found.')
+    rows = list(events.project(RideHistoryEvent.objects.filter(ride_id=pk), names).order_by('created_at', 'id'))
+
+    # Events carry no updated_at of their own, so their content goes into the tag
+    etag = make_etag(pk, updated_at, names, [tuple(row.values()) for row in rows])
+    last_modified = max([updated_at, *(row['created_at'] for row in rows)])
+    return conditional_json(request, etag, last_modified, lambda: {
+        'ride': pk,
+        'results': [events.render(row, names) for row in rows],
+    })
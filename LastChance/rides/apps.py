@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class RidesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rides'
+
+    def ready(self):
+        # Load the landmark distance matrix once at startup rather than on the first booking
+        from . import routing
+        routing.distance_matrix()
@@ -0,0 +1,96 @@
+"""
+Moving finished rides out of the hot tables.
+
+Nearly every write and every live lookup (pending feed, active rides, the
+rider dashboard) touches only rides that are still in progress, yet those
+are a thin slice of rides_ride once it holds a year of history. Completed
+and cancelled rides that have not changed for ``RIDE_ARCHIVE_AFTER_DAYS``
+are moved, with their events, into rides_archivedride and
+rides_archivedrideevent, so the hot tables and their indexes stay the size
+of recent activity.
+
+Pages that show history read RideHistory and RideHistoryEvent, views over
+both halves, so an archived ride looks exactly like a live one there and
+keeps its id. Archiving leaves UserRideStats alone: the totals count every
+ride, wherever it is stored.
+
+Each batch is copied with ``INSERT ... SELECT`` and then deleted in one
+transaction, so a ride is always in exactly one of the two tables and a
+failure part-way leaves the batches before it archived. The batch is locked
+and its status checked again first, so a ride that changed since its id
+was picked stays where it is.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .bulk import Progress
+from .models import ArchivedRide, ArchivedRideEvent, Ride, RideEvent
+
+FINISHED = ('COMPLETED', 'CANCELLED')
+
+RIDE_COLUMNS = ('id', 'rider_id', 'customer_id', 'pickup', 'destination', 'total_distance', 'price', 'status',
+                'created_at', 'updated_at')
+EVENT_COLUMNS = ('id', 'ride_id', 'step', 'description', 'created_at')
+
+
+def archive_cutoff(days=None):
+    """Rides last updated before this moment are due for archiving"""
+    if days is None:
+        days = getattr(settings, 'RIDE_ARCHIVE_AFTER_DAYS', 90)
+    return timezone.now() - timezone.timedelta(days=days)
+
+
+def archivable(before):
+    return Ride.objects.filter(status__in=FINISHED, updated_at__lt=before)
+
+
+def _copy_sql(source, target, columns, key, count, stamped=False):
+    """INSERT ... SELECT of ``source`` rows whose ``key`` is one of ``count`` parameters"""
+    qn = connection.ops.quote_name
+    names = ', '.join(qn(column) for column in columns)
+    placeholders = ', '.join(['%s'] * count)
+    # A stamped copy takes archived_at from the first parameter
+    into, values = (f'{names}, {qn("archived_at")}', f'{names}, %s') if stamped else (names, names)
+    return (
+        f'INSERT INTO {qn(target._meta.db_table)} ({into}) '
+        f'SELECT {values} FROM {qn(source._meta.db_table)} WHERE {qn(key)} IN ({placeholders})'
+    )
+
+
+def _archive_batch(ids, now):
+    with transaction.atomic():
+        # Lock the batch and drop any ride that has moved on since it was picked
+        ids = list(
+            Ride.objects.select_for_update().filter(pk__in=ids, status__in=FINISHED).values_list('pk', flat=True)
+        )
+        if not ids:
+            return 0
+        with connection.cursor() as cursor:
+            archived_at = connection.ops.adapt_datetimefield_value(now)
+            cursor.execute(
+                _copy_sql(Ride, ArchivedRide, RIDE_COLUMNS, 'id', len(ids), stamped=True), [archived_at, *ids]
+            )
+            cursor.execute(_copy_sql(RideEvent, ArchivedRideEvent, EVENT_COLUMNS, 'ride_id', len(ids)), ids)
+        # _raw_delete skips the cascade collector: the events are gone already and nothing else
+        # has a constraint on rides_ride (ledger entries keep pointing at the id on purpose)
+        RideEvent.objects.filter(ride_id__in=ids)._raw_delete(RideEvent.objects.db)
+        Ride.objects.filter(pk__in=ids)._raw_delete(Ride.objects.db)
+    return len(ids)
+
+
+def archive_finished_rides(before=None, batch_size=1000, progress=None):
+    """Move finished rides last updated before ``before`` into the archive tables; returns how many moved"""
+    before = before or archive_cutoff()
+    progress = progress or Progress()
+    now = timezone.now()
+    last_id = 0
+    while True:
+        ids = list(
+            archivable(before).filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        progress.add(_archive_batch(ids, now))
+        last_id = ids[-1]
+    return progress.rows
@@ -0,0 +1,102 @@
+"""
+Async versions of the read-heavy ride pages, routed instead of their
+class-based counterparts when ``settings.ASYNC_VIEWS`` is on (the default
+under ``LastC.asgi``).
+
+They render the same templates with the same context, but await the ORM
+rather than holding a worker thread for the whole request. Everything a
+template touches is fetched up front, because templates cannot run queries
+from an async context.
+"""
+import asyncio
+
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.shortcuts import render
+
+from .feed import aget_pending_page
+from .models import Ride, RideHistory, UserRideStats
+from .pagination import CursorPaginator, InvalidCursor
+from .views import RideListView, RiderDashboardView
+from . import streams
+
+
+async def resolve_user(request):
+    """Load the user without blocking and pin it on the request for the auth context processor"""
+    user = await request.auser()
+    request.user = user
+    return user
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+def page_context(paginator, page, context_object_name):
+    """The pagination context ListView would build"""
+    return {
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        'object_list': page.object_list,
+        context_object_name: page.object_list,
+    }
+
+
+@login_required
+async def ride_list(request):
+    user = await resolve_user(request)
+    paginator = CursorPaginator(RideHistory.objects.for_list().visible_to(user), RideListView.paginate_by)
+    try:
+        page = await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor as e:
+        raise Http404(str(e))
+
+    context = page_context(paginator, page, RideListView.context_object_name)
+    context['user_role'] = user.user_role
+    return render(request, RideListView.template_name, context)
+
+
+@login_required
+async def ride_detail(request, pk):
+    user = await resolve_user(request)
+    ride = await RideHistory.objects.with_parties().involving(user).filter(pk=pk).afirst()
+    if ride is None:
+        raise Http404('No ride found matching the query')
+
+    events = await alist(ride.events.order_by('created_at'))
+    return render(request, 'rides/ride_detail.html', {
+        'object': ride, 'ride': ride, 'events': events, 'live_updates': streams.enabled(),
+    })
+
+
+@login_required
+async def rider_dashboard(request):
+    user = await resolve_user(request)
+    if user.user_role != 'RIDER':
+        raise PermissionDenied
+
+    paginator = CursorPaginator(
+        Ride.objects.for_list().filter(status='PENDING', rider__isnull=True), RiderDashboardView.paginate_by
+    )
+    active_rides = Ride.objects.for_list().filter(
+        rider=user, status__in=['ACCEPTED', 'ONGOING']
+    ).order_by('-created_at')
+    try:
+        page, active, stats = await asyncio.gather(
+            aget_pending_page(paginator, request.GET.get('cursor')),
+            alist(active_rides),
+            UserRideStats.afor_user(user),
+        )
+    except InvalidCursor as e:
+        raise Http404(str(e))
+
+    context = page_context(paginator, page, RiderDashboardView.context_object_name)
+    context.update({
+        'active_rides': active,
+        'total_completed': stats.completed_as_rider,
+        'total_earnings': stats.total_earnings,
+        'live_updates': streams.enabled(),
+    })
+    return render(request, RiderDashboardView.template_name, context)
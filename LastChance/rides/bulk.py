@@ -0,0 +1,276 @@
+"""
+Streaming export and import of Ride and RideEvent rows as CSV or JSONL.
+
+Exports read ``values_list()`` rows through ``iterator(chunk_size=...)``
+and write each one as it arrives, so memory stays flat however many rows
+there are. Imports parse one line at a time and insert with ``bulk_create``
+in batches, each batch in its own transaction, so a failure part-way keeps
+everything before it; rerun with ``ignore_conflicts`` to carry on.
+
+Imported rows keep their ids and timestamps. ``bulk_create`` bypasses
+``Ride.save()`` and ``RideEvent.save()``, so importing neither maintains
+UserRideStats nor replays event side effects; ``import_rides`` rebuilds the
+stats once at the end instead. Files ending in ``.gz`` are compressed and
+``-`` means stdin/stdout.
+
+Exports read RideHistory and RideHistoryEvent, so archived rides are
+included; the file does not say which rows were archived. Imports always
+write to the live tables, where ``archive_rides`` picks finished rides up
+again. A row of a ride the archive already holds counts as a conflict: the import
+stops at it, or skips it with ``ignore_conflicts``, rather than putting a
+second copy of the ride in the live table.
+"""
+import contextlib
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from accounts.models import CustomUser
+from .models import ArchivedRide, Ride, RideEvent, RideHistory, RideHistoryEvent
+
+FORMATS = ('csv', 'jsonl')
+
+RIDE_COLUMNS = ('id', 'customer_id', 'rider_id', 'pickup', 'destination', 'total_distance', 'price', 'status',
+                'created_at', 'updated_at')
+EVENT_COLUMNS = ('id', 'ride_id', 'step', 'description', 'created_at')
+
+COLUMNS = {
+    Ride: RIDE_COLUMNS, RideHistory: RIDE_COLUMNS,
+    RideEvent: EVENT_COLUMNS, RideHistoryEvent: EVENT_COLUMNS,
+}
+
+
+class BulkFormatError(ValueError):
+    def __init__(self, line, message):
+        self.line = line
+        super().__init__(f'Line {line}: {message}')
+
+
+def guess_format(path):
+    """'csv' or 'jsonl' from the file name, ignoring a trailing .gz"""
+    name = path[:-3] if path.endswith('.gz') else path
+    for fmt in FORMATS:
+        if name.endswith(f'.{fmt}'):
+            return fmt
+    return None
+
+
+@contextlib.contextmanager
+def open_text(path, mode):
+    """Open ``path`` for text ``mode`` ('r' or 'w'); '-' is stdin/stdout and .gz is compressed"""
+    if path == '-':
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        wrapper = io.TextIOWrapper(stream.buffer, encoding='utf-8', newline='')
+        try:
+            yield wrapper
+        finally:
+            if mode == 'w':
+                wrapper.flush()
+            # Leave the process's own stream open
+            wrapper.detach()
+        return
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, f'{mode}t', encoding='utf-8', newline='') as f:
+        yield f
+
+
+class Progress:
+    """Counts rows and reports rows/sec every ``every`` rows"""
+
+    def __init__(self, report=None, every=100_000):
+        self.report = report
+        self.every = every
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def add(self, count=1):
+        before = self.rows
+        self.rows += count
+        if self.report and self.every and self.rows // self.every != before // self.every:
+            self.report(f'{self.rows} rows, {self.rate:,.0f} rows/sec')
+
+
+# Export
+
+def _encoder(model, column):
+    """Turns a column's Python value into its text form (None stays None)"""
+    field = model._meta.get_field(column)
+    internal_type = field.get_internal_type()
+    if internal_type == 'DateTimeField':
+        return lambda value: None if value is None else value.isoformat()
+    if internal_type == 'DecimalField':
+        return lambda value: None if value is None else str(value)
+    return None
+
+
+def export_rows(queryset, fmt, stream, chunk_size=2000, progress=None):
+    """Write every row of ``queryset`` to ``stream``; returns the row count"""
+    model = queryset.model
+    columns = COLUMNS[model]
+    encoders = [(i, encode) for i, encode in enumerate(_encoder(model, c) for c in columns) if encode]
+    progress = progress or Progress()
+
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(columns)
+        write = writer.writerow
+    else:
+        dumps = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+
+        def write(row):
+            stream.write(dumps(dict(zip(columns, row))))
+            stream.write('\n')
+
+    rows = queryset.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+    for row in rows:
+        if encoders:
+            row = list(row)
+            for i, encode in encoders:
+                row[i] = encode(row[i])
+        write(row)
+        progress.add()
+    return progress.rows
+
+
+# Import
+
+def read_rows(stream, fmt):
+    """Yield ``(line number, {column: raw value})`` from a CSV or JSONL stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                raise BulkFormatError(line_number, f'invalid JSON ({e.msg}).')
+
+
+def _decoders(model):
+    columns = COLUMNS[model]
+    fields = {column: model._meta.get_field(column) for column in columns}
+
+    def decode(line_number, raw):
+        values = {}
+        for column in columns:
+            if column not in raw:
+                raise BulkFormatError(line_number, f'missing column {column!r}.')
+            value = raw[column]
+            field = fields[column]
+            if value in ('', None):
+                if not field.null:
+                    raise BulkFormatError(line_number, f'{column} may not be empty.')
+                values[column] = None
+                continue
+            try:
+                values[column] = field.to_python(value)
+            except Exception as e:
+                raise BulkFormatError(line_number, f'bad {column} {value!r} ({e}).')
+        return model(**values)
+    return decode
+
+
+@contextlib.contextmanager
+def keep_timestamps(model):
+    """Stop auto_now/auto_now_add from overwriting imported timestamps"""
+    fields = [
+        f for f in model._meta.concrete_fields
+        if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)
+    ]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def _check_references(model, batch, first_line):
+    """Fail the batch early, with a readable error, if it points at users or rides that do not exist"""
+    if model is Ride:
+        wanted = {ride.customer_id for ride in batch} | {ride.rider_id for ride in batch if ride.rider_id}
+        target = CustomUser
+    else:
+        wanted = {event.ride_id for event in batch}
+        target = Ride
+    missing = wanted - set(target.objects.filter(pk__in=wanted).values_list('pk', flat=True))
+    if model is RideEvent:
+        # Events of an archived ride are not missing their ride; _skip_archived deals with them
+        missing -= set(ArchivedRide.objects.filter(pk__in=missing).values_list('pk', flat=True))
+    if missing:
+        sample = ', '.join(map(str, sorted(missing)[:5]))
+        raise BulkFormatError(
+            first_line, f'batch refers to {len(missing)} missing {target._meta.verbose_name}(s): {sample}.'
+        )
+
+
+def _skip_archived(model, batch, first_line, ignore_conflicts=False):
+    """The batch less rows of rides already in the archive, which count as conflicts"""
+    key = 'pk' if model is Ride else 'ride_id'
+    rides = {getattr(row, key) for row in batch}
+    archived = set(ArchivedRide.objects.filter(pk__in=rides).values_list('pk', flat=True))
+    if not archived:
+        return batch
+    conflicts = [row.pk for row in batch if getattr(row, key) in archived]
+    if not ignore_conflicts:
+        sample = ', '.join(map(str, sorted(conflicts)[:5]))
+        raise BulkFormatError(
+            first_line, f'batch has {len(conflicts)} {model._meta.verbose_name}(s) already in the archive: {sample}.'
+        )
+    return [row for row in batch if getattr(row, key) not in archived]
+
+
+def import_rows(model, stream, fmt, batch_size=5000, ignore_conflicts=False, progress=None):
+    """Insert every row of ``stream`` into ``model``'s table; returns the number of rows read"""
+    decode = _decoders(model)
+    progress = progress or Progress()
+
+    def flush(batch, first_line):
+        _check_references(model, batch, first_line)
+        rows = _skip_archived(model, batch, first_line, ignore_conflicts)
+        with transaction.atomic():
+            model.objects.bulk_create(rows, ignore_conflicts=ignore_conflicts)
+        progress.add(len(batch))
+
+    with keep_timestamps(model):
+        batch, first_line = [], None
+        for line_number, raw in read_rows(stream, fmt):
+            if not batch:
+                first_line = line_number
+            batch.append(decode(line_number, raw))
+            if len(batch) >= batch_size:
+                flush(batch, first_line)
+                batch = []
+        if batch:
+            flush(batch, first_line)
+
+    reset_sequences(model)
+    return progress.rows
+
+
+def reset_sequences(*models):
+    """Move id sequences past imported ids (a no-op on SQLite)"""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
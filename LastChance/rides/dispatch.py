@@ -0,0 +1,183 @@
+"""
+Nearest-rider dispatch over the fixed set of Clark landmarks.
+
+Online riders are kept in an in-memory index keyed by their last known
+landmark. Because there are only 13 landmarks, travel times between them are
+precomputed once from the routing distance matrix, along with every
+landmark's neighbours sorted by travel time. Finding the k best riders for a
+pickup walks those neighbours nearest first and stops as soon as no farther
+landmark can beat the riders already found, so a lookup touches a handful of
+riders no matter how many are online.
+
+This module stands alone: nothing in the request path fills the index or
+calls ``dispatch_ride`` yet; ``bench_dispatch`` and the tests drive it.
+Riders have no way to go online with a location, and rides are still taken
+from the rider dashboard. Wiring it in needs that go-online step (and going
+offline again on accept), plus a call to ``dispatch_ride`` when a ride is
+booked. The index is per process, so a multi-process deployment also needs
+one dispatcher process, or a shared store behind the same interface.
+"""
+import heapq
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from accounts.models import CustomUser
+
+from . import routing
+from .services import try_accept_ride
+
+AVERAGE_SPEED_KMH = 25.0
+PICKUP_OVERHEAD_MINUTES = 2.0  # Time to reach a rider waiting at the pickup landmark itself
+
+LANDMARKS = routing.LANDMARKS
+
+
+def _build_travel_minutes():
+    matrix = {}
+    for origin, row in routing.distance_matrix().items():
+        matrix[origin] = {
+            target: PICKUP_OVERHEAD_MINUTES + float(km) / AVERAGE_SPEED_KMH * 60
+            for target, km in row.items()
+        }
+    return matrix
+
+
+TRAVEL_MINUTES = _build_travel_minutes()
+
+# For each pickup, every landmark with its travel time, nearest first
+NEIGHBOURS = {
+    pickup: sorted(((minutes, origin) for origin, minutes in TRAVEL_MINUTES[pickup].items()))
+    for pickup in LANDMARKS
+}
+
+
+def travel_minutes(origin, target):
+    return TRAVEL_MINUTES[origin][target]
+
+
+# Scoring
+
+RiderPosition = namedtuple('RiderPosition', 'rider_id landmark online_since')
+Candidate = namedtuple('Candidate', 'score minutes rider_id landmark')
+
+
+def by_travel_time(minutes, rider, now):
+    """Default score: minutes to the pickup, ties going to the longest-idle rider"""
+    return minutes
+
+
+def idle_penalty(weight=2.0, half_life=300.0):
+    """
+    Score that adds up to ``weight`` minutes for riders who only just came
+    online, shrinking as they wait, so idle riders get offers sooner.
+    """
+    def score(minutes, rider, now):
+        idle = max(now - rider.online_since, 0.0)
+        return minutes + weight * half_life / (half_life + idle)
+    return score
+
+
+class RiderIndex:
+    """
+    Online riders by last known landmark.
+
+    ``nearest`` prunes its search, which relies on two promises from the
+    score function: a score is never below the rider's travel time
+    (penalties only add), and at one landmark a rider who has been idle
+    longer never scores worse. So the walk outwards stops once the k-th best
+    score is no worse than the next landmark's travel time, and the scan of a
+    landmark (kept in idle order) stops at the first rider who cannot get in.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # landmark -> OrderedDict(rider_id -> RiderPosition), oldest first
+        self._by_landmark = {landmark: OrderedDict() for landmark in LANDMARKS}
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, rider_id):
+        return rider_id in self._positions
+
+    def set_online(self, rider_id, landmark, now=None):
+        """Record ``rider_id`` as available at ``landmark``"""
+        if landmark not in self._by_landmark:
+            raise ValueError(f'Unknown landmark: {landmark}')
+        with self._lock:
+            self._discard(rider_id)
+            position = RiderPosition(rider_id, landmark, time.monotonic() if now is None else now)
+            self._by_landmark[landmark][rider_id] = position
+            self._positions[rider_id] = position
+
+    def set_offline(self, rider_id):
+        with self._lock:
+            self._discard(rider_id)
+
+    def _discard(self, rider_id):
+        position = self._positions.pop(rider_id, None)
+        if position is not None:
+            del self._by_landmark[position.landmark][rider_id]
+
+    def riders_at(self, landmark):
+        with self._lock:
+            return list(self._by_landmark[landmark].values())
+
+    def nearest(self, pickup, k=5, score=by_travel_time, now=None):
+        """The ``k`` best online riders for a pickup at ``pickup``, best first"""
+        if k <= 0:
+            return []
+        now = time.monotonic() if now is None else now
+        best = []  # max-heap of the k best, as (-score, tiebreak, Candidate)
+        seen = 0
+        with self._lock:
+            for minutes, landmark in NEIGHBOURS[pickup]:
+                if len(best) == k and -best[0][0] <= minutes:
+                    break
+                for rider in self._by_landmark[landmark].values():
+                    value = score(minutes, rider, now)
+                    if len(best) == k and value >= -best[0][0]:
+                        # Riders here are in idle order, so the rest score no better
+                        break
+                    entry = (-value, -seen, Candidate(value, minutes, rider.rider_id, landmark))
+                    seen += 1
+                    if len(best) < k:
+                        heapq.heappush(best, entry)
+                    else:
+                        heapq.heapreplace(best, entry)
+        return [candidate for _, _, candidate in sorted(best, reverse=True)]
+
+
+rider_index = RiderIndex()
+
+
+def dispatch_ride(ride, index=None, k=5, score=by_travel_time, offer=None):
+    """
+    Offer ``ride`` to the ``k`` best riders in ranked order and return the
+    rider who took it, or None if nobody did.
+
+    ``offer(rider, ride, candidate)`` asks one rider and returns True if they
+    accept. By default every offer is accepted, which makes this plain
+    nearest-rider assignment. Acceptance goes through ``try_accept_ride``, so
+    a dispatch never overrides a rider who accepted from the dashboard.
+    """
+    index = rider_index if index is None else index
+    candidates = index.nearest(ride.pickup, k=k, score=score)
+    riders = CustomUser.objects.in_bulk([candidate.rider_id for candidate in candidates])
+
+    for candidate in candidates:
+        rider = riders.get(candidate.rider_id)
+        if rider is None:
+            index.set_offline(candidate.rider_id)
+            continue
+        if offer is not None and not offer(rider, ride, candidate):
+            continue
+        accepted = try_accept_ride(ride.pk, rider)
+        if accepted is None:
+            # Taken already; stop offering it
+            return None
+        index.set_offline(rider.pk)
+        return rider
+    return None
@@ -0,0 +1,128 @@
+"""
+Shared cache of the pending-ride feed shown on the rider dashboard.
+
+Every rider sees the same list of open rides, so pages are cached once for
+everybody under a feed version number. Views that create, edit, accept or
+remove a pending ride call ``invalidate_pending_feed()``, which bumps the
+version once the transaction commits; stale pages are never read again and
+simply expire.
+
+Cursors come straight from the query string, so a page is only looked up
+once its cursor has decoded; the key holds a digest of it rather than the
+raw text, keeping every key short whatever the client sends.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .pagination import CursorPage
+
+VERSION_KEY = 'rides:pending-feed:version'
+
+_counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_counters_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'PENDING_FEED_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'PENDING_FEED_CACHE_TIMEOUT', 60)
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def get_feed_version():
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+async def aget_feed_version():
+    cache = _cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, 1, None)
+        version = await cache.aget(VERSION_KEY, 1)
+    return version
+
+
+def _bump_version():
+    cache = _cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Key was evicted; any new value orphans the old pages
+        cache.set(VERSION_KEY, get_feed_version() + 1, None)
+    _count('invalidations')
+
+
+def invalidate_pending_feed():
+    """Drop every cached feed page once the current transaction commits"""
+    transaction.on_commit(_bump_version)
+
+
+def _page_key(version, paginator, cursor):
+    """Cache key of a feed page; raises InvalidCursor, as the paginator would, for a cursor that does not decode"""
+    if not cursor:
+        return f'rides:pending-feed:v{version}:{paginator.per_page}:first'
+    paginator.decode_cursor(cursor)
+    digest = hashlib.sha256(cursor.encode()).hexdigest()
+    return f'rides:pending-feed:v{version}:{paginator.per_page}:{digest}'
+
+
+def get_pending_page(paginator, cursor=None):
+    """Return ``paginator.page(cursor)``, served from the shared cache when possible"""
+    key = _page_key(get_feed_version(), paginator, cursor)
+    cache = _cache()
+    cached = cache.get(key)
+    if cached is not None:
+        _count('hits')
+        object_list, has_next, has_previous = cached
+        return CursorPage(object_list, paginator, has_next, has_previous)
+
+    _count('misses')
+    page = paginator.page(cursor)
+    cache.set(key, (page.object_list, page.has_next(), page.has_previous()), _timeout())
+    return page
+
+
+async def aget_pending_page(paginator, cursor=None):
+    """Async ``get_pending_page``, sharing the same cache entries"""
+    key = _page_key(await aget_feed_version(), paginator, cursor)
+    cache = _cache()
+    cached = await cache.aget(key)
+    if cached is not None:
+        _count('hits')
+        object_list, has_next, has_previous = cached
+        return CursorPage(object_list, paginator, has_next, has_previous)
+
+    _count('misses')
+    page = await paginator.apage(cursor)
+    await cache.aset(key, (page.object_list, page.has_next(), page.has_previous()), _timeout())
+    return page
+
+
+def feed_cache_stats():
+    """Hit/miss/invalidation counters for this process"""
+    with _counters_lock:
+        stats = dict(_counters)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def reset_feed_cache_stats():
+    with _counters_lock:
+        for name in _counters:
+            _counters[name] = 0
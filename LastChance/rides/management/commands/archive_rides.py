@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rides import archive, bulk
+
+
+class Command(BaseCommand):
+    help = (
+        'Move completed and cancelled rides, with their events, from the live tables into the archive tables. '
+        'Archived rides keep their ids and still show on every history page and in the ride stats.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int,
+            help='Archive rides last updated more than this many days ago. Defaults to RIDE_ARCHIVE_AFTER_DAYS.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rides moved per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rides that would be archived.')
+
+    def handle(self, *args, **options):
+        days, batch_size = options['older_than_days'], options['batch_size']
+        if (days is not None and days < 0) or batch_size < 1:
+            raise CommandError('--older-than-days must not be negative and --batch-size must be positive.')
+        before = archive.archive_cutoff(days)
+
+        if options['dry_run']:
+            count = archive.archivable(before).count()
+            self.stdout.write(f'{count} ride(s) last updated before {before:%Y-%m-%d %H:%M} would be archived.')
+            return
+
+        progress = bulk.Progress(self.stderr.write, 50_000)
+        moved = archive.archive_finished_rides(before, batch_size=batch_size, progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} ride(s) in {progress.elapsed:.1f}s ({progress.rate:,.0f} rides/sec).'
+        ))
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from rides.models import Ride, RideEvent, UserRideStats
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire N concurrent accept requests at one pending ride through the JSON endpoint, '
+        'report throughput and check that exactly one rider wins. Creates and removes its own users and rides.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--riders', type=int, default=20, help='Concurrent riders per round.')
+        parser.add_argument('--rounds', type=int, default=5, help='Rides to contend for, one after another.')
+        parser.add_argument('--host', default='localhost', help='Host header to send; must be in ALLOWED_HOSTS.')
+
+    def handle(self, *args, **options):
+        n_riders, rounds = options['riders'], options['rounds']
+        if n_riders < 1 or rounds < 1:
+            raise CommandError('--riders and --rounds must be positive.')
+
+        tag = uuid.uuid4().hex[:8]
+        customer = self._make_user(f'bench-{tag}-customer', 'CUSTOMER')
+        riders = [self._make_user(f'bench-{tag}-rider-{i}', 'RIDER') for i in range(n_riders)]
+
+        # Log in up front so the timed section only covers the accept requests
+        clients = []
+        for rider in riders:
+            client = Client(SERVER_NAME=options['host'])
+            client.force_login(rider)
+            clients.append(client)
+
+        failures = []
+        elapsed = 0.0
+        # Every losing rider gets a 409, which django.request would log as a warning
+        request_logger = logging.getLogger('django.request')
+        previous_level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            for _ in range(rounds):
+                ride = Ride.objects.create(
+                    customer=customer, pickup='CLARK_MAIN', destination='SM_CLARK',
+                    total_distance=Decimal('4.00'), price=Decimal('100.00'),
+                )
+                statuses, took = self._contend(clients, reverse('api-accept-ride', args=[ride.pk]))
+                elapsed += took
+
+                winners = statuses.count(200)
+                ride.refresh_from_db()
+                if winners != 1 or statuses.count(409) != n_riders - 1 or ride.status != 'ACCEPTED':
+                    failures.append(f'ride {ride.pk}: {winners} winner(s), statuses {sorted(statuses)}')
+        finally:
+            request_logger.setLevel(previous_level)
+            for client in clients:
+                client.logout()
+            user_ids = [customer.pk] + [rider.pk for rider in riders]
+            RideEvent.objects.filter(ride__customer=customer).delete()
+            Ride.objects.filter(customer=customer).delete()
+            UserRideStats.objects.filter(user_id__in=user_ids).delete()
+            CustomUser.objects.filter(pk__in=user_ids).delete()
+
+        requests = n_riders * rounds
+        self.stdout.write(
+            f'{requests} accept requests over {rounds} ride(s) in {elapsed:.3f}s '
+            f'({requests / elapsed:.1f} req/s, {elapsed / rounds * 1000:.1f} ms per contended ride)'
+        )
+        if failures:
+            raise CommandError('Acceptance was not exclusive:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Exactly one rider won every ride.'))
+
+    def _make_user(self, username, role):
+        user = CustomUser(username=username, user_role=role, first_name='Bench', last_name=role.title())
+        user.set_unusable_password()
+        user.save()
+        return user
+
+    def _contend(self, clients, url):
+        statuses = [None] * len(clients)
+        barrier = threading.Barrier(len(clients), timeout=30)
+
+        def accept(index):
+            try:
+                barrier.wait()
+                statuses[index] = clients[index].post(url).status_code
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=accept, args=(i,)) for i in range(len(clients))]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses, time.perf_counter() - start
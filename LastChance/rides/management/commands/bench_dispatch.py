@@ -0,0 +1,79 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rides.dispatch import LANDMARKS, RiderIndex, by_travel_time, idle_penalty
+
+SCORERS = {
+    'travel': lambda: by_travel_time,
+    'idle': idle_penalty,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate dispatch over an in-memory rider index: each request picks the best rider near a random '
+        'pickup, takes them offline and brings back the rider from an earlier trip at its drop-off. '
+        'Reports lookup latency. Does not touch the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--riders', type=int, default=10_000)
+        parser.add_argument('--requests', type=int, default=100_000)
+        parser.add_argument('-k', type=int, default=5, help='Candidates ranked per request.')
+        parser.add_argument('--in-flight', type=int, default=1_000, help='Riders busy on a trip at any time.')
+        parser.add_argument('--scorer', choices=sorted(SCORERS), default='travel')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        n_riders, n_requests, k = options['riders'], options['requests'], options['k']
+        in_flight = min(options['in_flight'], n_riders - 1)
+        if n_riders < 1 or n_requests < 1 or k < 1:
+            raise CommandError('--riders, --requests and -k must be positive.')
+        rng = random.Random(options['seed'])
+        score = SCORERS[options['scorer']]()
+
+        index = RiderIndex()
+        clock = 0.0
+        for rider_id in range(n_riders):
+            index.set_online(rider_id, rng.choice(LANDMARKS), now=clock)
+
+        pickups = [rng.choice(LANDMARKS) for _ in range(n_requests)]
+        destinations = [rng.choice(LANDMARKS) for _ in range(n_requests)]
+        busy = []  # (rider_id, drop-off) in trip order
+        timings = []
+        unserved = 0
+
+        for pickup, destination in zip(pickups, destinations):
+            clock += 0.05
+            start = time.perf_counter()
+            candidates = index.nearest(pickup, k=k, score=score, now=clock)
+            timings.append(time.perf_counter() - start)
+
+            if not candidates:
+                unserved += 1
+                continue
+            winner = candidates[0].rider_id
+            index.set_offline(winner)
+            busy.append((winner, destination))
+            if len(busy) > in_flight:
+                rider_id, drop_off = busy.pop(0)
+                index.set_online(rider_id, drop_off, now=clock)
+
+        timings.sort()
+        total = sum(timings)
+        micro = 1_000_000
+        self.stdout.write(
+            f'{n_requests} requests over {n_riders} riders ({options["scorer"]} scorer, k={k}): '
+            f'{n_requests / total:,.0f} lookups/s'
+        )
+        self.stdout.write(
+            f'  mean {statistics.fmean(timings) * micro:.1f} us, '
+            f'p50 {timings[len(timings) // 2] * micro:.1f} us, '
+            f'p99 {timings[int(len(timings) * 0.99)] * micro:.1f} us, '
+            f'max {timings[-1] * micro:.1f} us'
+        )
+        if unserved:
+            self.stdout.write(self.style.WARNING(f'  {unserved} request(s) found no online rider'))
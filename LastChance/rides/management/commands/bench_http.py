@@ -0,0 +1,128 @@
+import statistics
+import threading
+import time
+from http.client import HTTPConnection
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from accounts.models import CustomUser
+
+DEFAULT_PATHS = ('ride-list', 'rider-dashboard')
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test running deployments over HTTP and compare requests/sec and latency percentiles. '
+        'Start the same code under WSGI and ASGI, for example '
+        '"gunicorn LastC.wsgi -w 4 --threads 8 -b :8000" and '
+        '"gunicorn LastC.asgi -w 4 -k uvicorn.workers.UvicornWorker -b :8001" (needs uvicorn), then run '
+        '"bench_http --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001 --as-user <rider>". '
+        'Both servers must use this database, since the command logs the user in by creating a session.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', required=True, metavar='NAME=URL',
+            help='Deployment to test; repeat to compare several.',
+        )
+        parser.add_argument(
+            '--path', action='append', metavar='PATH',
+            help=f'Path to request, cycled through; repeatable. Defaults to the {", ".join(DEFAULT_PATHS)} pages.',
+        )
+        parser.add_argument('--as-user', help='Username to send requests as.')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per target.')
+        parser.add_argument('--warmup', type=int, default=50, help='Untimed requests per target.')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, sep, url = target.partition('=')
+            if not sep or not url.startswith('http://'):
+                raise CommandError(f'Expected NAME=http://host:port, got {target!r}.')
+            targets.append((name, url.rstrip('/')))
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be positive.')
+
+        paths = options['path'] or [reverse(name) for name in DEFAULT_PATHS]
+        session = self._login(options['as_user']) if options['as_user'] else None
+        headers = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={session.session_key}'} if session else {}
+
+        try:
+            results = []
+            for name, url in targets:
+                self._run(url, paths, headers, options['warmup'], min(options['concurrency'], options['warmup'] or 1))
+                results.append((name, self._run(url, paths, headers, options['requests'], options['concurrency'])))
+        finally:
+            if session:
+                session.delete()
+
+        self.stdout.write(f'{"target":<12}{"req/s":>10}{"mean ms":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+        for name, (elapsed, latencies, errors) in results:
+            latencies.sort()
+            self.stdout.write(
+                f'{name:<12}{len(latencies) / elapsed:>10.1f}{statistics.fmean(latencies) * 1000:>10.1f}'
+                f'{latencies[len(latencies) // 2] * 1000:>10.1f}'
+                f'{latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000:>10.1f}{errors:>8}'
+            )
+
+    def _login(self, username):
+        try:
+            user = CustomUser.objects.get(username=username)
+        except CustomUser.DoesNotExist:
+            raise CommandError(f'No user named {username!r}.')
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session
+
+    def _run(self, base_url, paths, headers, total, concurrency):
+        """Send ``total`` GETs from ``concurrency`` keep-alive connections"""
+        if total < 1:
+            return 0.0, [], 0
+        parts = urlsplit(base_url)
+        prefix = parts.path
+        lock = threading.Lock()
+        issued = [0]
+        latencies, errors = [], [0]
+
+        def worker():
+            connection = HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            try:
+                while True:
+                    with lock:
+                        if issued[0] >= total:
+                            return
+                        n = issued[0]
+                        issued[0] += 1
+                    start = time.perf_counter()
+                    try:
+                        connection.request('GET', prefix + paths[n % len(paths)], headers=headers)
+                        response = connection.getresponse()
+                        response.read()
+                        ok = response.status == 200
+                    except OSError:
+                        connection.close()
+                        ok = False
+                    took = time.perf_counter() - start
+                    with lock:
+                        latencies.append(took)
+                        if not ok:
+                            errors[0] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, latencies, errors[0]
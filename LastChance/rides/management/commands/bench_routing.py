@@ -0,0 +1,63 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import CustomUser
+from rides import routing
+from rides.models import Ride
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure what routing.quote() adds to a booking: time the quote on its own, then time ride '
+        'inserts with and without it. The inserts are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quotes', type=int, default=100_000)
+        parser.add_argument('--bookings', type=int, default=2_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['quotes'] < 1 or options['bookings'] < 1:
+            raise CommandError('--quotes and --bookings must be positive.')
+        rng = random.Random(options['seed'])
+        landmarks = routing.LANDMARKS
+
+        pairs = [tuple(rng.sample(landmarks, 2)) for _ in range(options['quotes'])]
+        start = time.perf_counter()
+        for pickup, destination in pairs:
+            routing.quote(pickup, destination)
+        per_quote = (time.perf_counter() - start) / len(pairs)
+        self.stdout.write(f'routing.quote: {per_quote * 1_000_000:.2f} us per call over {len(pairs)} calls')
+
+        pairs = pairs[:options['bookings']]
+        fixed = self._time_bookings(pairs, quoted=False)
+        quoted = self._time_bookings(pairs, quoted=True)
+        self.stdout.write(
+            f'ride insert: {fixed * 1000:.3f} ms without quote, {quoted * 1000:.3f} ms with quote '
+            f'({(per_quote / fixed) * 100:.2f}% of an insert)'
+        )
+
+    def _time_bookings(self, pairs, quoted):
+        with transaction.atomic():
+            customer = CustomUser(username='bench-routing-customer', user_role='CUSTOMER')
+            customer.set_unusable_password()
+            customer.save()
+
+            start = time.perf_counter()
+            for pickup, destination in pairs:
+                if quoted:
+                    distance, price = routing.quote(pickup, destination)
+                else:
+                    distance, price = Decimal('4.00'), Decimal('100.00')
+                Ride.objects.create(
+                    customer=customer, pickup=pickup, destination=destination,
+                    total_distance=distance, price=price,
+                )
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return elapsed / len(pairs)
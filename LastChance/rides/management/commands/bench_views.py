@@ -0,0 +1,246 @@
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from rides import bulk, synthetic
+from rides.feed import invalidate_pending_feed
+from rides.models import Ride, RideHistory
+
+# ``user`` and ``ride`` name fixtures picked from the data at each scale (see _fixtures).
+# POSTs run in a transaction that is rolled back, so every repeat sees the same data.
+Case = namedtuple('Case', 'name method url_name user ride query data', defaults=(None, None, None))
+
+CASES = (
+    # rides.views
+    Case('book ride form', 'GET', 'create-ride', 'customer'),
+    Case('book ride', 'POST', 'create-ride', 'customer', data={'pickup': 'CLARK_MAIN', 'destination': 'FONTANA'}),
+    Case('ride list (customer)', 'GET', 'ride-list', 'customer'),
+    Case('ride list (rider)', 'GET', 'rider-active-rides', 'rider'),
+    Case('ride list (staff)', 'GET', 'ride-list', 'staff'),
+    Case('ride detail', 'GET', 'ride-detail', 'customer', 'pending'),
+    Case('edit ride form', 'GET', 'ride-edit', 'customer', 'pending'),
+    Case('edit ride', 'POST', 'ride-edit', 'customer', 'pending', data={'pickup': 'SM_CLARK', 'destination': 'CDC'}),
+    Case('delete ride form', 'GET', 'ride-delete', 'customer', 'pending'),
+    Case('delete ride', 'POST', 'ride-delete', 'customer', 'pending'),
+    Case('customer history', 'GET', 'customer-history', 'customer'),
+    Case('rider dashboard', 'GET', 'rider-dashboard', 'rider'),
+    Case('rider history', 'GET', 'rider-history', 'rider'),
+    Case('accept ride', 'POST', 'accept-ride', 'rider', 'pending'),
+    Case('accept ride (JSON)', 'POST', 'api-accept-ride', 'rider', 'pending'),
+    Case('start ride', 'POST', 'update-ride-status', 'rider', 'accepted', data={'status': 'ONGOING'}),
+    Case('complete ride', 'POST', 'update-ride-status', 'rider', 'ongoing', data={'status': 'COMPLETED'}),
+    Case('drop ride', 'POST', 'drop-ride', 'customer', 'pending'),
+    # rides.api
+    Case('API ride list', 'GET', 'api-ride-list', 'customer'),
+    Case('API ride detail', 'GET', 'api-ride-detail', 'customer', 'pending'),
+    Case('API ride events', 'GET', 'api-ride-events', 'customer', 'pending'),
+    # dashboard.views
+    Case('staff dashboard', 'GET', 'staff-dashboard', 'staff'),
+    Case('staff ride list', 'GET', 'staff-rides', 'staff'),
+    Case('staff ride list (completed)', 'GET', 'staff-rides', 'staff', query={'status': 'COMPLETED'}),
+    Case('staff user list', 'GET', 'staff-users', 'staff'),
+    Case('staff user list (riders)', 'GET', 'staff-users', 'staff', query={'role': 'RIDER'}),
+    Case('staff user detail', 'GET', 'staff-user-detail', 'staff', 'rider_user'),
+    Case('staff create user form', 'GET', 'staff-create-user', 'staff'),
+    Case('add balance form', 'GET', 'staff-add-balance', 'staff', 'customer_user'),
+    Case('add balance', 'POST', 'staff-add-balance', 'staff', 'customer_user', data={'amount': '10.00', 'note': ''}),
+    Case('customer dashboard', 'GET', 'customer-dashboard', 'customer'),
+    Case('request performance', 'GET', 'staff-performance', 'staff'),
+)
+
+# Streaming responses never finish, so they have no single latency to time
+SKIPPED = ('ride-event-stream', 'pending-ride-stream')
+
+
+def parse_count(value):
+    """10000, 10k, 1m or 10M"""
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    value = value.strip().lower()
+    try:
+        if value[-1:] in multipliers:
+            return int(float(value[:-1]) * multipliers[value[-1]])
+        return int(value)
+    except ValueError:
+        raise CommandError(f'{value!r} is not a ride count.')
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Time every routed view in rides.views, rides.api and dashboard.views in-process at one or more ride '
+        'counts, topping the database up with synthetic data (see generate_rides) before each, and write the '
+        'results as JSON for comparison across commits. Run it against a scratch database: generated rows are '
+        'kept so the next run can reuse them. POST cases are rolled back after each request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', action='append', metavar='RIDES',
+            help='Total rides to time the views at, e.g. 10k, 1m, 10m; repeatable. Defaults to 10k, 1m and 10m.',
+        )
+        parser.add_argument('--repeat', type=int, default=10, help='Timed requests per view.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per view.')
+        parser.add_argument('--only', action='append', metavar='NAME', help='Only time cases whose name contains this.')
+        parser.add_argument('--riders', type=int, default=500, help='Generated riders.')
+        parser.add_argument('--customers', type=int, default=5000, help='Generated customers.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rides per bulk_create while generating.')
+        parser.add_argument('--output', default='-', help='JSON file to write, or "-" for stdout.')
+        parser.add_argument('--host', default='localhost', help='Host header to send; must be in ALLOWED_HOSTS.')
+
+    def handle(self, *args, **options):
+        scales = sorted(parse_count(value) for value in (options['scale'] or ['10k', '1m', '10m']))
+        if scales[0] < 1 or options['repeat'] < 1 or options['warmup'] < 0:
+            raise CommandError('Scales and --repeat must be positive.')
+        cases = [
+            case for case in CASES
+            if not options['only'] or any(part.lower() in case.name.lower() for part in options['only'])
+        ]
+
+        report = {
+            'commit': git_commit(),
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'async_views': settings.ASYNC_VIEWS,
+            'repeat': options['repeat'],
+            'skipped': list(SKIPPED),
+            'scales': [],
+        }
+        # Failures go into the report; keep django.request's warnings and tracebacks out of the output
+        request_logger = logging.getLogger('django.request')
+        previous_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            for scale in scales:
+                generated = self._top_up(scale, options)
+                fixtures = self._fixtures()
+                clients = {}
+                results = [self._time(case, fixtures, clients, options) for case in cases]
+                report['scales'].append({'rides': RideHistory.objects.count(), 'generated_seconds': generated,
+                                         'views': results})
+                self.stderr.write(self.style.SUCCESS(f'Timed {len(results)} views at {scale:,} rides.'))
+        finally:
+            request_logger.setLevel(previous_level)
+
+        text = json.dumps(report, indent=2)
+        if options['output'] == '-':
+            self.stdout.write(text)
+        else:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+            self.stderr.write(self.style.SUCCESS(f'Wrote {options["output"]}.'))
+
+    def _top_up(self, scale, options):
+        """Generate rides until there are ``scale``; returns the seconds it took"""
+        missing = scale - RideHistory.objects.count()
+        started = time.perf_counter()
+        progress = bulk.Progress(self.stderr.write, 500_000)
+        # Seeded by the starting size, so every top-up to the same scale generates the same rides
+        synthetic.generate(
+            max(missing, 0), options['riders'], options['customers'], seed=options['seed'] + scale - max(missing, 0),
+            batch_size=options['batch_size'], progress=progress,
+        )
+        if missing > 0:
+            invalidate_pending_feed()
+            call_command('rebuild_ride_stats', stdout=self.stderr)
+        return round(time.perf_counter() - started, 3)
+
+    def _fixtures(self):
+        """The users and rides the cases act on, chosen so each case can succeed"""
+        fixtures = {'staff': CustomUser.objects.filter(username=synthetic.username('synthetic', 'STAFF', 0)).first()}
+        rides = Ride.objects.select_related('customer', 'rider').order_by('-created_at')
+        pending = rides.filter(status='PENDING', rider__isnull=True).first()
+        fixtures['pending'] = pending
+        fixtures['accepted'] = rides.filter(status='ACCEPTED').first()
+        fixtures['ongoing'] = rides.filter(status='ONGOING').first()
+
+        customer_ride = pending or rides.first()
+        fixtures['customer'] = customer_ride.customer if customer_ride else None
+        rider_ride = fixtures['ongoing'] or fixtures['accepted'] or rides.filter(rider__isnull=False).first()
+        fixtures['rider'] = rider_ride.rider if rider_ride else None
+        fixtures['rider_user'], fixtures['customer_user'] = fixtures['rider'], fixtures['customer']
+        return fixtures
+
+    def _client(self, clients, user, host):
+        if user.pk not in clients:
+            client = Client(SERVER_NAME=host)
+            client.force_login(user)
+            clients[user.pk] = client
+        return clients[user.pk]
+
+    def _time(self, case, fixtures, clients, options):
+        result = {'name': case.name, 'method': case.method, 'url_name': case.url_name}
+        user = fixtures.get(case.user)
+        target = fixtures.get(case.ride) if case.ride else None
+        if user is None or (case.ride and target is None):
+            result['skipped'] = f'no {case.ride or case.user} in the data'
+            return result
+        if case.ride in ('accepted', 'ongoing'):
+            # Only the ride's own rider may move it on
+            user = target.rider
+
+        client = self._client(clients, user, options['host'])
+        url = reverse(case.url_name, args=[target.pk] if target else [])
+        result['url'] = url
+
+        timings, queries, status = [], None, None
+        for i in range(options['warmup'] + options['repeat']):
+            try:
+                took, count, status = self._request(client, case.method, url, case.query, case.data)
+            except Exception as e:
+                result['error'] = f'{type(e).__name__}: {e}'
+                return result
+            if i >= options['warmup']:
+                timings.append(took)
+                queries = count
+        timings.sort()
+        result.update({
+            'status': status,
+            'queries': queries,
+            'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+            'p50_ms': round(timings[len(timings) // 2] * 1000, 3),
+            'p95_ms': round(timings[min(int(len(timings) * 0.95), len(timings) - 1)] * 1000, 3),
+            'min_ms': round(timings[0] * 1000, 3),
+            'max_ms': round(timings[-1] * 1000, 3),
+        })
+        return result
+
+    def _request(self, client, method, url, query, data):
+        """One timed request; returns (seconds, queries, status code)"""
+        with CaptureQueriesContext(connection) as captured:
+            if method == 'GET':
+                start = time.perf_counter()
+                response = client.get(url, query or {})
+                took = time.perf_counter() - start
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            else:
+                with transaction.atomic():
+                    start = time.perf_counter()
+                    response = client.post(url, data or {})
+                    took = time.perf_counter() - start
+                    transaction.set_rollback(True)
+        return took, len(captured), response.status_code
@@ -0,0 +1,73 @@
+import argparse
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from rides import bulk
+from rides.models import Ride, RideHistory, RideHistoryEvent
+
+
+def moment(value):
+    """An ISO date or date/time; naive values are in the current time zone"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise argparse.ArgumentTypeError(f'{value!r} is not an ISO date or date/time.')
+        parsed = datetime.datetime.combine(day, datetime.time())
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream rides and/or ride events to CSV or JSONL files in constant memory, in id order. '
+        'Archived rides and their events are included. '
+        'Paths ending in .gz are compressed and "-" writes to stdout. Progress goes to stderr.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', metavar='PATH', help='File to write rides to.')
+        parser.add_argument('--events', metavar='PATH', help='File to write ride events to.')
+        parser.add_argument('--format', choices=bulk.FORMATS, help='Defaults to the file extension.')
+        parser.add_argument(
+            '--status',
+            action='append',
+            choices=[status for status, _ in Ride.STATUS_CHOICES],
+            help='Only export rides in this status, and their events; repeat for several.',
+        )
+        parser.add_argument('--since', type=moment, help='Only rides created at or after this ISO date/time, and their events.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip.')
+        parser.add_argument('--progress-every', type=int, default=100_000, help='Rows between progress lines.')
+
+    def handle(self, *args, **options):
+        targets = [(RideHistory, 'rides', options['rides']), (RideHistoryEvent, 'ride events', options['events'])]
+        targets = [(model, label, path) for model, label, path in targets if path]
+        if not targets:
+            raise CommandError('Give --rides and/or --events.')
+        if sum(path == '-' for _, _, path in targets) > 1:
+            raise CommandError('Only one of --rides and --events can write to stdout.')
+
+        rides = RideHistory.objects.all()
+        if options['status']:
+            rides = rides.filter(status__in=options['status'])
+        if options['since']:
+            rides = rides.filter(created_at__gte=options['since'])
+        filtered = bool(options['status'] or options['since'])
+
+        for model, label, path in targets:
+            fmt = options['format'] or bulk.guess_format(path)
+            if fmt is None:
+                raise CommandError(f'Cannot tell the format of {path!r}; pass --format.')
+            queryset = rides if model is RideHistory else RideHistoryEvent.objects.all()
+            if model is RideHistoryEvent and filtered:
+                queryset = queryset.filter(ride__in=rides.values('pk'))
+
+            progress = bulk.Progress(self.stderr.write, options['progress_every'])
+            with bulk.open_text(path, 'w') as stream:
+                count = bulk.export_rows(queryset, fmt, stream, options['chunk_size'], progress)
+            self.stderr.write(self.style.SUCCESS(
+                f'Exported {count} {label} to {path} '
+                f'in {progress.elapsed:.1f}s ({progress.rate:,.0f} rows/sec).'
+            ))
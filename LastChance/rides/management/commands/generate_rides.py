@@ -0,0 +1,47 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from rides import bulk, synthetic
+from rides.feed import invalidate_pending_feed
+
+
+class Command(BaseCommand):
+    help = (
+        'Add reproducible synthetic rides, with their event trails, among generated riders, customers and staff '
+        '(created as needed, usernames "<prefix>-<role>-<n>"). Rows are inserted with bulk_create; ride stats '
+        'are rebuilt once at the end. Meant for benchmark databases, not production.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=10_000, help='Rides to add.')
+        parser.add_argument('--riders', type=int, default=500, help='Generated riders to have in total.')
+        parser.add_argument('--customers', type=int, default=5000, help='Generated customers to have in total.')
+        parser.add_argument('--staff', type=int, default=1, help='Generated staff users to have in total.')
+        parser.add_argument('--seed', type=int, default=0, help='Same seed and counts, same data.')
+        parser.add_argument('--days', type=int, default=365, help='Spread finished rides over this many days.')
+        parser.add_argument('--prefix', default='synthetic', help='Username prefix for generated users.')
+        parser.add_argument('--password', default='synthetic', help='Password of every generated user.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rides per bulk_create and commit.')
+        parser.add_argument('--skip-stats', action='store_true', help='Do not rebuild the ride stats afterwards.')
+        parser.add_argument('--progress-every', type=int, default=100_000, help='Rides between progress lines.')
+
+    def handle(self, *args, **options):
+        if options['rides'] < 0 or options['batch_size'] < 1 or options['days'] < 1:
+            raise CommandError('--rides must not be negative; --batch-size and --days must be positive.')
+        if options['rides'] and (options['riders'] < 1 or options['customers'] < 1):
+            raise CommandError('Generating rides needs at least one rider and one customer.')
+
+        progress = bulk.Progress(self.stdout.write, options['progress_every'])
+        riders, customers, staff = synthetic.generate(
+            options['rides'], options['riders'], options['customers'], options['staff'], options['seed'],
+            options['prefix'], options['password'], options['days'], options['batch_size'], progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Added {progress.rows} rides among {len(riders)} riders, {len(customers)} customers and '
+            f'{len(staff)} staff in {progress.elapsed:.1f}s ({progress.rate:,.0f} rides/sec).'
+        ))
+
+        if progress.rows:
+            invalidate_pending_feed()
+            if not options['skip_stats']:
+                call_command('rebuild_ride_stats', stdout=self.stdout)
@@ -0,0 +1,60 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from rides import bulk
+from rides.feed import invalidate_pending_feed
+from rides.models import Ride, RideEvent
+
+
+class Command(BaseCommand):
+    help = (
+        'Load rides and/or ride events written by export_rides, keeping their ids and timestamps. '
+        'Rows are inserted with bulk_create in batches, each committed on its own, so RideEvent.save() '
+        'side effects are not replayed. Ride stats are rebuilt once at the end. '
+        'Rows of rides that are already archived count as conflicts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', metavar='PATH', help='File to read rides from.')
+        parser.add_argument('--events', metavar='PATH', help='File to read ride events from.')
+        parser.add_argument('--format', choices=bulk.FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create and commit.')
+        parser.add_argument(
+            '--ignore-conflicts',
+            action='store_true',
+            help='Skip rows whose id already exists or whose ride is archived, e.g. to resume an interrupted import.',
+        )
+        parser.add_argument('--skip-stats', action='store_true', help='Do not rebuild the ride stats afterwards.')
+        parser.add_argument('--progress-every', type=int, default=100_000, help='Rows between progress lines.')
+
+    def handle(self, *args, **options):
+        # Rides first, so the events' rides exist
+        targets = [(Ride, options['rides']), (RideEvent, options['events'])]
+        targets = [(model, path) for model, path in targets if path]
+        if not targets:
+            raise CommandError('Give --rides and/or --events.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        for model, path in targets:
+            fmt = options['format'] or bulk.guess_format(path)
+            if fmt is None:
+                raise CommandError(f'Cannot tell the format of {path!r}; pass --format.')
+
+            progress = bulk.Progress(self.stdout.write, options['progress_every'])
+            try:
+                with bulk.open_text(path, 'r') as stream:
+                    count = bulk.import_rows(
+                        model, stream, fmt, options['batch_size'], options['ignore_conflicts'], progress
+                    )
+            except bulk.BulkFormatError as e:
+                raise CommandError(f'{path}: {e} {progress.rows} row(s) were imported before it.')
+            self.stdout.write(self.style.SUCCESS(
+                f'Imported {count} {model._meta.verbose_name_plural} from {path} '
+                f'in {progress.elapsed:.1f}s ({progress.rate:,.0f} rows/sec).'
+            ))
+
+        if options['rides']:
+            invalidate_pending_feed()
+            if not options['skip_stats']:
+                call_command('rebuild_ride_stats', stdout=self.stdout)
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from rides.models import UserRideStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the UserRideStats table from all rides, archived too, or verify it against a fresh computation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only compare the stored stats with a fresh computation and report differences.',
+        )
+
+    def handle(self, *args, **options):
+        expected = UserRideStats.compute_from_rides()
+
+        if options['verify']:
+            mismatches = self.compare(expected)
+            for line in mismatches:
+                self.stdout.write(line)
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} user(s) have out-of-date ride stats.')
+            self.stdout.write(self.style.SUCCESS(f'Ride stats verified for {len(expected)} user(s).'))
+            return
+
+        with transaction.atomic():
+            UserRideStats.objects.all().delete()
+            UserRideStats.objects.bulk_create(expected.values(), batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ride stats for {len(expected)} user(s).'))
+
+    def compare(self, expected):
+        fields = UserRideStats.COUNTER_FIELDS + ('last_ride_at',)
+        stored = {stats.user_id: stats for stats in UserRideStats.objects.all()}
+        mismatches = []
+        for user_id in sorted(set(expected) | set(stored)):
+            want = expected.get(user_id) or UserRideStats(user_id=user_id)
+            have = stored.get(user_id) or UserRideStats(user_id=user_id)
+            diffs = [
+                f'{field}: stored={getattr(have, field)} expected={getattr(want, field)}'
+                for field in fields
+                if getattr(have, field) != getattr(want, field)
+            ]
+            if diffs:
+                mismatches.append(f'User {user_id}: ' + ', '.join(diffs))
+        return mismatches
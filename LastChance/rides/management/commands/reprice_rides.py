@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rides import routing
+from rides.feed import invalidate_pending_feed
+from rides.models import Ride
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute total_distance and price for rides in the given statuses from the landmark matrix and '
+        'the current tariff, in a single UPDATE. Repricing completed rides rebuilds the ride stats, but '
+        'does not touch payments already recorded in the balance ledger.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status',
+            action='append',
+            choices=[status for status, _ in Ride.STATUS_CHOICES],
+            help='Status of rides to reprice; repeat for several. Defaults to PENDING.',
+        )
+        parser.add_argument('--base-fare', type=Decimal, help='Override RIDE_TARIFF BASE_FARE.')
+        parser.add_argument('--per-km', type=Decimal, help='Override RIDE_TARIFF PER_KM.')
+        parser.add_argument('--minimum-fare', type=Decimal, help='Override RIDE_TARIFF MINIMUM_FARE.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rides would change.')
+
+    def handle(self, *args, **options):
+        statuses = options['status'] or ['PENDING']
+        tariff = routing.get_tariff()._replace(**{
+            field: options[field] for field in ('base_fare', 'per_km', 'minimum_fare')
+            if options[field] is not None
+        })
+        queryset = Ride.objects.filter(status__in=statuses)
+
+        if options['dry_run']:
+            self.stdout.write(f'{queryset.count()} ride(s) would be repriced with {tariff}.')
+            return
+
+        with transaction.atomic():
+            updated = routing.reprice_rides(queryset, tariff)
+            if 'COMPLETED' in statuses:
+                call_command('rebuild_ride_stats', stdout=self.stdout)
+            if 'PENDING' in statuses:
+                invalidate_pending_feed()
+        self.stdout.write(self.style.SUCCESS(f'Repriced {updated} ride(s) with {tariff}.'))
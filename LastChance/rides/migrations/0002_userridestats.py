@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-16 20:47
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('rides', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRideStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ride_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('completed_as_rider', models.IntegerField(default=0)),
+                ('cancelled_as_rider', models.IntegerField(default=0)),
+                ('active_as_rider', models.IntegerField(default=0, help_text='Rides currently accepted or ongoing')),
+                ('total_earnings', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_distance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Completed distance in kilometers', max_digits=12)),
+                ('rides_as_customer', models.IntegerField(default=0)),
+                ('completed_as_customer', models.IntegerField(default=0)),
+                ('cancelled_as_customer', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('last_ride_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'user ride stats',
+                'verbose_name_plural': 'user ride stats',
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-16 20:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0002_userridestats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ride',
+            name='rider',
+            field=models.ForeignKey(blank=True, help_text='Assigned once a rider accepts the ride', limit_choices_to={'user_role': 'RIDER'}, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rides_as_rider', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['rider', 'status', '-created_at'], name='ride_rider_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['customer', 'status', '-created_at'], name='ride_customer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['status', '-created_at'], name='ride_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['-created_at'], name='ride_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(condition=models.Q(('rider__isnull', True), ('status', 'PENDING')), fields=['-created_at'], name='ride_pending_unassigned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rideevent',
+            index=models.Index(fields=['ride', 'created_at'], name='rideevent_ride_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rideevent',
+            index=models.Index(fields=['-created_at'], name='rideevent_created_idx'),
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+RIDE_COLUMNS = 'id, rider_id, customer_id, pickup, destination, total_distance, price, status, created_at, updated_at'
+EVENT_COLUMNS = 'id, ride_id, step, description, created_at'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0003_ride_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RideHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('pickup', models.CharField(choices=[('CLARK_MAIN', 'Clark Main Gate'), ('SM_CLARK', 'SM City Clark'), ('CLARK_PARADE', 'Clark Parade Grounds'), ('WIDUS_HOTEL', 'Widus Hotel & Casino'), ('MARQUEE_MALL', 'Marquee Mall'), ('CLARK_MUSEUM', 'Clark Museum'), ('AQUA_PLANET', 'Aqua Planet'), ('CLARK_AIRPORT', 'Clark International Airport'), ('CDC', 'Clark Development Corporation'), ('FONTANA', 'Fontana Leisure Park'), ('CLARK_SUN', 'Clark Sun Valley'), ('MIDORI_HOTEL', 'Midori Clark Hotel'), ('ROYCE_HOTEL', 'Royce Hotel & Casino')], max_length=255)),
+                ('destination', models.CharField(choices=[('CLARK_MAIN', 'Clark Main Gate'), ('SM_CLARK', 'SM City Clark'), ('CLARK_PARADE', 'Clark Parade Grounds'), ('WIDUS_HOTEL', 'Widus Hotel & Casino'), ('MARQUEE_MALL', 'Marquee Mall'), ('CLARK_MUSEUM', 'Clark Museum'), ('AQUA_PLANET', 'Aqua Planet'), ('CLARK_AIRPORT', 'Clark International Airport'), ('CDC', 'Clark Development Corporation'), ('FONTANA', 'Fontana Leisure Park'), ('CLARK_SUN', 'Clark Sun Valley'), ('MIDORI_HOTEL', 'Midori Clark Hotel'), ('ROYCE_HOTEL', 'Royce Hotel & Casino')], max_length=255)),
+                ('total_distance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('ACCEPTED', 'Accepted'), ('ONGOING', 'Ongoing'), ('COMPLETED', 'Completed'), ('CANCELLED', 'Cancelled')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived', models.BooleanField()),
+            ],
+            options={
+                'verbose_name_plural': 'ride history',
+                'db_table': 'rides_ride_history',
+                'ordering': ['-created_at'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RideHistoryEvent',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('step', models.IntegerField(choices=[(1, 'Ride Requested'), (2, 'Rider Accepted'), (3, 'Rider Arrived at Pickup'), (4, 'Journey Started'), (5, 'Journey Completed'), (6, 'Ride Cancelled')])),
+                ('description', models.TextField()),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'rides_rideevent_history',
+                'ordering': ['created_at'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedRide',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('pickup', models.CharField(choices=[('CLARK_MAIN', 'Clark Main Gate'), ('SM_CLARK', 'SM City Clark'), ('CLARK_PARADE', 'Clark Parade Grounds'), ('WIDUS_HOTEL', 'Widus Hotel & Casino'), ('MARQUEE_MALL', 'Marquee Mall'), ('CLARK_MUSEUM', 'Clark Museum'), ('AQUA_PLANET', 'Aqua Planet'), ('CLARK_AIRPORT', 'Clark International Airport'), ('CDC', 'Clark Development Corporation'), ('FONTANA', 'Fontana Leisure Park'), ('CLARK_SUN', 'Clark Sun Valley'), ('MIDORI_HOTEL', 'Midori Clark Hotel'), ('ROYCE_HOTEL', 'Royce Hotel & Casino')], max_length=255)),
+                ('destination', models.CharField(choices=[('CLARK_MAIN', 'Clark Main Gate'), ('SM_CLARK', 'SM City Clark'), ('CLARK_PARADE', 'Clark Parade Grounds'), ('WIDUS_HOTEL', 'Widus Hotel & Casino'), ('MARQUEE_MALL', 'Marquee Mall'), ('CLARK_MUSEUM', 'Clark Museum'), ('AQUA_PLANET', 'Aqua Planet'), ('CLARK_AIRPORT', 'Clark International Airport'), ('CDC', 'Clark Development Corporation'), ('FONTANA', 'Fontana Leisure Park'), ('CLARK_SUN', 'Clark Sun Valley'), ('MIDORI_HOTEL', 'Midori Clark Hotel'), ('ROYCE_HOTEL', 'Royce Hotel & Casino')], max_length=255)),
+                ('total_distance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('ACCEPTED', 'Accepted'), ('ONGOING', 'Ongoing'), ('COMPLETED', 'Completed'), ('CANCELLED', 'Cancelled')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('rider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedRideEvent',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('step', models.IntegerField(choices=[(1, 'Ride Requested'), (2, 'Rider Accepted'), (3, 'Rider Arrived at Pickup'), (4, 'Journey Started'), (5, 'Journey Completed'), (6, 'Ride Cancelled')])),
+                ('description', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('ride', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='rides.archivedride')),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedride',
+            index=models.Index(fields=['rider', '-created_at'], name='archivedride_rider_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedride',
+            index=models.Index(fields=['customer', '-created_at'], name='archivedride_customer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedride',
+            index=models.Index(fields=['-created_at'], name='archivedride_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedrideevent',
+            index=models.Index(fields=['ride', 'created_at'], name='archivedevent_ride_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedrideevent',
+            index=models.Index(fields=['-created_at'], name='archivedevent_created_idx'),
+        ),
+        # The read-only views behind RideHistory and RideHistoryEvent
+        migrations.RunSQL(
+            f'CREATE VIEW rides_ride_history AS '
+            f'SELECT {RIDE_COLUMNS}, FALSE AS archived FROM rides_ride '
+            f'UNION ALL SELECT {RIDE_COLUMNS}, TRUE AS archived FROM rides_archivedride',
+            'DROP VIEW rides_ride_history',
+        ),
+        migrations.RunSQL(
+            f'CREATE VIEW rides_rideevent_history AS '
+            f'SELECT {EVENT_COLUMNS} FROM rides_rideevent '
+            f'UNION ALL SELECT {EVENT_COLUMNS} FROM rides_archivedrideevent',
+            'DROP VIEW rides_rideevent_history',
+        ),
+    ]
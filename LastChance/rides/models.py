@@ -1,8 +1,53 @@
-from django.db import models
+from collections import namedtuple, defaultdict
+from decimal import Decimal
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.conf import settings
 
+from . import streams
+
 # Create your models here.
 
+# The subset of a ride's columns that feeds into UserRideStats
+RideStatsState = namedtuple(
+    'RideStatsState',
+    ['rider_id', 'customer_id', 'status', 'price', 'total_distance', 'created_at']
+)
+
+class RideQuerySet(models.QuerySet):
+    # Columns rendered by the ride list templates
+    LIST_FIELDS = ('id', 'pickup', 'destination', 'total_distance', 'price', 'status',
+                   'created_at', 'updated_at', 'rider', 'customer')
+    PARTY_FIELDS = ('id', 'username', 'first_name', 'middle_name', 'last_name')
+
+    def with_parties(self):
+        """Fetch the customer and rider in the same query"""
+        return self.select_related('customer', 'rider')
+
+    def for_list(self):
+        """with_parties() restricted to the columns list pages display"""
+        party_fields = [f'{party}__{field}' for party in ('customer', 'rider') for field in self.PARTY_FIELDS]
+        return self.with_parties().only(*self.LIST_FIELDS, *party_fields)
+
+    def visible_to(self, user):
+        """Rides on a user's ride list: their own as rider or customer, or every ride for staff"""
+        if user.user_role == 'RIDER':
+            return self.filter(rider=user)
+        if user.user_role == 'CUSTOMER':
+            return self.filter(customer=user)
+        if user.is_staff:
+            return self
+        return self.none()
+
+    def involving(self, user):
+        """Rides a user may open: any ride for staff, otherwise ones they ride or booked"""
+        if user.is_staff:
+            return self
+        return self.filter(models.Q(rider=user) | models.Q(customer=user))
+
+
 class Ride(models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
@@ -32,7 +77,10 @@ class Ride(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='rides_as_rider',
-        limit_choices_to={'user_role': 'RIDER'}
+        limit_choices_to={'user_role': 'RIDER'},
+        null=True,
+        blank=True,
+        help_text="Assigned once a rider accepts the ride"
     )
     customer = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -68,12 +116,72 @@ class Ride(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = RideQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Rider/customer history and active-ride lookups
+            models.Index(fields=['rider', 'status', '-created_at'], name='ride_rider_status_idx'),
+            models.Index(fields=['customer', 'status', '-created_at'], name='ride_customer_status_idx'),
+            # Staff list filtered by status, newest first
+            models.Index(fields=['status', '-created_at'], name='ride_status_created_idx'),
+            # Default ordering and "today's rides" range scans
+            models.Index(fields=['-created_at'], name='ride_created_idx'),
+            # Open rides shown on the rider dashboard
+            models.Index(
+                fields=['-created_at'],
+                condition=models.Q(status='PENDING', rider__isnull=True),
+                name='ride_pending_unassigned_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"Ride {self.id} - {self.pickup} to {self.destination} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stats_state = instance._current_stats_state()
+        return instance
+
+    def _current_stats_state(self):
+        """Snapshot of the stats columns, or None if any of them is deferred"""
+        attnames = ('rider_id', 'customer_id', 'status', 'price', 'total_distance', 'created_at')
+        if any(name not in self.__dict__ for name in attnames):
+            return None
+        return RideStatsState(*(self.__dict__[name] for name in attnames))
+
+    def _stored_stats_state(self):
+        """The stats columns as they were last loaded or saved"""
+        state = getattr(self, '_stats_state', None)
+        if state is None and self.pk is not None:
+            row = Ride.objects.filter(pk=self.pk).values_list(*RideStatsState._fields).first()
+            state = RideStatsState(*row) if row else None
+        return state
+
+    def save(self, *args, **kwargs):
+        # Keep UserRideStats in step with this ride in the same transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            old_state = None if self._state.adding else self._stored_stats_state()
+            super().save(*args, **kwargs)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and old_state is not None:
+                # Only the listed columns were written; the rest keep their stored values
+                attnames = {self._meta.get_field(name).attname for name in update_fields}
+                new_state = old_state._replace(**{
+                    name: self.__dict__[name] for name in RideStatsState._fields if name in attnames
+                })
+            else:
+                new_state = self._current_stats_state()
+            UserRideStats.apply_ride_change(old_state, new_state)
+            self._stats_state = new_state
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            UserRideStats.apply_ride_change(self._stored_stats_state(), None)
+            return super().delete(*args, **kwargs)
+
     def get_status_display_class(self):
         """Returns Bootstrap class for status badge"""
         return {
@@ -111,26 +219,279 @@ class RideEvent(models.Model):
     class Meta:
         ordering = ['created_at']
         get_latest_by = 'created_at'
+        indexes = [
+            models.Index(fields=['ride', 'created_at'], name='rideevent_ride_created_idx'),
+            models.Index(fields=['-created_at'], name='rideevent_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.ride} - Step {self.step}: {self.get_step_display()}"
 
     def save(self, *args, **kwargs):
-        # Update ride status based on step if no description is provided
+        # Events only record what happened; rides.state_machine changes the ride's status
         if not self.description:
             self.description = self.get_step_display()
+        super().save(*args, **kwargs)
+        streams.publish_ride_event(self)
 
-        # Update the ride status based on the event step
-        status_mapping = {
-            1: 'PENDING',
-            2: 'ACCEPTED',
-            3: 'ACCEPTED',
-            4: 'ONGOING',
-            5: 'COMPLETED',
-            6: 'CANCELLED',
-        }
-        if self.ride.status != status_mapping.get(self.step, self.ride.status):
-            self.ride.status = status_mapping.get(self.step, self.ride.status)
-            self.ride.save()
 
-        super().save(*args, **kwargs)
+class UserRideStats(models.Model):
+    """
+    Denormalized per-user ride totals. Rows are adjusted incrementally by
+    Ride.save()/Ride.delete(); run ``manage.py rebuild_ride_stats`` after
+    bulk operations that bypass them (queryset update/delete, bulk_create).
+    """
+    COUNTER_FIELDS = (
+        'completed_as_rider', 'cancelled_as_rider', 'active_as_rider', 'total_earnings', 'total_distance',
+        'rides_as_customer', 'completed_as_customer', 'cancelled_as_customer', 'total_spent',
+    )
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ride_stats'
+    )
+    # As rider
+    completed_as_rider = models.IntegerField(default=0)
+    cancelled_as_rider = models.IntegerField(default=0)
+    active_as_rider = models.IntegerField(
+        default=0,
+        help_text="Rides currently accepted or ongoing"
+    )
+    total_earnings = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    total_distance = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        help_text="Completed distance in kilometers"
+    )
+    # As customer
+    rides_as_customer = models.IntegerField(default=0)
+    completed_as_customer = models.IntegerField(default=0)
+    cancelled_as_customer = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    last_ride_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'user ride stats'
+        verbose_name_plural = 'user ride stats'
+
+    def __str__(self):
+        return f"Ride stats for {self.user}"
+
+    @property
+    def rides_as_rider(self):
+        return self.completed_as_rider + self.cancelled_as_rider + self.active_as_rider
+
+    @classmethod
+    def for_user(cls, user):
+        """Return the user's stats row, or an unsaved all-zero row if none exists yet"""
+        return cls.objects.filter(user=user).first() or cls(user=user)
+
+    @classmethod
+    async def afor_user(cls, user):
+        return await cls.objects.filter(user=user).afirst() or cls(user=user)
+
+    @staticmethod
+    def contributions(state):
+        """Map of user id -> counter deltas that a ride in ``state`` adds"""
+        result = defaultdict(dict)
+        if state is None:
+            return result
+
+        if state.rider_id is not None:
+            rider = result[state.rider_id]
+            if state.status == 'COMPLETED':
+                rider['completed_as_rider'] = 1
+                rider['total_earnings'] = Decimal(state.price)
+                rider['total_distance'] = Decimal(state.total_distance)
+            elif state.status == 'CANCELLED':
+                rider['cancelled_as_rider'] = 1
+            elif state.status in ('ACCEPTED', 'ONGOING'):
+                rider['active_as_rider'] = 1
+
+        customer = result[state.customer_id]
+        customer['rides_as_customer'] = 1
+        if state.status == 'COMPLETED':
+            customer['completed_as_customer'] = 1
+            customer['total_spent'] = Decimal(state.price)
+        elif state.status == 'CANCELLED':
+            customer['cancelled_as_customer'] = 1
+        return result
+
+    @classmethod
+    def apply_ride_change(cls, old_state, new_state):
+        """Apply the difference between two states of one ride to the stats table"""
+        old = cls.contributions(old_state)
+        new = cls.contributions(new_state)
+
+        for user_id in set(old) | set(new):
+            deltas = {}
+            for field in cls.COUNTER_FIELDS:
+                delta = new[user_id].get(field, 0) - old[user_id].get(field, 0)
+                if delta:
+                    deltas[field] = delta
+            last_ride_at = None
+            if old_state is None and new_state is not None and user_id == new_state.customer_id:
+                last_ride_at = new_state.created_at
+            if deltas or last_ride_at:
+                cls._apply_deltas(user_id, deltas, last_ride_at)
+
+    @classmethod
+    def _apply_deltas(cls, user_id, deltas, last_ride_at=None):
+        updates = {field: F(field) + delta for field, delta in deltas.items()}
+        if last_ride_at:
+            updates['last_ride_at'] = Greatest(Coalesce(F('last_ride_at'), Value(last_ride_at)), Value(last_ride_at))
+        if cls.objects.filter(user_id=user_id).update(**updates):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, last_ride_at=last_ride_at, **deltas)
+        except IntegrityError:
+            # Another transaction created the row first
+            cls.objects.filter(user_id=user_id).update(**updates)
+
+    @classmethod
+    def compute_from_rides(cls, queryset=None):
+        """Recalculate every user's stats from all rides, archived too, returning unsaved rows keyed by user id"""
+        queryset = RideHistory.objects.all() if queryset is None else queryset
+        count = models.Count('pk')
+        completed = models.Q(status='COMPLETED')
+        cancelled = models.Q(status='CANCELLED')
+        active = models.Q(status__in=['ACCEPTED', 'ONGOING'])
+
+        rows = {}
+        as_rider = queryset.filter(rider__isnull=False).order_by().values('rider').annotate(
+            completed_as_rider=models.Count('pk', filter=completed),
+            cancelled_as_rider=models.Count('pk', filter=cancelled),
+            active_as_rider=models.Count('pk', filter=active),
+            total_earnings=models.Sum('price', filter=completed),
+            total_distance=models.Sum('total_distance', filter=completed),
+        )
+        for row in as_rider:
+            user_id = row.pop('rider')
+            rows[user_id] = cls(user_id=user_id, **{k: v or 0 for k, v in row.items()})
+
+        as_customer = queryset.order_by().values('customer').annotate(
+            rides_as_customer=count,
+            completed_as_customer=models.Count('pk', filter=completed),
+            cancelled_as_customer=models.Count('pk', filter=cancelled),
+            total_spent=models.Sum('price', filter=completed),
+            last_ride_at=models.Max('created_at'),
+        )
+        for row in as_customer:
+            user_id = row.pop('customer')
+            stats = rows.setdefault(user_id, cls(user_id=user_id))
+            for field, value in row.items():
+                setattr(stats, field, value if field == 'last_ride_at' else value or 0)
+        return rows
+
+
+# ----------------------------
+# Archive and history
+# ----------------------------
+class ArchivedRide(models.Model):
+    """
+    A finished ride moved out of the hot rides_ride table by
+    ``rides.archive``. It keeps the id it had there; read rides through
+    RideHistory rather than from here.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    rider = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', null=True, blank=True
+    )
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    pickup = models.CharField(max_length=255, choices=Ride.LOCATION_CHOICES)
+    destination = models.CharField(max_length=255, choices=Ride.LOCATION_CHOICES)
+    total_distance = models.DecimalField(max_digits=10, decimal_places=2)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Ride.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Only history lookups reach this table, so it needs fewer indexes than rides_ride
+            models.Index(fields=['rider', '-created_at'], name='archivedride_rider_idx'),
+            models.Index(fields=['customer', '-created_at'], name='archivedride_customer_idx'),
+            models.Index(fields=['-created_at'], name='archivedride_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived ride {self.id} ({self.status})"
+
+
+class ArchivedRideEvent(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    ride = models.ForeignKey(ArchivedRide, on_delete=models.CASCADE, related_name='events')
+    step = models.IntegerField(choices=RideEvent.STEP_CHOICES)
+    description = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['ride', 'created_at'], name='archivedevent_ride_idx'),
+            models.Index(fields=['-created_at'], name='archivedevent_created_idx'),
+        ]
+
+
+class RideHistory(models.Model):
+    """
+    Every ride, live or archived: a read-only view over rides_ride UNION ALL
+    rides_archivedride (see migration 0004). Filters, joins and
+    ORDER BY ... LIMIT are pushed into both halves, so each is read through
+    its own indexes. Pages that list or total rides of any status read this;
+    anything that changes a ride uses Ride.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    rider = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, related_name='+', null=True, blank=True
+    )
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, related_name='+')
+    pickup = models.CharField(max_length=255, choices=Ride.LOCATION_CHOICES)
+    destination = models.CharField(max_length=255, choices=Ride.LOCATION_CHOICES)
+    total_distance = models.DecimalField(max_digits=10, decimal_places=2)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Ride.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived = models.BooleanField()
+
+    objects = RideQuerySet.as_manager()
+
+    STATUS_CHOICES = Ride.STATUS_CHOICES
+    LOCATION_CHOICES = Ride.LOCATION_CHOICES
+
+    class Meta:
+        managed = False
+        db_table = 'rides_ride_history'
+        ordering = ['-created_at']
+        verbose_name_plural = 'ride history'
+
+    def __str__(self):
+        return f"Ride {self.id} - {self.pickup} to {self.destination} ({self.status})"
+
+    get_status_display_class = Ride.get_status_display_class
+
+
+class RideHistoryEvent(models.Model):
+    """Every ride event, live or archived; a view like RideHistory"""
+    id = models.BigIntegerField(primary_key=True)
+    ride = models.ForeignKey(RideHistory, on_delete=models.DO_NOTHING, related_name='events')
+    step = models.IntegerField(choices=RideEvent.STEP_CHOICES)
+    description = models.TextField()
+    created_at = models.DateTimeField()
+
+    STEP_CHOICES = RideEvent.STEP_CHOICES
+
+    class Meta:
+        managed = False
+        db_table = 'rides_rideevent_history'
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.ride} - Step {self.step}: {self.get_step_display()}"
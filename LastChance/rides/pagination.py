@@ -0,0 +1,177 @@
+import base64
+import json
+
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorPage:
+    """One page of a keyset-paginated queryset"""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self.object_list)} items>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], 'next')
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], 'prev')
+
+
+class CursorPaginator:
+    """
+    Keyset paginator over ``ordering`` (by default newest first on
+    ``(created_at, id)``). Each page is a single indexed range query, so deep
+    pages cost the same as the first one. Cursors are opaque url-safe tokens.
+
+    ``count`` is never computed; ``estimated_count`` returns the planner's
+    row estimate where the database offers one cheaply (PostgreSQL), else None.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'), estimate_total=False):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.estimate_total = estimate_total
+
+        directions = {name.startswith('-') for name in self.ordering}
+        if len(directions) != 1:
+            raise ValueError('All cursor ordering fields must sort in the same direction.')
+        self.descending = directions.pop()
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    # Cursor tokens
+
+    def encode_cursor(self, obj, direction):
+        values = []
+        for name in self.fields:
+            # Pages of a values() queryset hold dicts
+            value = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = json.dumps({'d': direction, 'v': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            direction, raw_values = payload['d'], payload['v']
+            if direction not in ('next', 'prev') or len(raw_values) != len(self.fields):
+                raise ValueError
+            model_fields = [self.queryset.model._meta.get_field(name) for name in self.fields]
+            values = [field.to_python(value) for field, value in zip(model_fields, raw_values)]
+        except Exception:
+            raise InvalidCursor('That page cursor is not valid.')
+        return direction, values
+
+    # Paging
+
+    def _after(self, values, forward):
+        """Rows strictly after ``values`` in the ordering, or before them if not ``forward``"""
+        lookup = 'lt' if self.descending == forward else 'gt'
+        condition = Q()
+        for depth in range(len(self.fields) - 1, -1, -1):
+            prefix = {name: value for name, value in zip(self.fields[:depth], values[:depth])}
+            term = Q(**prefix, **{f'{self.fields[depth]}__{lookup}': values[depth]})
+            condition = term | condition
+        return condition
+
+    def _page_query(self, cursor):
+        """The queryset one page is read from, and the cursor direction ('next', 'prev' or None)"""
+        if not cursor:
+            return self.queryset.order_by(*self.ordering)[:self.per_page + 1], None
+
+        direction, values = self.decode_cursor(cursor)
+        if direction == 'next':
+            queryset = self.queryset.filter(self._after(values, True)).order_by(*self.ordering)
+        else:
+            reverse_ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+            queryset = self.queryset.filter(self._after(values, False)).order_by(*reverse_ordering)
+        return queryset[:self.per_page + 1], direction
+
+    def _make_page(self, rows, direction):
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'prev':
+            rows.reverse()
+            return CursorPage(rows, self, True, more)
+        return CursorPage(rows, self, more, direction == 'next')
+
+    def page(self, cursor=None):
+        queryset, direction = self._page_query(cursor)
+        return self._make_page(list(queryset), direction)
+
+    async def apage(self, cursor=None):
+        queryset, direction = self._page_query(cursor)
+        return self._make_page([obj async for obj in queryset], direction)
+
+    @property
+    def estimated_count(self):
+        if not self.estimate_total:
+            return None
+        connection = connections[self.queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = self.queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CursorPaginationMixin:
+    """
+    ListView mixin that swaps the offset Paginator for CursorPaginator. The
+    cursor comes from the ``cursor`` query parameter.
+    """
+    cursor_ordering = ('-created_at', '-id')
+    cursor_param = 'cursor'
+    estimate_total = False
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(
+            queryset, page_size, ordering=self.cursor_ordering, estimate_total=self.estimate_total
+        )
+        try:
+            page = self.get_cursor_page(paginator, self.request.GET.get(self.cursor_param))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_cursor_page(self, paginator, cursor):
+        return paginator.page(cursor)
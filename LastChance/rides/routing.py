@@ -0,0 +1,125 @@
+"""
+Distances and fares between the fixed Clark landmarks.
+
+The 13x13 road-distance matrix lives in ``rides/data/landmark_distances.csv``
+(or the file named by ``settings.RIDE_DISTANCE_MATRIX``). It is read once,
+when the app registry is ready, so quoting a booking is two dictionary
+lookups and a little arithmetic. Fares follow ``settings.RIDE_TARIFF``.
+"""
+import csv
+import functools
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Case, DecimalField, F, Value, When
+from django.db.models.functions import Greatest, Round
+
+from .models import Ride
+
+DEFAULT_MATRIX_PATH = Path(__file__).resolve().parent / 'data' / 'landmark_distances.csv'
+
+DEFAULT_TARIFF = {
+    'BASE_FARE': '40.00',
+    'PER_KM': '15.00',
+    'MINIMUM_FARE': '50.00',
+}
+
+LANDMARKS = tuple(code for code, _ in Ride.LOCATION_CHOICES)
+
+Tariff = namedtuple('Tariff', 'base_fare per_km minimum_fare')
+Quote = namedtuple('Quote', 'distance fare')
+
+
+def load_distance_matrix(path):
+    """Parse a landmark distance CSV into ``{origin: {destination: Decimal km}}``"""
+    with open(path, newline='') as f:
+        rows = list(csv.reader(f))
+    header, body = rows[0][1:], rows[1:]
+    matrix = {row[0]: dict(zip(header, map(Decimal, row[1:]))) for row in body}
+
+    expected = set(LANDMARKS)
+    if set(header) != expected or set(matrix) != expected:
+        raise ImproperlyConfigured(f'{path} must list exactly the landmarks in Ride.LOCATION_CHOICES.')
+    for origin, row in matrix.items():
+        for destination, km in row.items():
+            if km < 0 or km != matrix[destination][origin]:
+                raise ImproperlyConfigured(f'{path}: bad distance between {origin} and {destination}.')
+    return matrix
+
+
+@functools.cache
+def distance_matrix():
+    return load_distance_matrix(getattr(settings, 'RIDE_DISTANCE_MATRIX', DEFAULT_MATRIX_PATH))
+
+
+def get_tariff():
+    tariff = {**DEFAULT_TARIFF, **getattr(settings, 'RIDE_TARIFF', {})}
+    return Tariff(
+        base_fare=Decimal(tariff['BASE_FARE']),
+        per_km=Decimal(tariff['PER_KM']),
+        minimum_fare=Decimal(tariff['MINIMUM_FARE']),
+    )
+
+
+def distance_km(pickup, destination):
+    return distance_matrix()[pickup][destination]
+
+
+def suggested_fare(distance, tariff=None):
+    """Base fare plus the per-km rate, rounded to the peso and never below the minimum"""
+    tariff = tariff or get_tariff()
+    fare = (tariff.base_fare + tariff.per_km * distance).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+    return max(fare, tariff.minimum_fare).quantize(Decimal('0.01'))
+
+
+def quote(pickup, destination, tariff=None):
+    distance = distance_km(pickup, destination)
+    return Quote(distance, suggested_fare(distance, tariff))
+
+
+def fare_table(tariff=None):
+    """Every landmark pair's quote as plain strings, for the booking page's live estimate"""
+    tariff = tariff or get_tariff()
+    table = {}
+    for origin in LANDMARKS:
+        table[origin] = {}
+        for destination in LANDMARKS:
+            distance, fare = quote(origin, destination, tariff)
+            table[origin][destination] = {'distance': str(distance), 'fare': str(fare)}
+    return table
+
+
+# Bulk repricing
+
+def distance_expression():
+    """SQL CASE mapping each ride's (pickup, destination) to the matrix distance"""
+    matrix = distance_matrix()
+    return Case(
+        *[When(pickup=origin, destination=destination, then=Value(km))
+          for origin, row in matrix.items() for destination, km in row.items()],
+        default=F('total_distance'),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def fare_expression(distance, tariff=None):
+    """SQL version of ``suggested_fare`` over a distance expression"""
+    tariff = tariff or get_tariff()
+    return Greatest(
+        Value(tariff.minimum_fare),
+        Round(Value(tariff.base_fare) + Value(tariff.per_km) * distance),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def reprice_rides(queryset, tariff=None):
+    """
+    Reset ``total_distance`` and ``price`` on every ride in ``queryset`` with
+    one UPDATE. Like any ``update()`` this skips ``Ride.save()``, so callers
+    that touch completed rides must rebuild the ride stats afterwards.
+    """
+    distance = distance_expression()
+    return queryset.update(total_distance=distance, price=fare_expression(distance, tariff))
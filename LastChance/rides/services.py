@@ -0,0 +1,15 @@
+from . import state_machine
+
+
+def try_accept_ride(ride_id, rider):
+    """
+    Assign a pending ride to ``rider`` with one conditional UPDATE.
+
+    Only the first of any number of concurrent callers matches
+    ``status='PENDING' AND rider_id IS NULL``, so exactly one wins. Returns
+    the accepted ride for the winner and None for everyone else.
+    """
+    try:
+        return state_machine.accept(ride_id, rider)
+    except state_machine.IllegalTransition:
+        return None
@@ -0,0 +1,161 @@
+"""
+Ride status transitions.
+
+Each transition moves a ride between statuses and records one RideEvent.
+``apply()`` does both in a single transaction with as few statements as it
+can: one conditional UPDATE of the ride, which only matches while the ride
+is still in a legal source status (so concurrent requests cannot both win),
+the UserRideStats counters that actually change, and the event INSERT. The
+event's ``ride`` is the instance already in hand, so saving and publishing
+it never fetches the ride again.
+
+Views go through this module rather than saving ``status`` and creating
+events themselves. RideEvent.save() no longer touches its ride, so an event
+created elsewhere (the admin, imports) is a log entry only.
+
+=========  ==============================  =========  ====
+name       from                            to         step
+=========  ==============================  =========  ====
+request    (new ride)                      PENDING    1
+edit       PENDING, unassigned             PENDING    1
+accept     PENDING, unassigned             ACCEPTED   2
+arrive     ACCEPTED                        ACCEPTED   3
+start      ACCEPTED                        ONGOING    4
+complete   ONGOING                         COMPLETED  5
+cancel     PENDING, ACCEPTED, ONGOING      CANCELLED  6
+=========  ==============================  =========  ====
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from payments.services import pay_for_rides
+from .feed import invalidate_pending_feed
+from .models import Ride, RideEvent, UserRideStats
+
+Transition = namedtuple('Transition', ['name', 'sources', 'target', 'step', 'unassigned'])
+
+REQUEST = Transition('request', (), 'PENDING', 1, True)
+EDIT = Transition('edit', ('PENDING',), 'PENDING', 1, True)
+ACCEPT = Transition('accept', ('PENDING',), 'ACCEPTED', 2, True)
+ARRIVE = Transition('arrive', ('ACCEPTED',), 'ACCEPTED', 3, False)
+START = Transition('start', ('ACCEPTED',), 'ONGOING', 4, False)
+COMPLETE = Transition('complete', ('ONGOING',), 'COMPLETED', 5, False)
+CANCEL = Transition('cancel', ('PENDING', 'ACCEPTED', 'ONGOING'), 'CANCELLED', 6, False)
+
+TRANSITIONS = (REQUEST, EDIT, ACCEPT, ARRIVE, START, COMPLETE, CANCEL)
+
+
+class IllegalTransition(Exception):
+    def __init__(self, ride_id, transition, status=None):
+        self.ride_id = ride_id
+        self.transition = transition
+        self.status = status
+        super().__init__(f"Ride {ride_id} cannot {transition.name} from status {status or 'unknown'}.")
+
+
+def transition_to(status, current):
+    """The transition that moves a ride in ``current`` status to ``status``, or None if none does"""
+    for transition in TRANSITIONS:
+        if transition.target == status and current in transition.sources:
+            return transition
+    return None
+
+
+def _touches_feed(transition):
+    return 'PENDING' in transition.sources or transition.target == 'PENDING'
+
+
+def request_ride(ride, description=''):
+    """Save a new ride as PENDING and record that it was requested"""
+    with transaction.atomic(savepoint=False):
+        ride.status = REQUEST.target
+        ride.save()
+        event = RideEvent.objects.create(ride=ride, step=REQUEST.step, description=description)
+        invalidate_pending_feed()
+    return event
+
+
+def apply(ride, transition, description='', **changes):
+    """
+    Move ``ride`` through ``transition``, also writing ``changes`` (other
+    Ride fields) in the same UPDATE, and record the event. Raises
+    IllegalTransition, without writing anything, if the ride is no longer
+    in one of the transition's source statuses.
+    """
+    if transition is REQUEST:
+        raise ValueError('New rides go through request_ride().')
+    old_state = ride._stored_stats_state()
+    now = timezone.now()
+    rides = Ride.objects.filter(pk=ride.pk, status__in=transition.sources)
+    if transition.unassigned:
+        rides = rides.filter(rider__isnull=True)
+
+    # No savepoint: a failed transition writes nothing, so there is nothing to roll back to
+    with transaction.atomic(savepoint=False):
+        moved = rides.update(status=transition.target, updated_at=now, **changes)
+        if moved:
+            for name, value in changes.items():
+                setattr(ride, name, value)
+            ride.status = transition.target
+            ride.updated_at = now
+            new_state = ride._current_stats_state()
+            UserRideStats.apply_ride_change(old_state, new_state)
+            ride._stats_state = new_state
+
+            event = RideEvent.objects.create(ride=ride, step=transition.step, description=description)
+            if _touches_feed(transition):
+                invalidate_pending_feed()
+    if not moved:
+        raise IllegalTransition(ride.pk, transition, ride.status)
+    return event
+
+
+def accept(ride_id, rider, description=None):
+    """
+    Assign a pending ride to ``rider`` by id and return it with its customer
+    loaded. Only one of any number of concurrent callers matches the
+    conditional UPDATE; everybody else gets IllegalTransition.
+    """
+    now = timezone.now()
+    with transaction.atomic(savepoint=False):
+        moved = Ride.objects.filter(pk=ride_id, status__in=ACCEPT.sources, rider__isnull=True).update(
+            rider=rider, status=ACCEPT.target, updated_at=now,
+        )
+        if moved:
+            ride = Ride.objects.select_related('customer').get(pk=ride_id)
+            ride.rider = rider
+            new_state = ride._current_stats_state()
+            UserRideStats.apply_ride_change(new_state._replace(rider_id=None, status='PENDING'), new_state)
+
+            RideEvent.objects.create(
+                ride=ride,
+                step=ACCEPT.step,
+                description=description or f"Ride accepted by {rider.get_full_name()}",
+            )
+            invalidate_pending_feed()
+    if not moved:
+        raise IllegalTransition(ride_id, ACCEPT)
+    return ride
+
+
+def complete(ride, actor):
+    """
+    Finish an ongoing ride and pay its rider from the customer's balance, as
+    one event. Raises payments.services.InsufficientBalance, leaving the ride
+    ongoing, if the customer cannot pay.
+    """
+    if ride.rider_id is None:
+        raise IllegalTransition(ride.pk, COMPLETE, ride.status)
+    customer, rider = ride.customer, ride.rider
+    description = (
+        f"Ride completed by {actor.get_full_name()}. Payment of ₱{ride.price} transferred from "
+        f"{customer.get_full_name()} to {rider.get_full_name()}"
+    )
+    # Paying first takes the balance locks before the ride's, in the same
+    # order as every other transfer; a lost race rolls the payment back
+    with transaction.atomic():
+        balances = pay_for_rides([ride])
+        event = apply(ride, COMPLETE, description)
+    return event, balances
@@ -0,0 +1,215 @@
+"""
+Live ride updates over Server-Sent Events.
+
+Publishers are ordinary synchronous code (views, services, model saves);
+subscribers are long-lived async responses served through ``LastC.asgi``.
+The two meet in ``broker``, an in-process fan-out: each open stream owns a
+bounded ``asyncio.Queue`` and publishing hands the message to every queue on
+its channel with ``call_soon_threadsafe``. A stream that falls too far behind
+is closed rather than allowed to grow without bound; EventSource reconnects
+and catches up from ``Last-Event-ID``.
+
+Channels:
+
+* ``ride:<pk>``: every RideEvent of one ride.
+* ``pending``: rides entering (``pending-ride``) or leaving
+  (``pending-removed``) the riders' available-rides feed.
+
+Streams only work under ASGI (``settings.ASYNC_VIEWS``): a WSGI server drains
+an async iterator before sending anything, so a never-ending stream would
+hold its worker forever. Under WSGI the stream views answer 204, which tells
+EventSource not to reconnect, and pages leave the EventSource script out.
+
+The broker only reaches streams in the same process. Under several worker
+processes, replace ``broker`` with one backed by a shared message bus that
+has the same ``subscribe``/``unsubscribe``/``publish`` methods.
+"""
+import asyncio
+import json
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+Message = namedtuple('Message', 'event id data')
+
+# Sentinel pushed to a subscriber whose queue overflowed
+OVERFLOW = Message('overflow', None, None)
+
+
+def enabled():
+    """Whether this process can serve streams, i.e. runs under LastC.asgi"""
+    return settings.ASYNC_VIEWS
+
+
+def _queue_size():
+    return getattr(settings, 'RIDE_STREAM_QUEUE_SIZE', 100)
+
+
+class Subscription:
+    def __init__(self, channel, loop):
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=_queue_size())
+        self.closed = False
+
+    def deliver(self, message):
+        """Runs on the subscriber's event loop"""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.closed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._counters = {'published': 0, 'delivered': 0}
+
+    def subscribe(self, channel):
+        """Open a subscription on the running event loop"""
+        subscription = Subscription(channel, asyncio.get_running_loop())
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, event, data, id=None):
+        """Send to every subscriber of ``channel``; safe to call from any thread"""
+        message = Message(event, id, data)
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+            self._counters['published'] += 1
+            self._counters['delivered'] += len(subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The subscriber's loop has shut down
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['channels'] = len(self._channels)
+            stats['subscribers'] = sum(len(subs) for subs in self._channels.values())
+        return stats
+
+
+broker = InProcessBroker()
+
+
+def publish_on_commit(channel, event, data, id=None):
+    transaction.on_commit(lambda: broker.publish(channel, event, data, id=id))
+
+
+def ride_channel(ride_id):
+    return f'ride:{ride_id}'
+
+
+PENDING_CHANNEL = 'pending'
+
+
+# Payloads
+
+def ride_event_payload(event):
+    return {
+        'id': event.pk,
+        'ride': event.ride_id,
+        'step': event.step,
+        'step_display': event.get_step_display(),
+        'description': event.description,
+        'status': event.ride.status,
+        'status_display': event.ride.get_status_display(),
+        'created_at': timezone.localtime(event.created_at).isoformat(),
+    }
+
+
+def pending_ride_payload(ride):
+    return {
+        'id': ride.pk,
+        'customer': ride.customer.get_full_name(),
+        'pickup': ride.get_pickup_display(),
+        'destination': ride.get_destination_display(),
+        'total_distance': str(ride.total_distance),
+        'price': str(ride.price),
+        'created_at': timezone.localtime(ride.created_at).isoformat(),
+    }
+
+
+def publish_ride_event(event):
+    """Announce a saved RideEvent to the ride's stream and, where relevant, the pending feed"""
+    ride = event.ride
+    publish_on_commit(ride_channel(ride.pk), 'ride-event', ride_event_payload(event), id=event.pk)
+    if ride.status == 'PENDING' and ride.rider_id is None:
+        publish_on_commit(PENDING_CHANNEL, 'pending-ride', pending_ride_payload(ride))
+    elif event.step in (2, 6):
+        publish_pending_removed(ride.pk)
+
+
+def publish_pending_removed(ride_id):
+    publish_on_commit(PENDING_CHANNEL, 'pending-removed', {'id': ride_id})
+
+
+# Wire format
+
+def format_sse(message):
+    lines = []
+    if message.id is not None:
+        lines.append(f'id: {message.id}')
+    lines.append(f'event: {message.event}')
+    lines.append(f'data: {json.dumps(message.data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def event_stream(channel, backlog=None, keepalive=None):
+    """
+    Yield SSE frames for ``channel``: first whatever ``backlog()`` (an async
+    iterable of Messages the client missed) produces, then live messages,
+    with a comment line every ``keepalive`` seconds so proxies keep the
+    connection open.
+
+    Subscribing happens on the first iteration, on the loop that serves the
+    response, and before the backlog is read so nothing falls in between.
+    """
+    keepalive = keepalive or getattr(settings, 'RIDE_STREAM_KEEPALIVE', 15)
+    subscription = broker.subscribe(channel)
+    seen = set()
+    try:
+        yield f'retry: {getattr(settings, "RIDE_STREAM_RETRY_MS", 3000)}\n\n'
+        if backlog is not None:
+            async for message in backlog():
+                seen.add(message.id)
+                yield format_sse(message)
+        while True:
+            try:
+                message = await subscription.get(keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if message is OVERFLOW:
+                return
+            if message.id is not None and message.id in seen:
+                continue
+            yield format_sse(message)
+    finally:
+        broker.unsubscribe(subscription)
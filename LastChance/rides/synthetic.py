@@ -0,0 +1,156 @@
+"""
+Reproducible synthetic users, rides and event trails for benchmarks.
+
+Everything is drawn from generators seeded with ``seed``, so a given seed and
+set of counts always produces the same data: the same status mix over the
+Clark landmarks, the same prices (from ``routing.quote``) and the same event
+trail for every ride. Timestamps are placed relative to ``now`` (rides over
+the last ``days`` days, each trail a few minutes apart), which keeps "today"
+and "this week" figures comparable between runs on different days.
+
+Rows go in with ``bulk_create`` a batch at a time, each batch in its own
+transaction. That bypasses ``Ride.save()``, so callers rebuild UserRideStats
+afterwards, as ``import_rides`` does. Users share one password hash, so
+hashing costs nothing per user and every generated account can log in.
+"""
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from . import routing
+from .bulk import Progress, keep_timestamps
+from .models import Ride, RideEvent
+
+# Relative weights of final statuses; live rides are a thin slice of a long history
+STATUS_MIX = (
+    ('COMPLETED', 80),
+    ('CANCELLED', 14),
+    ('PENDING', 3),
+    ('ACCEPTED', 2),
+    ('ONGOING', 1),
+)
+
+# Event steps each status has been through
+TRAILS = {
+    'PENDING': (1,),
+    'ACCEPTED': (1, 2),
+    'ONGOING': (1, 2, 3, 4),
+    'COMPLETED': (1, 2, 3, 4, 5),
+    'CANCELLED': (1, 6),
+}
+
+# Share of cancelled rides that had been accepted first (and so have a rider)
+CANCELLED_AFTER_ACCEPT = 0.4
+
+FIRST_NAMES = ('Ana', 'Ben', 'Carla', 'Dante', 'Elena', 'Felix', 'Gina', 'Hugo', 'Ivy', 'Jose', 'Kara', 'Luis')
+LAST_NAMES = ('Santos', 'Reyes', 'Cruz', 'Bautista', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Ramos', 'Lopez')
+
+
+def username(prefix, role, n):
+    return f'{prefix}-{role.lower()}-{n}'
+
+
+def create_users(role, count, rng, prefix='synthetic', password='synthetic', batch_size=2000):
+    """
+    Make sure ``count`` generated users with ``role`` exist, creating the
+    missing ones; returns their ids in order
+    """
+    existing = CustomUser.objects.filter(user_role=role, username__startswith=f'{prefix}-{role.lower()}-')
+    start = existing.count()
+    password_hash = make_password(password)
+    users = []
+    for n in range(start, count):
+        users.append(CustomUser(
+            username=username(prefix, role, n),
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            email=f'{username(prefix, role, n)}@example.com',
+            user_role=role,
+            is_staff=role == 'STAFF',
+            balance=Decimal(rng.randrange(0, 500_000)) / 100 if role == 'CUSTOMER' else Decimal('0.00'),
+            password=password_hash,
+        ))
+    for i in range(0, len(users), batch_size):
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users[i:i + batch_size])
+    return list(
+        CustomUser.objects.filter(user_role=role, username__startswith=f'{prefix}-{role.lower()}-')
+        .order_by('pk').values_list('pk', flat=True)[:count]
+    )
+
+
+def _ride(rng, customer_ids, rider_ids, statuses, weights, quotes, now, days):
+    status = rng.choices(statuses, weights)[0]
+    steps = TRAILS[status]
+    if status == 'CANCELLED' and rng.random() < CANCELLED_AFTER_ACCEPT:
+        steps = (1, 2, 6)
+    pickup, destination = rng.sample(routing.LANDMARKS, 2)
+    distance, fare = quotes[pickup, destination]
+    if status in ('PENDING', 'ACCEPTED', 'ONGOING'):
+        # Live rides are recent
+        created_at = now - timezone.timedelta(seconds=rng.randrange(60, 3 * 3600))
+    else:
+        created_at = now - timezone.timedelta(seconds=rng.randrange(3600, days * 86400))
+    moments = [created_at]
+    for _ in steps[1:]:
+        moments.append(moments[-1] + timezone.timedelta(seconds=rng.randrange(60, 900)))
+    ride = Ride(
+        customer_id=rng.choice(customer_ids),
+        rider_id=rng.choice(rider_ids) if 2 in steps else None,
+        pickup=pickup,
+        destination=destination,
+        total_distance=distance,
+        price=fare,
+        status=status,
+        created_at=created_at,
+        updated_at=moments[-1],
+    )
+    return ride, list(zip(steps, moments))
+
+
+def create_rides(count, customer_ids, rider_ids, rng, now=None, days=365, batch_size=5000, progress=None):
+    """Insert ``count`` rides and their event trails; returns the number of rides created"""
+    if not customer_ids or not rider_ids:
+        raise ValueError('Generating rides needs at least one customer and one rider.')
+    now = now or timezone.now()
+    statuses, weights = zip(*STATUS_MIX)
+    progress = progress or Progress()
+    step_labels = dict(RideEvent.STEP_CHOICES)
+    quotes = {(a, b): routing.quote(a, b) for a in routing.LANDMARKS for b in routing.LANDMARKS if a != b}
+
+    with keep_timestamps(Ride), keep_timestamps(RideEvent):
+        for start in range(0, count, batch_size):
+            rides, trails = [], []
+            for _ in range(min(batch_size, count - start)):
+                ride, trail = _ride(rng, customer_ids, rider_ids, statuses, weights, quotes, now, days)
+                rides.append(ride)
+                trails.append(trail)
+            with transaction.atomic():
+                # Ids come back from the INSERT on PostgreSQL and SQLite, so events can point at them
+                Ride.objects.bulk_create(rides)
+                RideEvent.objects.bulk_create([
+                    RideEvent(ride_id=ride.pk, step=step, description=step_labels[step], created_at=moment)
+                    for ride, trail in zip(rides, trails)
+                    for step, moment in trail
+                ])
+            progress.add(len(rides))
+    return progress.rows
+
+
+def generate(rides, riders, customers, staff=1, seed=0, prefix='synthetic', password='synthetic', days=365,
+             batch_size=5000, progress=None):
+    """
+    Top the generated users up to the given counts and add ``rides`` rides
+    among them; returns ``(rider ids, customer ids, staff ids)``
+    """
+    # Separate streams, so the rides do not depend on how many users already existed
+    users_rng, rides_rng = random.Random(f'users-{seed}'), random.Random(f'rides-{seed}')
+    rider_ids = create_users('RIDER', riders, users_rng, prefix, password)
+    customer_ids = create_users('CUSTOMER', customers, users_rng, prefix, password)
+    staff_ids = create_users('STAFF', staff, users_rng, prefix, password)
+    create_rides(rides, customer_ids, rider_ids, rides_rng, days=days, batch_size=batch_size, progress=progress)
+    return rider_ids, customer_ids, staff_ids
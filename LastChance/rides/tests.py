@@ -1,3 +1,948 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import re
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages import get_messages
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from LastC.testing import AsyncViewMixin, QueryPlanMixin
+from . import archive, async_views, bulk, dispatch, feed, routing, services, state_machine, streams, synthetic, views
+from .models import ArchivedRide, ArchivedRideEvent, Ride, RideEvent, RideHistory, UserRideStats
+from .pagination import CursorPaginator
+
+
+class RideTestMixin:
+    @classmethod
+    def create_user(cls, username, role, **extra):
+        user = CustomUser(username=username, user_role=role, first_name=username.title(), last_name='Test', **extra)
+        user.set_unusable_password()
+        user.save()
+        return user
+
+    @classmethod
+    def create_ride(cls, customer, rider=None, **extra):
+        values = {
+            'pickup': 'CLARK_MAIN',
+            'destination': 'SM_CLARK',
+            'total_distance': Decimal('4.00'),
+            'price': Decimal('100.00'),
+        }
+        values.update(extra)
+        return Ride.objects.create(customer=customer, rider=rider, **values)
+
+
+class UserRideStatsTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = cls.create_user('rider', 'RIDER')
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+
+    def stats(self, user):
+        return UserRideStats.for_user(user)
+
+    def test_status_transitions_update_both_parties(self):
+        ride = self.create_ride(self.customer, self.rider, status='ACCEPTED')
+        self.assertEqual(self.stats(self.rider).active_as_rider, 1)
+        self.assertEqual(self.stats(self.customer).rides_as_customer, 1)
+
+        ride.status = 'COMPLETED'
+        ride.save()
+        rider_stats = self.stats(self.rider)
+        self.assertEqual(rider_stats.active_as_rider, 0)
+        self.assertEqual(rider_stats.completed_as_rider, 1)
+        self.assertEqual(rider_stats.total_earnings, Decimal('100.00'))
+        self.assertEqual(rider_stats.total_distance, Decimal('4.00'))
+        customer_stats = self.stats(self.customer)
+        self.assertEqual(customer_stats.completed_as_customer, 1)
+        self.assertEqual(customer_stats.total_spent, Decimal('100.00'))
+        self.assertEqual(customer_stats.last_ride_at, ride.created_at)
+
+    def test_reloaded_and_deferred_rides(self):
+        ride = self.create_ride(self.customer, self.rider, status='ONGOING')
+        ride = Ride.objects.only('status').get(pk=ride.pk)
+        ride.status = 'CANCELLED'
+        ride.save(update_fields=['status'])
+        self.assertEqual(self.stats(self.rider).cancelled_as_rider, 1)
+        self.assertEqual(self.stats(self.rider).active_as_rider, 0)
+        self.assertEqual(self.stats(self.customer).cancelled_as_customer, 1)
+
+    def test_delete_removes_contribution(self):
+        ride = self.create_ride(self.customer, self.rider, status='COMPLETED')
+        Ride.objects.get(pk=ride.pk).delete()
+        self.assertEqual(self.stats(self.rider).completed_as_rider, 0)
+        self.assertEqual(self.stats(self.customer).total_spent, Decimal('0.00'))
+
+    def test_unsaved_stats_for_new_user(self):
+        stats = self.stats(self.create_user('newbie', 'RIDER'))
+        self.assertTrue(stats._state.adding)
+        self.assertEqual(stats.total_earnings, Decimal('0.00'))
+
+    def test_rebuild_command_repairs_drift(self):
+        self.create_ride(self.customer, self.rider, status='COMPLETED')
+        self.create_ride(self.customer, self.rider, status='ACCEPTED', price=Decimal('60.00'))
+        # Queryset updates bypass Ride.save()
+        Ride.objects.filter(status='ACCEPTED').update(status='COMPLETED')
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_ride_stats', '--verify', stdout=StringIO())
+
+        call_command('rebuild_ride_stats', stdout=StringIO())
+        call_command('rebuild_ride_stats', '--verify', stdout=StringIO())
+        self.assertEqual(self.stats(self.rider).completed_as_rider, 2)
+        self.assertEqual(self.stats(self.rider).total_earnings, Decimal('160.00'))
+        self.assertEqual(self.stats(self.customer).rides_as_customer, 2)
+
+
+class RideQueryPlanTests(RideTestMixin, QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = cls.create_user('rider', 'RIDER')
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+        cls.staff = cls.create_user('staff', 'STAFF', is_staff=True)
+        cls.ride = cls.create_ride(cls.customer, cls.rider, status='ACCEPTED')
+        cls.create_ride(cls.customer)
+
+    def list_page(self, view):
+        queryset = view.get_queryset()
+        return queryset[:view.get_paginate_by(queryset)]
+
+    def test_ride_list_view(self):
+        for user in (self.rider, self.customer, self.staff):
+            with self.subTest(user=user.username):
+                self.assertNoFullScan(self.list_page(self.make_view(views.RideListView, user)))
+
+    def test_ride_detail_view(self):
+        view = self.make_view(views.RideDetailView, self.customer, pk=self.ride.pk)
+        self.assertNoFullScan(view.get_queryset().filter(pk=self.ride.pk))
+        view.object = view.get_object()
+        self.assertNoFullScan(view.get_context_data()['events'])
+
+    def test_rider_dashboard_view(self):
+        view = self.make_view(views.RiderDashboardView, self.rider)
+        self.assertNoFullScan(self.list_page(view))
+        view.object_list = view.get_queryset()
+        self.assertNoFullScan(view.get_context_data()['active_rides'])
+
+    def test_history_views(self):
+        self.assertNoFullScan(self.list_page(self.make_view(views.RiderRideHistoryView, self.rider)))
+        self.assertNoFullScan(self.list_page(self.make_view(views.CustomerRideHistoryView, self.customer)))
+        self.assertNoFullScan(UserRideStats.objects.filter(user=self.rider))
+
+
+class CursorPaginatorTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+        for _ in range(25):
+            cls.create_ride(cls.customer)
+        # Give several rides the same timestamp so the id tiebreak matters
+        Ride.objects.filter(pk__in=Ride.objects.order_by('pk').values('pk')[5:10]).update(created_at=timezone.now())
+
+    def expected_ids(self):
+        return list(Ride.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_walk_forward_and_back(self):
+        paginator = CursorPaginator(Ride.objects.all(), 10)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([ride.id for page in pages for ride in page], self.expected_ids())
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual([ride.id for ride in back], [ride.id for ride in pages[1]])
+        self.assertTrue(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_single_query_per_page(self):
+        paginator = CursorPaginator(Ride.objects.all(), 10)
+        cursor = paginator.page().next_cursor
+        with self.assertNumQueries(1):
+            paginator.page(cursor)
+
+    def test_invalid_cursor_is_404(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('customer-active-rides'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_view_links_to_next_page(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('customer-active-rides'))
+        page = response.context['page_obj']
+        self.assertTrue(page.has_next())
+        self.assertContains(response, f'cursor={page.next_cursor}')
+
+
+class ListQueryCountTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+        cls.staff = cls.create_user('staff', 'STAFF', is_staff=True, is_superuser=True)
+        cls.riders = [cls.create_user(f'rider{i}', 'RIDER') for i in range(10)]
+
+    def count_queries(self, url, user, rides):
+        Ride.objects.all().delete()
+        for rider in self.riders[:rides]:
+            self.create_ride(self.customer, rider, status='ACCEPTED')
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_ride_list_query_count_is_constant(self):
+        url = reverse('ride-list')
+        self.assertEqual(self.count_queries(url, self.customer, 2), self.count_queries(url, self.customer, 10))
+
+    def test_admin_changelist_query_count_is_constant(self):
+        url = reverse('admin:rides_ride_changelist')
+        self.assertEqual(self.count_queries(url, self.staff, 2), self.count_queries(url, self.staff, 10))
+
+
+class PendingFeedCacheTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = cls.create_user('rider', 'RIDER')
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+
+    def setUp(self):
+        cache.clear()
+        feed.reset_feed_cache_stats()
+        self.ride = self.create_ride(self.customer)
+        self.client.force_login(self.rider)
+
+    def available_ids(self):
+        response = self.client.get(reverse('rider-dashboard'))
+        return [ride.pk for ride in response.context['available_rides']]
+
+    def test_repeat_loads_hit_the_cache(self):
+        self.assertEqual(self.available_ids(), [self.ride.pk])
+        with CaptureQueriesContext(connection) as queries:
+            self.available_ids()
+        self.assertEqual(feed.feed_cache_stats()['hits'], 1)
+        self.assertEqual(feed.feed_cache_stats()['misses'], 1)
+        self.assertFalse(any('IS NULL' in query['sql'] for query in queries.captured_queries))
+
+    def test_accepting_invalidates_the_feed(self):
+        self.assertEqual(self.available_ids(), [self.ride.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('accept-ride', args=[self.ride.pk]))
+        self.assertEqual(self.available_ids(), [])
+        self.assertEqual(feed.feed_cache_stats()['invalidations'], 1)
+
+    def test_cursors_are_checked_before_they_reach_the_cache(self):
+        response = self.client.get(reverse('rider-dashboard'), {'cursor': 'x' * 5000})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(feed.feed_cache_stats()['misses'], 0)
+
+        paginator = CursorPaginator(Ride.objects.filter(status='PENDING'), 1)
+        cursor = paginator.encode_cursor(self.ride, 'next')
+        key = feed._page_key(1, paginator, cursor)
+        self.assertNotIn(cursor, key)
+        self.assertLess(len(key), 120)
+
+    def test_deleting_invalidates_after_the_ride_is_gone(self):
+        self.assertEqual(self.available_ids(), [self.ride.pk])
+        # Outside a transaction on_commit runs at once, so what matters is when the view asks for it
+        seen = []
+        invalidate = views.invalidate_pending_feed
+
+        def recording_invalidate():
+            seen.append(Ride.objects.filter(pk=self.ride.pk).exists())
+            invalidate()
+
+        self.client.force_login(self.customer)
+        with mock.patch.object(views, 'invalidate_pending_feed', recording_invalidate):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('ride-delete', args=[self.ride.pk]))
+        self.assertRedirects(response, reverse('ride-list'), fetch_redirect_response=False)
+        self.assertEqual(seen, [False])
+        self.client.force_login(self.rider)
+        self.assertEqual(self.available_ids(), [])
+
+    def test_invalidation_waits_for_commit(self):
+        version = feed.get_feed_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            feed.invalidate_pending_feed()
+            self.assertEqual(feed.get_feed_version(), version)
+        callbacks[0]()
+        self.assertEqual(feed.get_feed_version(), version + 1)
+
+
+class AcceptRideTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = cls.create_user('rider', 'RIDER')
+        cls.other_rider = cls.create_user('other', 'RIDER')
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+
+    def setUp(self):
+        self.ride = self.create_ride(self.customer)
+
+    def test_first_rider_wins(self):
+        accepted = services.try_accept_ride(self.ride.pk, self.rider)
+        self.assertEqual(accepted.rider, self.rider)
+        self.assertEqual(accepted.status, 'ACCEPTED')
+        self.assertIsNone(services.try_accept_ride(self.ride.pk, self.other_rider))
+
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.rider, self.rider)
+        self.assertEqual(RideEvent.objects.filter(ride=self.ride, step=2).count(), 1)
+
+    def test_stats_follow_the_update(self):
+        services.try_accept_ride(self.ride.pk, self.rider)
+        self.assertEqual(UserRideStats.for_user(self.rider).active_as_rider, 1)
+        self.assertEqual(UserRideStats.for_user(self.other_rider).active_as_rider, 0)
+        out = StringIO()
+        call_command('rebuild_ride_stats', '--verify', stdout=out)
+
+    def test_json_endpoint(self):
+        url = reverse('api-accept-ride', args=[self.ride.pk])
+        self.client.force_login(self.rider)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['ride']['id'], self.ride.pk)
+
+        self.client.force_login(self.other_rider)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(response.json()['accepted'])
+
+    def test_json_endpoint_rejections(self):
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.post(reverse('api-accept-ride', args=[self.ride.pk])).status_code, 403)
+        self.client.force_login(self.rider)
+        self.assertEqual(self.client.get(reverse('api-accept-ride', args=[self.ride.pk])).status_code, 405)
+        self.assertEqual(self.client.post(reverse('api-accept-ride', args=[self.ride.pk + 1])).status_code, 404)
+
+    def test_losing_rider_sees_an_error(self):
+        services.try_accept_ride(self.ride.pk, self.rider)
+        self.client.force_login(self.other_rider)
+        response = self.client.post(reverse('accept-ride', args=[self.ride.pk]))
+        self.assertRedirects(response, reverse('rider-dashboard'))
+        messages = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertEqual(messages, ['This ride cannot be accepted.'])
+
+
+class RideStateMachineTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = cls.create_user('rider', 'RIDER')
+        cls.customer = cls.create_user('customer', 'CUSTOMER', balance=Decimal('500.00'))
+        cls.staff = cls.create_user('staff', 'STAFF', is_staff=True)
+
+    def setUp(self):
+        self.ride = self.create_ride(self.customer, self.rider, status='ACCEPTED')
+
+    def test_transition_table(self):
+        self.assertIs(state_machine.transition_to('ONGOING', 'ACCEPTED'), state_machine.START)
+        self.assertIs(state_machine.transition_to('CANCELLED', 'ONGOING'), state_machine.CANCEL)
+        self.assertIsNone(state_machine.transition_to('ONGOING', 'PENDING'))
+        self.assertIsNone(state_machine.transition_to('PENDING', 'COMPLETED'))
+
+    def test_each_step_is_one_update_and_one_event(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(2):
+                state_machine.apply(self.ride, state_machine.ARRIVE, 'Rider arrived')
+            with self.assertNumQueries(2):
+                state_machine.apply(self.ride, state_machine.START)
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.status, 'ONGOING')
+        self.assertEqual(list(self.ride.events.values_list('step', flat=True).order_by('id')), [3, 4])
+        call_command('rebuild_ride_stats', '--verify', stdout=StringIO())
+
+    def test_stale_ride_is_refused(self):
+        Ride.objects.filter(pk=self.ride.pk).update(status='CANCELLED')
+        with self.assertRaises(state_machine.IllegalTransition):
+            state_machine.apply(self.ride, state_machine.START)
+        self.assertFalse(self.ride.events.exists())
+
+    def test_events_do_not_move_the_ride(self):
+        RideEvent.objects.create(ride=self.ride, step=5, description='Logged by hand')
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.status, 'ACCEPTED')
+
+    def test_completing_pays_once_with_one_event(self):
+        state_machine.apply(self.ride, state_machine.START)
+        self.client.force_login(self.rider)
+        url = reverse('update-ride-status', args=[self.ride.pk])
+        # The ride page posts JSON
+        response = self.client.post(url, {'status': 'COMPLETED'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rider_balance'], '100.00')
+        self.assertEqual(self.ride.events.filter(step=5).count(), 1)
+        self.assertEqual(self.client.post(url, {'status': 'COMPLETED'}).status_code, 400)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.balance, Decimal('400.00'))
+
+    def test_illegal_status_change_is_rejected(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('update-ride-status', args=[self.ride.pk]), {'status': 'PENDING'})
+        self.assertEqual(response.status_code, 400)
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.status, 'ACCEPTED')
+
+
+class DispatchTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.near = cls.create_user('near', 'RIDER')
+        cls.far = cls.create_user('far', 'RIDER')
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+
+    def setUp(self):
+        self.index = dispatch.RiderIndex()
+        self.index.set_online(self.far.pk, 'FONTANA', now=0)
+        self.index.set_online(self.near.pk, 'CLARK_MAIN', now=1)
+
+    def test_travel_matrix(self):
+        for origin in dispatch.LANDMARKS:
+            self.assertEqual(dispatch.NEIGHBOURS[origin][0][1], origin)
+            for target in dispatch.LANDMARKS:
+                self.assertAlmostEqual(
+                    dispatch.travel_minutes(origin, target), dispatch.travel_minutes(target, origin)
+                )
+
+    def test_nearest_ranks_by_travel_time(self):
+        ranked = self.index.nearest('SM_CLARK', k=5)
+        self.assertEqual([c.rider_id for c in ranked], [self.near.pk, self.far.pk])
+        self.assertEqual([c.rider_id for c in self.index.nearest('SM_CLARK', k=1)], [self.near.pk])
+
+        self.index.set_offline(self.near.pk)
+        self.assertEqual([c.rider_id for c in self.index.nearest('SM_CLARK')], [self.far.pk])
+
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(4)
+        index = dispatch.RiderIndex()
+        for rider_id, now in enumerate(sorted(rng.uniform(0, 600) for _ in range(300))):
+            index.set_online(rider_id, rng.choice(dispatch.LANDMARKS), now=now)
+        score = dispatch.idle_penalty()
+        for pickup in dispatch.LANDMARKS:
+            expected = sorted(
+                score(dispatch.travel_minutes(p.landmark, pickup), p, 900)
+                for landmark in dispatch.LANDMARKS for p in index.riders_at(landmark)
+            )[:7]
+            ranked = index.nearest(pickup, k=7, score=score, now=900)
+            self.assertEqual([c.score for c in ranked], expected)
+
+    def test_same_landmark_prefers_longest_idle(self):
+        self.index.set_online(self.far.pk, 'CLARK_MAIN', now=2)
+        self.assertEqual([c.rider_id for c in self.index.nearest('CLARK_MAIN')], [self.near.pk, self.far.pk])
+
+    def test_dispatch_offers_in_ranked_order(self):
+        ride = self.create_ride(self.customer, pickup='SM_CLARK')
+        offered = []
+
+        def offer(rider, ride, candidate):
+            offered.append(rider)
+            return rider == self.far
+
+        self.assertEqual(dispatch.dispatch_ride(ride, self.index, offer=offer), self.far)
+        self.assertEqual(offered, [self.near, self.far])
+        self.assertNotIn(self.far.pk, self.index)
+        ride.refresh_from_db()
+        self.assertEqual((ride.rider, ride.status), (self.far, 'ACCEPTED'))
+
+    def test_dispatch_stops_when_ride_is_taken(self):
+        ride = self.create_ride(self.customer)
+        services.try_accept_ride(ride.pk, self.far)
+        self.assertIsNone(dispatch.dispatch_ride(ride, self.index))
+        self.assertIn(self.near.pk, self.index)
+
+
+class RoutingTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = cls.create_user('customer', 'CUSTOMER', balance=Decimal('500.00'))
+        cls.rider = cls.create_user('rider', 'RIDER')
+
+    def test_quote(self):
+        distance, fare = routing.quote('CLARK_AIRPORT', 'MARQUEE_MALL')
+        self.assertEqual(distance, Decimal('8.69'))
+        self.assertEqual(fare, Decimal('170.00'))
+        self.assertEqual(routing.quote('CLARK_MAIN', 'CLARK_MAIN').fare, Decimal('50.00'))
+
+    @override_settings(RIDE_TARIFF={'BASE_FARE': '10', 'PER_KM': '20'})
+    def test_tariff_from_settings(self):
+        self.assertEqual(routing.quote('CLARK_AIRPORT', 'MARQUEE_MALL').fare, Decimal('184.00'))
+
+    def test_booking_fills_distance_and_suggested_fare(self):
+        self.client.force_login(self.customer)
+        self.assertContains(self.client.get(reverse('create-ride')), 'id="fareTable"')
+        self.client.post(reverse('create-ride'), {'pickup': 'CLARK_AIRPORT', 'destination': 'MARQUEE_MALL'})
+        ride = Ride.objects.get()
+        self.assertEqual((ride.total_distance, ride.price), (Decimal('8.69'), Decimal('170.00')))
+
+        self.client.post(
+            reverse('create-ride'), {'pickup': 'CLARK_MAIN', 'destination': 'SM_CLARK', 'price': '75'}
+        )
+        self.assertEqual(Ride.objects.get(pickup='CLARK_MAIN').price, Decimal('75.00'))
+
+    def test_booking_below_minimum_is_rejected(self):
+        self.client.force_login(self.customer)
+        response = self.client.post(
+            reverse('create-ride'), {'pickup': 'CLARK_MAIN', 'destination': 'SM_CLARK', 'price': '20'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Ride.objects.exists())
+
+    def test_reprice_command(self):
+        pending = self.create_ride(self.customer, pickup='CLARK_AIRPORT', destination='MARQUEE_MALL')
+        completed = self.create_ride(
+            self.customer, self.rider, pickup='CLARK_AIRPORT', destination='MARQUEE_MALL', status='COMPLETED'
+        )
+
+        call_command('reprice_rides', stdout=StringIO())
+        pending.refresh_from_db()
+        completed.refresh_from_db()
+        self.assertEqual((pending.total_distance, pending.price), (Decimal('8.69'), Decimal('170.00')))
+        self.assertEqual(completed.price, Decimal('100.00'))
+
+        call_command('reprice_rides', '--status', 'COMPLETED', '--per-km', '10', stdout=StringIO())
+        completed.refresh_from_db()
+        self.assertEqual(completed.price, Decimal('127.00'))
+        self.assertEqual(UserRideStats.for_user(self.rider).total_earnings, Decimal('127.00'))
+
+
+class RideStreamTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = cls.create_user('rider', 'RIDER')
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+        cls.stranger = cls.create_user('stranger', 'CUSTOMER')
+        cls.ride = cls.create_ride(cls.customer)
+        cls.requested = RideEvent.objects.create(ride=cls.ride, step=1, description='Requested')
+
+    async def read_frames(self, content, count):
+        frames = []
+        for _ in range(count):
+            frames.append((await asyncio.wait_for(anext(content), 5)).decode())
+        return frames
+
+    async def test_broker_fans_out(self):
+        first = streams.broker.subscribe('test')
+        second = streams.broker.subscribe('test')
+        self.assertEqual(streams.broker.publish('test', 'ping', {'n': 1}, id=7), 2)
+        for subscription in (first, second):
+            self.assertEqual(await subscription.get(1), streams.Message('ping', 7, {'n': 1}))
+            streams.broker.unsubscribe(subscription)
+        self.assertEqual(streams.broker.publish('test', 'ping', {}), 0)
+
+    @override_settings(RIDE_STREAM_QUEUE_SIZE=2)
+    async def test_slow_subscriber_is_cut_off(self):
+        subscription = streams.broker.subscribe('test')
+        for n in range(3):
+            streams.broker.publish('test', 'ping', {'n': n})
+        await asyncio.sleep(0)
+        self.assertEqual(await subscription.get(1), streams.Message('ping', None, {'n': 1}))
+        self.assertIs(await subscription.get(1), streams.OVERFLOW)
+        streams.broker.unsubscribe(subscription)
+
+    def test_events_publish_after_commit(self):
+        with mock.patch.object(streams.broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                services.try_accept_ride(self.ride.pk, self.rider)
+                publish.assert_not_called()
+        channels = [(call.args[0], call.args[1]) for call in publish.call_args_list]
+        self.assertEqual(channels, [(f'ride:{self.ride.pk}', 'ride-event'), ('pending', 'pending-removed')])
+
+    def test_new_ride_reaches_the_pending_channel(self):
+        with mock.patch.object(streams.broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                RideEvent.objects.create(ride=self.create_ride(self.customer), step=1)
+        self.assertEqual(publish.call_args_list[1].args[:2], ('pending', 'pending-ride'))
+
+    @override_settings(ASYNC_VIEWS=True)
+    async def test_ride_stream_replays_then_follows(self):
+        await self.async_client.aforce_login(self.customer)
+        response = await self.async_client.get(
+            reverse('ride-event-stream', args=[self.ride.pk]), headers={'Last-Event-ID': '0'}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        retry, backlog = await self.read_frames(content, 2)
+        self.assertTrue(retry.startswith('retry:'))
+        self.assertIn(f'id: {self.requested.pk}\nevent: ride-event\n', backlog)
+
+        # A duplicate of a replayed event is skipped; new ones follow
+        streams.broker.publish(f'ride:{self.ride.pk}', 'ride-event', {}, id=self.requested.pk)
+        streams.broker.publish(f'ride:{self.ride.pk}', 'ride-event', {'step': 2}, id=self.requested.pk + 1)
+        (live,) = await self.read_frames(content, 1)
+        self.assertIn('data: {"step":2}', live)
+        await content.aclose()
+
+    @override_settings(ASYNC_VIEWS=True)
+    async def test_stream_permissions(self):
+        await self.async_client.aforce_login(self.stranger)
+        response = await self.async_client.get(reverse('ride-event-stream', args=[self.ride.pk]))
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.get(reverse('pending-ride-stream'))
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.get(reverse('ride-event-stream', args=[self.ride.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_no_streams_under_wsgi(self):
+        # A WSGI worker would drain the endless stream before sending a byte
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('ride-detail', args=[self.ride.pk]))
+        self.assertNotContains(response, 'EventSource(')
+        self.assertEqual(self.client.get(reverse('ride-event-stream', args=[self.ride.pk])).status_code, 204)
+        self.client.force_login(self.rider)
+        self.assertNotContains(self.client.get(reverse('rider-dashboard')), 'EventSource(')
+        self.assertEqual(self.client.get(reverse('pending-ride-stream')).status_code, 204)
+
+        with override_settings(ASYNC_VIEWS=True):
+            self.assertContains(self.client.get(reverse('rider-dashboard')), 'EventSource(')
+
+
+class RideApiTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = cls.create_user('rider', 'RIDER')
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+        cls.stranger = cls.create_user('stranger', 'CUSTOMER')
+        cls.accepted = cls.create_ride(cls.customer, cls.rider, status='ACCEPTED')
+        cls.pending = cls.create_ride(cls.customer)
+        RideEvent.objects.create(ride=cls.accepted, step=2, description='Accepted')
+
+    def setUp(self):
+        self.client.force_login(self.customer)
+
+    def test_list_projects_selected_fields(self):
+        url = reverse('api-ride-list')
+        response = self.client.get(url, {'fields': 'id,status,rider_name'})
+        self.assertEqual(response.json()['results'], [
+            {'id': self.pending.pk, 'status': 'PENDING', 'rider_name': None},
+            {'id': self.accepted.pk, 'status': 'ACCEPTED', 'rider_name': 'Rider Test'},
+        ])
+        # Only the selected columns (plus the cursor and validator ones) are read
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'fields': 'status'})
+        self.assertNotIn('"first_name"', queries.captured_queries[-1]['sql'])
+
+        self.assertEqual(self.client.get(url, {'fields': 'status,password'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': '0'}).status_code, 400)
+
+    def test_list_pages_by_cursor(self):
+        first = self.client.get(reverse('api-ride-list'), {'limit': 1, 'fields': 'id'}).json()
+        self.assertEqual(first['results'], [{'id': self.pending.pk}])
+        second = self.client.get(reverse('api-ride-list'), {'limit': 1, 'fields': 'id', 'cursor': first['next']})
+        self.assertEqual(second.json()['results'], [{'id': self.accepted.pk}])
+
+    def test_list_revalidates_by_etag_only(self):
+        url = reverse('api-ride-list')
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+        # Removing the older ride leaves the newest updated_at unchanged
+        Ride.objects.filter(pk=self.accepted.pk).delete()
+        since = timezone.now().strftime('%a, %d %b %Y %H:%M:%S GMT')
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': since}).status_code, 200)
+        changed = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual([ride['id'] for ride in changed.json()['results']], [self.pending.pk])
+
+    def test_unchanged_ride_answers_not_modified(self):
+        url = reverse('api-ride-detail', args=[self.accepted.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['price'], '100.00')
+        self.assertIn('Last-Modified', response)
+
+        repeat = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.content, b'')
+        self.assertEqual(repeat['ETag'], response['ETag'])
+        since = self.client.get(url, headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(since.status_code, 304)
+
+        # Other fields are a different representation
+        narrow = self.client.get(url, {'fields': 'id'}, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(narrow.status_code, 200)
+
+        self.accepted.status = 'ONGOING'
+        self.accepted.save()
+        changed = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['status'], 'ONGOING')
+
+    def test_events_change_with_the_timeline(self):
+        url = reverse('api-ride-events', args=[self.accepted.pk])
+        response = self.client.get(url)
+        self.assertEqual([event['description'] for event in response.json()['results']], ['Accepted'])
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+        RideEvent.objects.filter(ride=self.accepted).update(description='Accepted by the rider')
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+    def test_strangers_and_writes_are_refused(self):
+        self.client.force_login(self.stranger)
+        self.assertEqual(self.client.get(reverse('api-ride-list')).json()['results'], [])
+        self.assertEqual(self.client.get(reverse('api-ride-detail', args=[self.accepted.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api-ride-events', args=[self.accepted.pk])).status_code, 404)
+        self.assertEqual(self.client.post(reverse('api-ride-list')).status_code, 405)
+
+
+class BulkTransferTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = cls.create_user('rider', 'RIDER')
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+        cls.completed = cls.create_ride(cls.customer, cls.rider, status='COMPLETED', price=Decimal('150.50'))
+        cls.pending = cls.create_ride(cls.customer)
+        RideEvent.objects.create(ride=cls.completed, step=5, description='Paid, with "quotes", and a comma')
+        RideEvent.objects.create(ride=cls.pending, step=1, description='Requested')
+        # Timestamps must survive the round trip rather than be reset to now
+        Ride.objects.filter(pk=cls.completed.pk).update(created_at=timezone.now() - timezone.timedelta(days=30))
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def snapshot(self):
+        return (
+            list(Ride.objects.order_by('pk').values_list(*bulk.RIDE_COLUMNS)),
+            list(RideEvent.objects.order_by('pk').values_list(*bulk.EVENT_COLUMNS)),
+        )
+
+    def round_trip(self, rides, events):
+        before = self.snapshot()
+        call_command('export_rides', '--rides', rides, '--events', events, stderr=StringIO())
+        RideEvent.objects.all().delete()
+        Ride.objects.all().delete()
+        UserRideStats.objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_rides', '--rides', rides, '--events', events, '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(UserRideStats.for_user(self.rider).total_earnings, Decimal('150.50'))
+        call_command('rebuild_ride_stats', '--verify', stdout=StringIO())
+
+    def test_csv_round_trip(self):
+        self.round_trip(self.path('rides.csv'), self.path('events.csv.gz'))
+
+    def test_jsonl_round_trip(self):
+        self.round_trip(self.path('rides.jsonl'), self.path('events.jsonl'))
+
+    def test_filtered_export(self):
+        rides, events = self.path('rides.jsonl'), self.path('events.jsonl')
+        call_command('export_rides', '--rides', rides, '--events', events, '--status', 'PENDING', stderr=StringIO())
+        with open(rides) as f:
+            self.assertEqual([json.loads(line)['id'] for line in f], [self.pending.pk])
+        with open(events) as f:
+            self.assertEqual([json.loads(line)['ride_id'] for line in f], [self.pending.pk])
+
+    def test_import_stops_at_bad_rows(self):
+        rides = self.path('rides.csv')
+        call_command('export_rides', '--rides', rides, stderr=StringIO())
+        Ride.objects.all().delete()
+        self.customer.delete()
+        with self.assertRaisesMessage(CommandError, 'missing user(s)'):
+            call_command('import_rides', '--rides', rides, stdout=StringIO())
+        self.assertFalse(Ride.objects.exists())
+
+        with open(rides, 'w') as f:
+            f.write('id,status\n1,PENDING\n')
+        with self.assertRaisesMessage(CommandError, "Line 2: missing column 'customer_id'"):
+            call_command('import_rides', '--rides', rides, stdout=StringIO())
+
+    def test_archived_rides_are_exported_and_not_imported_twice(self):
+        archive.archive_finished_rides(before=timezone.now())
+        self.assertTrue(ArchivedRide.objects.filter(pk=self.completed.pk).exists())
+        rides, events = self.path('rides.jsonl'), self.path('events.jsonl')
+        call_command('export_rides', '--rides', rides, '--events', events, stderr=StringIO())
+        with open(rides) as f:
+            self.assertEqual([json.loads(line)['id'] for line in f], [self.completed.pk, self.pending.pk])
+        with open(events) as f:
+            self.assertEqual([json.loads(line)['ride_id'] for line in f], [self.completed.pk, self.pending.pk])
+
+        Ride.objects.filter(pk=self.pending.pk).delete()
+        with self.assertRaisesMessage(CommandError, f'1 ride(s) already in the archive: {self.completed.pk}'):
+            call_command('import_rides', '--rides', rides, '--skip-stats', stdout=StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_rides', '--rides', rides, '--events', events, '--ignore-conflicts', '--skip-stats',
+                         stdout=StringIO())
+        self.assertEqual(list(Ride.objects.values_list('pk', flat=True)), [self.pending.pk])
+        self.assertEqual(list(RideEvent.objects.values_list('ride_id', flat=True)), [self.pending.pk])
+        self.assertEqual(RideHistory.objects.count(), 2)
+
+
+class SyntheticDataTests(RideTestMixin, TestCase):
+    def test_generated_rides_have_consistent_trails(self):
+        riders, customers, staff = synthetic.generate(300, riders=4, customers=10, seed=7, batch_size=64)
+        self.assertEqual((len(riders), len(customers), len(staff)), (4, 10, 1))
+        self.assertEqual(Ride.objects.count(), 300)
+        self.assertEqual(set(Ride.objects.values_list('status', flat=True)), set(synthetic.TRAILS))
+        self.assertFalse(Ride.objects.filter(pickup=F('destination')).exists())
+
+        for ride in Ride.objects.prefetch_related('events'):
+            steps = tuple(event.step for event in sorted(ride.events.all(), key=lambda event: event.created_at))
+            self.assertIn(steps, (synthetic.TRAILS[ride.status], (1, 2, 6)))
+            self.assertEqual(ride.rider_id is not None, 2 in steps)
+            self.assertEqual(ride.updated_at, max(event.created_at for event in ride.events.all()))
+
+        # Topping up creates only the missing users
+        synthetic.generate(0, riders=4, customers=12)
+        self.assertEqual(CustomUser.objects.filter(user_role='CUSTOMER').count(), 12)
+        self.assertTrue(self.client.login(username='synthetic-staff-0', password='synthetic'))
+
+    def test_same_seed_same_rides(self):
+        columns = ('customer_id', 'rider_id', 'pickup', 'destination', 'price', 'status')
+        synthetic.generate(50, riders=3, customers=5, seed=1)
+        first = list(Ride.objects.order_by('pk').values_list(*columns))
+        Ride.objects.all().delete()
+        synthetic.generate(50, riders=3, customers=5, seed=1)
+        self.assertEqual(list(Ride.objects.order_by('pk').values_list(*columns)), first)
+
+    def test_generate_and_bench_commands(self):
+        call_command('generate_rides', '--rides', '40', '--riders', '3', '--customers', '5', stdout=StringIO())
+        call_command('rebuild_ride_stats', '--verify', stdout=StringIO())
+
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command(
+                'bench_views', '--scale', '60', '--repeat', '2', '--warmup', '0', '--riders', '3', '--customers', '5',
+                '--only', 'ride list', '--only', 'accept ride', '--output', output.name, '--host', 'testserver',
+                stderr=StringIO(),
+            )
+            report = json.load(output)
+        [scale] = report['scales']
+        self.assertEqual(scale['rides'], 60)
+        views = {view['name']: view for view in scale['views']}
+        self.assertEqual(views['ride list (customer)']['status'], 200)
+        self.assertGreater(views['ride list (customer)']['queries'], 0)
+        # POSTs are rolled back, so the pending ride stayed available for every repeat
+        accept = views['accept ride (JSON)']
+        self.assertTrue(accept.get('status') == 200 or 'skipped' in accept, accept)
+        self.assertEqual(Ride.objects.count(), 60)
+
+
+
+class RideArchiveTests(RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = cls.create_user('rider', 'RIDER')
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+        cls.staff = cls.create_user('staff', 'STAFF', is_staff=True)
+        long_ago = timezone.now() - timezone.timedelta(days=200)
+        cls.old_completed = cls.create_ride(cls.customer, cls.rider, status='COMPLETED')
+        cls.old_cancelled = cls.create_ride(cls.customer, status='CANCELLED')
+        cls.recent_completed = cls.create_ride(cls.customer, cls.rider, status='COMPLETED')
+        cls.old_pending = cls.create_ride(cls.customer)
+        for ride in (cls.old_completed, cls.old_cancelled, cls.recent_completed, cls.old_pending):
+            RideEvent.objects.create(ride=ride, step=1, description='Requested')
+        Ride.objects.filter(pk__in=[cls.old_completed.pk, cls.old_cancelled.pk, cls.old_pending.pk]).update(
+            created_at=long_ago, updated_at=long_ago,
+        )
+        # The backdating bypassed the stats' last_ride_at
+        call_command('rebuild_ride_stats', stdout=StringIO())
+
+    def test_moves_old_finished_rides_and_events(self):
+        self.assertEqual(archive.archive_finished_rides(batch_size=1), 2)
+
+        archived = {self.old_completed.pk, self.old_cancelled.pk}
+        self.assertEqual(set(ArchivedRide.objects.values_list('pk', flat=True)), archived)
+        self.assertEqual(set(ArchivedRideEvent.objects.values_list('ride_id', flat=True)), archived)
+        self.assertEqual(
+            set(Ride.objects.values_list('pk', flat=True)), {self.recent_completed.pk, self.old_pending.pk}
+        )
+        self.assertFalse(RideEvent.objects.filter(ride_id__in=archived).exists())
+
+        ride = ArchivedRide.objects.get(pk=self.old_completed.pk)
+        self.assertEqual((ride.status, ride.price, ride.rider_id), ('COMPLETED', Decimal('100.00'), self.rider.pk))
+        self.assertIsNotNone(ride.archived_at)
+        # Nothing left to move
+        self.assertEqual(archive.archive_finished_rides(), 0)
+
+    def test_history_still_shows_archived_rides(self):
+        archive.archive_finished_rides()
+        self.assertEqual(RideHistory.objects.count(), 4)
+        self.assertEqual(set(RideHistory.objects.filter(archived=True).values_list('pk', flat=True)),
+                         {self.old_completed.pk, self.old_cancelled.pk})
+        call_command('rebuild_ride_stats', '--verify', stdout=StringIO())
+
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('customer-history'))
+        self.assertEqual(len(response.context['rides']), 4)
+        response = self.client.get(reverse('ride-detail', args=[self.old_completed.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event.step for event in response.context['events']], [1])
+        response = self.client.get(reverse('api-ride-events', args=[self.old_completed.pk]))
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_rides', '--dry-run', stdout=out)
+        self.assertIn('2 ride(s)', out.getvalue())
+        self.assertFalse(ArchivedRide.objects.exists())
+
+        call_command('archive_rides', '--older-than-days', '0', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(ArchivedRide.objects.count(), 3)
+        self.assertEqual(list(Ride.objects.values_list('pk', flat=True)), [self.old_pending.pk])
+        with self.assertRaises(CommandError):
+            call_command('archive_rides', '--batch-size', '0')
+
+
+class AsyncRideViewTests(AsyncViewMixin, RideTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = cls.create_user('rider', 'RIDER')
+        cls.customer = cls.create_user('customer', 'CUSTOMER')
+        cls.stranger = cls.create_user('stranger', 'CUSTOMER')
+        cls.active = cls.create_ride(cls.customer, cls.rider, status='ACCEPTED', pickup='FONTANA')
+        RideEvent.objects.create(ride=cls.active, step=2, description='Accepted by the rider')
+        cls.pending = cls.create_ride(cls.customer, pickup='AQUA_PLANET')
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_ride_list(self):
+        response = await self.call(async_views.ride_list, self.customer)
+        self.assertContains(response, reverse('ride-detail', args=[self.active.pk]))
+        self.assertContains(response, reverse('ride-detail', args=[self.pending.pk]))
+        response = await self.call(async_views.ride_list, self.stranger)
+        self.assertNotContains(response, reverse('ride-detail', args=[self.active.pk]))
+
+    async def test_ride_list_pages(self):
+        with mock.patch.object(views.RideListView, 'paginate_by', 1):
+            first = await self.call(async_views.ride_list, self.customer)
+            self.assertContains(first, 'cursor=')
+            cursor = re.search(r'cursor=([\w-]+)', first.content.decode()).group(1)
+            second = await self.call(async_views.ride_list, self.customer, {'cursor': cursor})
+        self.assertContains(second, reverse('ride-detail', args=[self.active.pk]))
+        with self.assertRaises(Http404):
+            await self.call(async_views.ride_list, self.customer, {'cursor': 'nope'})
+
+    async def test_ride_detail(self):
+        response = await self.call(async_views.ride_detail, self.customer, pk=self.active.pk)
+        self.assertContains(response, 'Accepted by the rider')
+        with self.assertRaises(Http404):
+            await self.call(async_views.ride_detail, self.stranger, pk=self.active.pk)
+
+    async def test_rider_dashboard(self):
+        response = await self.call(async_views.rider_dashboard, self.rider)
+        self.assertContains(response, 'Aqua Planet')
+        self.assertContains(response, 'Fontana Leisure Park')
+        with self.assertRaises(PermissionDenied):
+            await self.call(async_views.rider_dashboard, self.customer)
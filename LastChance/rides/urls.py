@@ -1,18 +1,38 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, views
+
+# Under ASGI the read-heavy pages are served by their async versions
+if settings.ASYNC_VIEWS:
+    ride_list = async_views.ride_list
+    ride_detail = async_views.ride_detail
+    rider_dashboard = async_views.rider_dashboard
+else:
+    ride_list = views.RideListView.as_view()
+    ride_detail = views.RideDetailView.as_view()
+    rider_dashboard = views.RiderDashboardView.as_view()
 
 urlpatterns = [
     # Existing URL patterns...
     path('book/', views.CustomerBookRideView.as_view(), name='create-ride'),
-    path('rides/active/', views.RideListView.as_view(), name='customer-active-rides'),
-    path('rides/history/', views.RideListView.as_view(), name='customer-history'),
-    path('rides/<int:pk>/', views.RideDetailView.as_view(), name='ride-detail'),
+    path('rides/', ride_list, name='ride-list'),
+    path('rides/active/', ride_list, name='customer-active-rides'),
+    path('rides/history/', ride_list, name='customer-history'),
+    path('rides/<int:pk>/', ride_detail, name='ride-detail'),
     path('rides/<int:pk>/edit/', views.EditPendingRideView.as_view(), name='ride-edit'),
     path('rides/<int:pk>/delete/', views.DeleteRideView.as_view(), name='ride-delete'),
     path('rides/<int:pk>/update-status/', views.update_ride_status, name='update-ride-status'),
     path('history/', views.CustomerRideHistoryView.as_view(), name='customer-history'),
-    path('rider/dashboard/', views.RiderDashboardView.as_view(), name='rider-dashboard'),
+    path('rider/dashboard/', rider_dashboard, name='rider-dashboard'),
+    path('rider/available/', rider_dashboard, name='rider-available-rides'),
+    path('rider/active/', ride_list, name='rider-active-rides'),
     path('rider/history/', views.RiderRideHistoryView.as_view(), name='rider-history'),
     path('rides/<int:pk>/accept/', views.accept_ride, name='accept-ride'),
+    path('api/rides/', api.ride_list, name='api-ride-list'),
+    path('api/rides/<int:pk>/', api.ride_detail, name='api-ride-detail'),
+    path('api/rides/<int:pk>/events/', api.ride_events, name='api-ride-events'),
+    path('api/rides/<int:pk>/accept/', views.accept_ride_api, name='api-accept-ride'),
     path('rides/<int:pk>/drop/', views.drop_ride, name='drop-ride'),
+    path('rides/<int:pk>/stream/', views.ride_event_stream, name='ride-event-stream'),
+    path('rider/available/stream/', views.pending_ride_stream, name='pending-ride-stream'),
 ]
@@ -1,14 +1,23 @@
+import json
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.db.models import Q
-from django.http import JsonResponse
-from .models import Ride, RideEvent
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse, Http404
+from django.db import transaction
+from .models import Ride, RideEvent, RideHistory, UserRideStats
 from .forms import RideForm, RideEventForm
+from .pagination import CursorPaginationMixin
+from .feed import get_pending_page, invalidate_pending_feed
+from .services import try_accept_ride
+from . import routing, state_machine, streams
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
+from payments.services import InsufficientBalance
 
 class CreateRideView(LoginRequiredMixin, CreateView):
     model = Ride
@@ -18,35 +27,24 @@ class CreateRideView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.customer = self.request.user
-        response = super().form_valid(form)
-        # Create initial ride event
-        RideEvent.objects.create(
-            ride=self.object,
-            step=1,  # Ride Requested
-            description=f"Ride requested by {self.request.user.get_full_name()}"
+        form.instance.total_distance, form.instance.price = routing.quote(
+            form.cleaned_data['pickup'], form.cleaned_data['destination']
         )
+        self.object = form.instance
+        state_machine.request_ride(self.object, f"Ride requested by {self.request.user.get_full_name()}")
         messages.success(self.request, 'Ride request created successfully!')
-        return response
+        return HttpResponseRedirect(self.get_success_url())
 
-class RideListView(LoginRequiredMixin, ListView):
-    model = Ride
+class RideListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
+    # Live and archived rides alike (see rides/archive.py)
+    model = RideHistory
     template_name = 'rides/ride_list.html'
     context_object_name = 'rides'
     paginate_by = 10
     ordering = ['-created_at']
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        user = self.request.user
-
-        # Filter based on user role
-        if user.user_role == 'RIDER':
-            return queryset.filter(rider=user)
-        elif user.user_role == 'CUSTOMER':
-            return queryset.filter(customer=user)
-        elif user.is_staff:
-            return queryset
-        return Ride.objects.none()
+        return super().get_queryset().for_list().visible_to(self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -54,22 +52,18 @@ class RideListView(LoginRequiredMixin, ListView):
         return context
 
 class RideDetailView(LoginRequiredMixin, DetailView):
-    model = Ride
+    model = RideHistory
     template_name = 'rides/ride_detail.html'
     context_object_name = 'ride'
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        user = self.request.user
-
         # Allow access if user is the rider, customer, or staff
-        if user.is_staff:
-            return queryset
-        return queryset.filter(Q(rider=user) | Q(customer=user))
+        return super().get_queryset().with_parties().involving(self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['events'] = self.object.events.all().order_by('created_at')
+        context['live_updates'] = streams.enabled()
         return context
 
 class UpdateRideView(LoginRequiredMixin, UpdateView):
@@ -110,36 +104,55 @@ class DeleteRideView(LoginRequiredMixin, DeleteView):
             raise PermissionError("You don't have permission to delete this ride.")
         return obj
 
-    def delete(self, request, *args, **kwargs):
+    def form_valid(self, form):
+        ride_id = self.object.pk
+        # Delete first: in autocommit these fire at once, and a rider could re-cache the feed with the ride on it
+        response = super().form_valid(form)
+        invalidate_pending_feed()
+        streams.publish_pending_removed(ride_id)
         messages.success(self.request, 'Ride deleted successfully!')
-        return super().delete(request, *args, **kwargs)
+        return response
 
 # Additional utility views for ride status updates
 @login_required
 def accept_ride(request, pk):
-    ride = get_object_or_404(Ride, pk=pk)
     if request.user.user_role != 'RIDER':
         messages.error(request, "Only riders can accept rides.")
         return redirect('ride-detail', pk=pk)
 
-    if ride.status != 'PENDING':
+    if try_accept_ride(pk, request.user) is None:
+        get_object_or_404(Ride, pk=pk)
+        # Another rider got there first; the ride is no longer visible to this one
         messages.error(request, "This ride cannot be accepted.")
-        return redirect('ride-detail', pk=pk)
-
-    ride.rider = request.user
-    ride.status = 'ACCEPTED'
-    ride.save()
-
-    # Create ride accepted event
-    RideEvent.objects.create(
-        ride=ride,
-        step=2,  # Rider Accepted
-        description=f"Ride accepted by {request.user.get_full_name()}"
-    )
+        return redirect('rider-dashboard')
 
     messages.success(request, 'Ride accepted successfully!')
     return redirect('ride-detail', pk=pk)
 
+@login_required
+@require_POST
+def accept_ride_api(request, pk):
+    """JSON variant of accept_ride for mobile clients; 409 means another rider got there first"""
+    if request.user.user_role != 'RIDER':
+        return JsonResponse({'error': 'Only riders can accept rides.'}, status=403)
+
+    ride = try_accept_ride(pk, request.user)
+    if ride is None:
+        get_object_or_404(Ride, pk=pk)
+        return JsonResponse({'accepted': False, 'error': 'This ride cannot be accepted.'}, status=409)
+
+    return JsonResponse({
+        'accepted': True,
+        'ride': {
+            'id': ride.pk,
+            'status': ride.status,
+            'pickup': ride.pickup,
+            'destination': ride.destination,
+            'price': str(ride.price),
+            'customer': ride.customer.get_full_name(),
+        }
+    })
+
 class RideEventDetailView(LoginRequiredMixin, DetailView):
     model = RideEvent
     template_name = 'rides/ride_event_detail.html'
@@ -195,45 +208,66 @@ class DeleteRideEventView(LoginRequiredMixin, DeleteView):
         messages.success(self.request, 'Ride event deleted successfully!')
         return super().delete(request, *args, **kwargs)
 
-class CustomerBookRideView(LoginRequiredMixin, CreateView):
-    model = Ride
-    template_name = 'rides/book_ride.html'
-    fields = ['pickup', 'destination', 'price']
+class QuotedFareMixin:
+    """
+    Fills in ``total_distance`` from the landmark matrix and defaults the
+    price to the suggested fare when the customer leaves it blank.
+    """
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        form.fields['price'].required = False
+        return form
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['locations'] = Ride.LOCATION_CHOICES
+        context['fare_table'] = routing.fare_table()
+        context['minimum_fare'] = routing.get_tariff().minimum_fare
         return context
 
+    def apply_quote(self, form):
+        """Set distance and price on the instance; returns an error message or None"""
+        distance, fare = routing.quote(form.cleaned_data['pickup'], form.cleaned_data['destination'])
+        price = form.cleaned_data['price']
+        if price is None:
+            price = fare
+
+        minimum_fare = routing.get_tariff().minimum_fare
+        if price < minimum_fare:
+            return f'Minimum price is ₱{minimum_fare:.0f}.'
+
+        form.instance.total_distance = distance
+        form.instance.price = price
+        return None
+
+class CustomerBookRideView(LoginRequiredMixin, QuotedFareMixin, CreateView):
+    model = Ride
+    template_name = 'rides/book_ride.html'
+    fields = ['pickup', 'destination', 'price']
+
     def form_valid(self, form):
         if form.cleaned_data['pickup'] == form.cleaned_data['destination']:
             messages.error(self.request, 'Pickup and destination cannot be the same location.')
             return self.form_invalid(form)
 
-        if form.cleaned_data['price'] < 50:
-            messages.error(self.request, 'Minimum price is ₱50.')
+        error = self.apply_quote(form)
+        if error:
+            messages.error(self.request, error)
             return self.form_invalid(form)
 
         # Set the customer to current user
         form.instance.customer = self.request.user
-        form.instance.status = 'PENDING'
-
-        response = super().form_valid(form)
-
-        # Create initial ride event
-        RideEvent.objects.create(
-            ride=self.object,
-            step=1,  # Ride Requested
-            description=f"Ride requested by {self.request.user.get_full_name()}"
-        )
+        self.object = form.instance
+        state_machine.request_ride(self.object, f"Ride requested by {self.request.user.get_full_name()}")
 
         messages.success(self.request, 'Ride request created successfully!')
-        return response
+        return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self):
         return reverse_lazy('customer-active-rides')
 
-class EditPendingRideView(LoginRequiredMixin, UpdateView):
+class EditPendingRideView(LoginRequiredMixin, QuotedFareMixin, UpdateView):
     model = Ride
     template_name = 'rides/edit_ride.html'
     fields = ['pickup', 'destination', 'price']
@@ -250,90 +284,87 @@ class EditPendingRideView(LoginRequiredMixin, UpdateView):
             messages.error(self.request, 'Pickup and destination cannot be the same location.')
             return self.form_invalid(form)
 
-        if form.cleaned_data['price'] < 50:
-            messages.error(self.request, 'Minimum price is ₱50.')
+        error = self.apply_quote(form)
+        if error:
+            messages.error(self.request, error)
             return self.form_invalid(form)
 
-        response = super().form_valid(form)
-
-        # Create edit event
-        RideEvent.objects.create(
-            ride=self.object,
-            step=1,
-            description=f"Ride details updated by {self.request.user.get_full_name()}"
-        )
+        # Written only while the ride is still open, in the same UPDATE as the edit event's transition
+        ride = form.instance
+        try:
+            state_machine.apply(
+                ride,
+                state_machine.EDIT,
+                f"Ride details updated by {self.request.user.get_full_name()}",
+                **{name: getattr(ride, name) for name in ('pickup', 'destination', 'total_distance', 'price')}
+            )
+        except state_machine.IllegalTransition:
+            messages.error(self.request, 'This ride has already been accepted and can no longer be edited.')
+            return redirect('ride-detail', pk=ride.pk)
 
         messages.success(self.request, 'Ride details updated successfully!')
-        return response
+        return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self):
         return reverse_lazy('ride-detail', kwargs={'pk': self.object.pk})
 
+def _requested_status(request):
+    """The target status, from a form post or the ride page's JSON body"""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body).get('status')
+        except (ValueError, AttributeError):
+            return None
+    return request.POST.get('status')
+
 @login_required
+@require_POST
+@transaction.atomic
 def update_ride_status(request, pk):
-    ride = get_object_or_404(Ride, pk=pk)
+    ride = get_object_or_404(Ride.objects.select_related('customer', 'rider'), pk=pk)
 
     # Verify permissions
     if not (request.user.is_staff or request.user == ride.rider):
         return JsonResponse({'error': 'Permission denied'}, status=403)
 
-    new_status = request.POST.get('status')
+    new_status = _requested_status(request)
     if new_status not in dict(Ride.STATUS_CHOICES):
         return JsonResponse({'error': 'Invalid status'}, status=400)
 
-    # Handle balance transfer for completed rides
-    if new_status == 'COMPLETED':
-        customer = ride.customer
-        rider = ride.rider
-        price = ride.price
-
-        # Check if customer has sufficient balance
-        if customer.balance < price:
-            return JsonResponse({
-                'error': 'Customer has insufficient balance for this ride.'
-            }, status=400)
-
-        # Transfer balance from customer to rider
-        customer.balance -= price
-        rider.balance += price
-
-        # Save both users
-        customer.save()
-        rider.save()
-
-        # Add transfer event
-        RideEvent.objects.create(
-            ride=ride,
-            step=5,
-            description=f"Payment of ₱{price} transferred from {customer.get_full_name()} to {rider.get_full_name()}"
-        )
-
-    # Map status to step number
-    status_to_step = {
-        'ACCEPTED': 2,
-        'ONGOING': 3,
-        'COMPLETED': 5,
-        'CANCELLED': 6
-    }
-
-    step = status_to_step.get(new_status, 1)
-
-    # Update ride status
-    ride.status = new_status
-    ride.save()
-
-    # Create event for status change
-    event = RideEvent.objects.create(
-        ride=ride,
-        step=step,
-        description=f"Ride status updated to {ride.get_status_display()} by {request.user.get_full_name()}"
-    )
+    if new_status == 'COMPLETED' and ride.status == 'COMPLETED':
+        return JsonResponse({'error': 'This ride has already been completed.'}, status=400)
+    if new_status == 'COMPLETED' and ride.rider_id is None:
+        return JsonResponse({'error': 'This ride has no rider to pay.'}, status=400)
+
+    transition = state_machine.transition_to(new_status, ride.status)
+    if transition is None or transition in (state_machine.EDIT, state_machine.ACCEPT):
+        # Accepting assigns a rider, which goes through accept_ride
+        return JsonResponse({
+            'error': f'A {ride.get_status_display().lower()} ride cannot be moved to {new_status.lower()}.'
+        }, status=400)
+
+    balances = {}
+    try:
+        if transition is state_machine.COMPLETE:
+            event, balances = state_machine.complete(ride, request.user)
+        else:
+            event = state_machine.apply(
+                ride, transition,
+                f"Ride status updated to {dict(Ride.STATUS_CHOICES)[new_status]} by {request.user.get_full_name()}"
+            )
+    except InsufficientBalance:
+        return JsonResponse({
+            'error': 'Customer has insufficient balance for this ride.'
+        }, status=400)
+    except state_machine.IllegalTransition:
+        # Another request moved the ride first
+        return JsonResponse({'error': 'This ride has changed; reload and try again.'}, status=409)
 
     return JsonResponse({
         'status': 'success',
         'new_status': ride.get_status_display(),
-        'customer_balance': customer.balance if new_status == 'COMPLETED' else None,
-        'rider_balance': rider.balance if new_status == 'COMPLETED' else None,
+        'customer_balance': balances.get(ride.customer_id),
+        'rider_balance': balances.get(ride.rider_id),
         'event': {
             'step': event.get_step_display(),
             'description': event.description,
@@ -341,31 +372,70 @@ def update_ride_status(request, pk):
         }
     })
 
-class CustomerRideHistoryView(LoginRequiredMixin, ListView):
-    model = Ride
+def _sse_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+@login_required
+async def ride_event_stream(request, pk):
+    """SSE stream of a ride's timeline for its customer, its rider and staff"""
+    if not streams.enabled():
+        return HttpResponse(status=204)
+    user = await request.auser()
+    ride = await Ride.objects.filter(pk=pk).only('id', 'customer_id', 'rider_id').afirst()
+    if ride is None:
+        raise Http404('No ride found.')
+    if not (user.is_staff or user.pk in (ride.customer_id, ride.rider_id)):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
+    last_event_id = request.headers.get('Last-Event-ID', '')
+
+    async def backlog():
+        if not last_event_id.isdigit():
+            return
+        missed = RideEvent.objects.filter(ride_id=pk, pk__gt=int(last_event_id)).select_related('ride')
+        async for event in missed.order_by('pk'):
+            yield streams.Message('ride-event', event.pk, streams.ride_event_payload(event))
+
+    return _sse_response(streams.event_stream(streams.ride_channel(pk), backlog))
+
+@login_required
+async def pending_ride_stream(request):
+    """SSE stream of rides entering and leaving the riders' available-rides feed"""
+    if not streams.enabled():
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if user.user_role != 'RIDER':
+        return JsonResponse({'error': 'Only riders can follow available rides.'}, status=403)
+    return _sse_response(streams.event_stream(streams.PENDING_CHANNEL))
+
+class CustomerRideHistoryView(LoginRequiredMixin, CursorPaginationMixin, ListView):
+    model = RideHistory
     template_name = 'rides/customer_ride_history.html'
     context_object_name = 'rides'
     paginate_by = 10
 
     def get_queryset(self):
-        return Ride.objects.filter(
+        return RideHistory.objects.for_list().filter(
             customer=self.request.user
         ).order_by('-created_at')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['completed_rides'] = self.get_queryset().filter(status='COMPLETED').count()
-        context['cancelled_rides'] = self.get_queryset().filter(status='CANCELLED').count()
-        context['total_spent'] = self.get_queryset().filter(status='COMPLETED').aggregate(
-            total=models.Sum('price')
-        )['total'] or 0
+        stats = UserRideStats.for_user(self.request.user)
+        context['total_rides'] = stats.rides_as_customer
+        context['completed_rides'] = stats.completed_as_customer
+        context['cancelled_rides'] = stats.cancelled_as_customer
+        context['total_spent'] = stats.total_spent
         return context
 
 class RiderRequiredMixin(UserPassesTestMixin):
     def test_func(self):
         return self.request.user.user_role == 'RIDER'
 
-class RiderDashboardView(LoginRequiredMixin, RiderRequiredMixin, ListView):
+class RiderDashboardView(LoginRequiredMixin, RiderRequiredMixin, CursorPaginationMixin, ListView):
     model = Ride
     template_name = 'rides/rider_dashboard.html'
     context_object_name = 'available_rides'
@@ -373,53 +443,51 @@ class RiderDashboardView(LoginRequiredMixin, RiderRequiredMixin, ListView):
 
     def get_queryset(self):
         # Get all pending rides that don't have a rider assigned
-        return Ride.objects.filter(
+        return Ride.objects.for_list().filter(
             status='PENDING',
             rider__isnull=True
         ).order_by('-created_at')
 
+    def get_cursor_page(self, paginator, cursor):
+        # The open-ride feed is identical for every rider, so share it through the cache
+        return get_pending_page(paginator, cursor)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Add active rides (accepted or ongoing)
-        context['active_rides'] = Ride.objects.filter(
+        context['active_rides'] = Ride.objects.for_list().filter(
             rider=self.request.user,
             status__in=['ACCEPTED', 'ONGOING']
         ).order_by('-created_at')
 
         # Add statistics
-        context['total_completed'] = Ride.objects.filter(
-            rider=self.request.user,
-            status='COMPLETED'
-        ).count()
-        context['total_earnings'] = Ride.objects.filter(
-            rider=self.request.user,
-            status='COMPLETED'
-        ).aggregate(total=models.Sum('price'))['total'] or 0
+        stats = UserRideStats.for_user(self.request.user)
+        context['total_completed'] = stats.completed_as_rider
+        context['total_earnings'] = stats.total_earnings
+        context['live_updates'] = streams.enabled()
 
         return context
 
-class RiderRideHistoryView(LoginRequiredMixin, RiderRequiredMixin, ListView):
-    model = Ride
+class RiderRideHistoryView(LoginRequiredMixin, RiderRequiredMixin, CursorPaginationMixin, ListView):
+    model = RideHistory
     template_name = 'rides/rider_history.html'
     context_object_name = 'rides'
     paginate_by = 10
 
     def get_queryset(self):
-        return Ride.objects.filter(
+        return RideHistory.objects.for_list().filter(
             rider=self.request.user
         ).order_by('-created_at')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Calculate statistics
-        context['completed_rides'] = self.get_queryset().filter(status='COMPLETED').count()
-        context['cancelled_rides'] = self.get_queryset().filter(status='CANCELLED').count()
-        context['total_earnings'] = self.get_queryset().filter(
-            status='COMPLETED'
-        ).aggregate(total=models.Sum('price'))['total'] or 0
-        context['total_distance'] = self.get_queryset().filter(
-            status='COMPLETED'
-        ).aggregate(total=models.Sum('total_distance'))['total'] or 0
+        stats = UserRideStats.for_user(self.request.user)
+        context['total_rides'] = stats.rides_as_rider
+        context['completed_rides'] = stats.completed_as_rider
+        context['cancelled_rides'] = stats.cancelled_as_rider
+        context['total_earnings'] = stats.total_earnings
+        context['total_distance'] = stats.total_distance
         return context
 
 @login_required
@@ -436,17 +504,15 @@ def drop_ride(request, pk):
         messages.error(request, "This ride cannot be dropped at this stage.")
         return redirect('ride-detail', pk=pk)
 
-    # Update ride status and create event
-    ride.status = 'CANCELLED'
-    ride.save()
-
-    # Create event with appropriate message
+    # Cancel the ride and record who dropped it
     dropper_type = 'rider' if request.user == ride.rider else 'customer'
-    RideEvent.objects.create(
-        ride=ride,
-        step=6,  # Cancelled
-        description=f"Ride dropped by {dropper_type} {request.user.get_full_name()}"
-    )
+    try:
+        state_machine.apply(
+            ride, state_machine.CANCEL, f"Ride dropped by {dropper_type} {request.user.get_full_name()}"
+        )
+    except state_machine.IllegalTransition:
+        messages.error(request, "This ride cannot be dropped at this stage.")
+        return redirect('ride-detail', pk=pk)
 
     messages.warning(request, 'Ride has been dropped.')
 